@@ -0,0 +1,166 @@
+"""Synthetic data sets with the schema of data/dataset.csv, for benchmarks at sizes the original data does not have.
+
+Rows have the 15 columns read by Loader.load_data, with the same kind of contents: raw class ratings (about 1% true
+after reduce_class_to_binary, and about 1% of ambiguous ratings), long-tailed fact-checker, source, country and
+language distributions, sparse country2-4 and category columns, snopes titles giving away the rating (with a clean
+source_title), dates in the first months of 2020, content texts, and about 1% of duplicated rows. Sizes are multiples of
+the 6,902 rows of the original data set.
+
+    python benchmarks/generate_data.py [--scale 1 10 100] [--output-folder data/synthetic] [--seed 0]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+from pandas import DataFrame, Timestamp, concat, to_timedelta
+
+root_folder = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root_folder))
+
+from src.loader import col_names  # noqa: E402
+
+original_rows = 6902
+
+# Raw class ratings and their frequencies (false-like, true-like and ambiguous ratings, see Loader.reduce_class_to_binary).
+ratings = {'false': 0.55, 'misleading': 0.17, 'mostly false': 0.05, 'partly false': 0.04, 'pants on fire': 0.03,
+           'fake': 0.025, 'no evidence': 0.02, 'partially false': 0.015, 'misinformation / conspiracy theory': 0.015,
+           'two pinocchios': 0.01, 'labeled satire': 0.01, 'scam': 0.01, 'fake news': 0.005, 'not true': 0.005,
+           'mostly true': 0.004, 'true': 0.003, 'half true': 0.002, 'correct': 0.001,
+           'unproven': 0.005, 'explanatory': 0.004, 'unverified': 0.0025, 'unlikely': 0.001}
+true_ratings = {'mostly true', 'true', 'half true', 'correct'}
+
+fact_checkers = ['poynter', 'afp', 'politifact', 'snopes', 'factcheck.org', 'boom', 'maldita.es', 'newtral',
+                 'full fact', 'pesacheck', 'africa check', 'lead stories', 'vishvas news', 'aos fatos', 'agência lupa',
+                 'colombiacheck', 'chequeado', 'les décodeurs', 'correctiv', 'facta', 'teyit', 'factly',
+                 'newsmobile', 'india today', 'rappler', 'vera files', 'tempo', 'mafindo', 'myth detector',
+                 'stopfake', 'ellinika hoaxes', 'demagog', 'faktograf', 'mala', 'usa today', 'reuters',
+                 'washington post', 'check your fact', 'health feedback', 'science feedback']
+sources = ['facebook', 'twitter', 'whatsapp', 'youtube', 'instagram', 'website', 'tiktok', 'news outlet', 'blog',
+           'multiple sources', 'telegram', 'email', 'sms', 'politician', 'television', 'radio', 'reddit', 'pinterest']
+countries = ['united states', 'india', 'spain', 'brazil', 'france', 'italy', 'colombia', 'argentina', 'philippines',
+             'united kingdom', 'turkey', 'indonesia', 'germany', 'mexico', 'peru', 'nigeria', 'kenya', 'south africa',
+             'pakistan', 'china', 'portugal', 'poland', 'greece', 'ukraine', 'georgia', 'bolivia', 'venezuela',
+             'chile', 'ecuador', 'canada', 'australia', 'russia', 'iran', 'egypt', 'ghana', 'ethiopia', 'japan',
+             'south korea', 'malaysia', 'thailand', 'bangladesh', 'sri lanka', 'nepal', 'croatia', 'serbia']
+languages = ['en', 'es', 'fr', 'pt', 'hi', 'it', 'de', 'tr', 'id', 'pl', 'el', 'ka', 'uk', 'ru', 'bn', 'ar']
+categories = ['treatment', 'spread', 'prevention', 'origin', 'government', 'vaccine', 'symptoms', 'economy']
+words = ['coronavirus', 'covid-19', 'virus', 'vaccine', 'mask', 'masks', 'lockdown', 'quarantine', 'cure', 'garlic',
+         'water', 'hot', 'drinking', 'kills', 'spread', 'china', 'wuhan', 'bill', 'gates', '5g', 'towers', 'government',
+         'hospital', 'doctors', 'patients', 'deaths', 'died', 'cases', 'test', 'tests', 'positive', 'president',
+         'minister', 'police', 'army', 'streets', 'video', 'photo', 'shows', 'claims', 'says', 'people', 'city',
+         'country', 'week', 'days', 'new', 'first', 'man', 'woman', 'children', 'school', 'closed', 'shops', 'food',
+         'alcohol', 'vitamin', 'c', 'lemon', 'ginger', 'tea', 'sun', 'heat', 'bat', 'soup', 'lab', 'created', 'patent',
+         'emergency', 'curfew', 'helicopters', 'spraying', 'disinfectant', 'chloroquine', 'remedy', 'immune', 'flu',
+         'pandemic', 'outbreak', 'infected', 'recovered', 'trump', 'who', 'warns', 'message', 'whatsapp', 'forward',
+         'fake', 'news', 'official', 'announcement', 'free', 'internet', 'money', 'banks', 'notes', 'pets', 'dogs',
+         'cats', 'mosquitoes', 'sanitizer', 'gloves', 'ventilators', 'nurses', 'italy', 'spain', 'india', 'brazil']
+# Words more frequent in true articles (the titles give a weak signal about the class, as in the original data).
+true_words = ['official', 'announcement', 'cases', 'tests', 'closed', 'curfew', 'emergency', 'minister']
+stop_words = ['the', 'a', 'of', 'in', 'to', 'is', 'and', 'for', 'on', 'with', 'this', 'that', 'from', 'will', 'by']
+
+
+def zipf_weights(n: int, exponent: float = 1.1) -> np.ndarray:
+    # Long-tailed frequencies of n categories (most frequent first).
+    weights = 1 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def make_texts(rng: np.random.Generator, n_rows: int, min_words: int, max_words: int, signal: np.ndarray,
+               block_size: int = 10000) -> list:
+    # Texts of min_words to max_words words (long-tailed vocabulary, with stop words and numbers), with some of the
+    # words of rows where signal is set drawn from true_words. Generated block_size rows at a time, to bound memory.
+    vocabulary = np.array(words + stop_words + ['2020', '10', '100', '1', '15', '24'], dtype=object)
+    weights = zipf_weights(len(vocabulary), 0.8)
+    texts = []
+    for start in range(0, n_rows, block_size):
+        n_block = min(block_size, n_rows - start)
+        n_words = rng.integers(min_words, max_words + 1, n_block)
+        tokens = rng.choice(vocabulary, (n_block, max_words), p=weights)
+        signal_tokens = rng.choice(np.array(true_words, dtype=object), (n_block, max_words))
+        use_signal = signal[start:start + n_block, None] & (rng.random((n_block, max_words)) < 0.3)
+        tokens = np.where(use_signal, signal_tokens, tokens)
+        texts.extend(' '.join(row[:n]) for row, n in zip(tokens, n_words))
+    return texts
+
+
+def make_dataset(n_rows: int, seed: int = 0, content_words: int = 120) -> DataFrame:
+    # Raw data set with n_rows rows (including about 1% of duplicated rows), with the columns of dataset.csv.
+    rng = np.random.default_rng(seed)
+    n_unique = n_rows - n_rows // 100
+
+    rating_names = np.array(list(ratings), dtype=object)
+    rating_weights = np.array(list(ratings.values()))
+    rating = rng.choice(rating_names, n_unique, p=rating_weights / rating_weights.sum())
+    is_true = np.isin(rating, list(true_ratings))
+
+    verifiedby = rng.choice(np.array(fact_checkers, dtype=object), n_unique, p=zipf_weights(len(fact_checkers)))
+    lang = rng.choice(np.array(languages, dtype=object), n_unique, p=zipf_weights(len(languages), 1.6))
+    country_names = np.array(countries, dtype=object)
+    country_weights = zipf_weights(len(countries))
+    country1 = rng.choice(country_names, n_unique, p=country_weights)
+    # country2-4 are sparse, and only set when the previous one is.
+    n_countries = rng.choice([1, 2, 3, 4], n_unique, p=[0.8, 0.12, 0.05, 0.03])
+    other_countries = [np.where(n_countries > i, rng.choice(country_names, n_unique, p=country_weights), None)
+                       for i in range(1, 4)]
+
+    # Dates from January to May 2020, most of them in March and April.
+    days = np.clip(rng.normal(85, 25, n_unique), 0, 150).astype(int)
+    published_date = (Timestamp('2020-01-01') + to_timedelta(days, unit='D')).strftime('%Y-%m-%d')
+
+    titles = make_texts(rng, n_unique, 4, 16, is_true)
+    source_titles = make_texts(rng, n_unique, 4, 16, is_true)
+    is_snopes = verifiedby == 'snopes'
+    # Snopes titles give away the rating (see Processor.replace_snopes_titles).
+    titles = [rating_name.capitalize() + ': ' + source_title if snopes else title
+              for title, source_title, rating_name, snopes in zip(titles, source_titles, rating, is_snopes)]
+    has_source_title = is_snopes | (rng.random(n_unique) < 0.3)
+    content = make_texts(rng, n_unique, content_words // 4, content_words, is_true) if content_words else None
+
+    df = DataFrame({'verifiedby': verifiedby,
+                    'country': np.where(rng.random(n_unique) < 0.9, country1, None),
+                    'class': rating,
+                    'title': titles,
+                    'published_date': published_date,
+                    'country1': country1,
+                    'country2': other_countries[0],
+                    'country3': other_countries[1],
+                    'country4': other_countries[2],
+                    'article_source': ['https://' + v.replace(' ', '') + '.example/' + str(i)
+                                       for i, v in enumerate(verifiedby)],
+                    'ref_source': rng.choice(np.array(sources + [None], dtype=object), n_unique,
+                                             p=zipf_weights(len(sources) + 1)),
+                    'source_title': np.where(has_source_title, source_titles, None),
+                    'content_text': content,
+                    'category': np.where(rng.random(n_unique) < 0.05,
+                                         rng.choice(np.array(categories, dtype=object), n_unique), None),
+                    'lang': lang})
+
+    # A few rows have no rating, and about 1% of the rows are duplicates (as in the original export).
+    df.loc[rng.random(n_unique) < 0.001, 'class'] = None
+    duplicates = df.iloc[rng.choice(n_unique, n_rows - n_unique, replace=False)]
+    df = concat([df, duplicates])
+    return df.iloc[rng.permutation(n_rows)][col_names].reset_index(drop=True)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic data sets with the schema of dataset.csv.')
+    parser.add_argument('--scale', type=float, nargs='+', default=[1, 10, 100],
+                        help='sizes, as multiples of the 6,902 rows of the original data set.')
+    parser.add_argument('--output-folder', default=str(root_folder / 'data' / 'synthetic'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--content-words', type=int, default=120,
+                        help='maximum number of words of content_text (0 leaves it empty).')
+    args = parser.parse_args(args)
+
+    output_folder = Path(args.output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    for scale in args.scale:
+        n_rows = int(round(scale * original_rows))
+        filepath = output_folder / 'dataset_x{:g}.csv'.format(scale)
+        make_dataset(n_rows, seed=args.seed, content_words=args.content_words).to_csv(filepath, index=False)
+        print('Wrote', n_rows, 'rows to', filepath)
+
+
+if __name__ == '__main__':
+    main()
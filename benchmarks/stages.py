@@ -0,0 +1,189 @@
+"""Time and memory of each stage of the workflow on a data set, saved per commit so runs can be compared.
+
+Stages, in order: load (Loader.load_data), reduce_class (reduce_class_to_binary and clean_data), preprocess_title,
+categorical (category lumping, plus the date and region variables), model_builder (ModelBuilder construction) and
+benchmark (utils.benchmark, the model search). Each stage is recorded with src.profiling (wall and CPU time, rows,
+growth of the peak RSS, and its sub-stages), and with --trace-memory also with the peak of the memory allocated during
+the stage (tracemalloc, which slows the stages down). Titles are parsed without the title cache.
+
+The data set is --input, or a synthetic data set of --scale times the original size (see generate_data.py). Results are
+saved as benchmarks/results/<data set>/<commit>.json, and --compare prints them next to the results of another commit
+on the same data set.
+
+    python benchmarks/stages.py [--scale 1 | --input data.csv] [--until benchmark] [--compare <commit>]
+                                [--model en_core_web_md] [--n-process 1] [--search grid] [--reduce svd]
+                                [--trace-memory]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Dict
+
+root_folder = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root_folder))
+
+from benchmarks.generate_data import make_dataset, original_rows  # noqa: E402
+from src.loader import Loader  # noqa: E402
+from src.model_builder import ModelBuilder  # noqa: E402
+from src.processor import Processor  # noqa: E402
+from src.profiling import finish_report, stage, start_report  # noqa: E402
+from src.utils import benchmark  # noqa: E402
+
+results_folder = Path(__file__).resolve().parent / 'results'
+stage_names = ['load', 'reduce_class', 'preprocess_title', 'categorical', 'model_builder', 'benchmark']
+cat_columns = ['lang', 'verifiedby', 'ref_source', 'country1']
+num_columns = ['number_regions_published', 'published_date_day_diff']
+
+
+def get_commit() -> str:
+    # Short hash of the checked out commit, with -dirty when tracked files have uncommitted changes.
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root_folder, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root_folder,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if changes else '')
+
+
+def run_stages(filepath: Path, until: str, args: argparse.Namespace) -> Dict:
+    # Run the stages up to (and including) until, and return the run report (see profiling.RunReport).
+    report = start_report('benchmarks/stages.py')
+    traced_peaks = {}
+    if args.trace_memory:
+        tracemalloc.start()
+
+    def run(name: str, func) -> bool:
+        # Run a stage (func returns the number of rows processed), and tell whether to go on with the next one.
+        if args.trace_memory:
+            tracemalloc.reset_peak()
+        with stage(name) as metrics:
+            metrics['rows'] = func()
+        if args.trace_memory:
+            traced_peaks[name] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+        print('\t{:<18}{:>10.3f} s'.format(name, report.stages[name]['wall_s']))
+        return name != until
+
+    state = {'loader': Loader(filepath)}
+
+    def load() -> int:
+        state['loader'].load_data()
+        return len(state['loader'].df)
+
+    def reduce_class() -> int:
+        state['loader'].reduce_class_to_binary()
+        state['loader'].clean_data()
+        return len(state['loader'].df)
+
+    def preprocess_title() -> int:
+        state['processor'] = Processor(state['loader'].df, model_name=args.model, n_process=args.n_process,
+                                       batch_size=args.batch_size, keep_title_vectors=False)
+        state['processor'].preprocess_title()
+        return len(state['processor'].df)
+
+    def categorical() -> int:
+        processor = state['processor']
+        processor.preprocess_categorical_column(cat_columns)
+        processor.create_day_diff_variable(['published_date'])
+        processor.create_number_regions(['country1', 'country2', 'country3', 'country4'])
+        return len(processor.df)
+
+    def model_builder() -> int:
+        state['mb'] = ModelBuilder(state['processor'].df, cat_columns, num_columns, True)
+        return len(state['mb'].y_train)
+
+    def search() -> int:
+        benchmark(state['mb'], n_jobs=args.n_jobs, search=args.search, n_iter=args.n_iter, reduce=args.reduce,
+                  n_components=args.n_components, knn_algorithm=args.knn_algorithm)
+        return len(state['mb'].y_train)
+
+    for name, func in zip(stage_names, [load, reduce_class, preprocess_title, categorical, model_builder, search]):
+        if not run(name, func):
+            break
+
+    if args.trace_memory:
+        tracemalloc.stop()
+    results = finish_report().to_dict()
+    for entry in results['stages']:
+        entry['traced_peak_mb'] = traced_peaks.get(entry['stage'])
+    return results
+
+
+def find_results(dataset: str, commit: str) -> Path:
+    # Results of a commit (or of the commit with this hash prefix) on a data set.
+    matches = sorted((results_folder / dataset).glob(commit + '*.json'))
+    if not matches:
+        raise FileNotFoundError('No results for {} on {} in {}.'.format(commit, dataset, results_folder))
+    return matches[0]
+
+
+def print_comparison(results: Dict, baseline: Dict = None):
+    # Top-level stages of the results, next to the baseline's (with the ratio of the wall times).
+    baseline_stages = {entry['stage']: entry for entry in baseline['stages']} if baseline else {}
+    print('{:<18}{:>10}{:>10}{:>10}{:>12}{:>12}{:>12}{:>8}'.format('stage', 'rows', 'wall s', 'cpu s', 'rss +MB',
+                                                                  'traced MB', 'baseline s', 'ratio'))
+    for entry in results['stages']:
+        if '/' in entry['stage']:
+            continue
+        base_wall = baseline_stages[entry['stage']]['wall_s'] if entry['stage'] in baseline_stages else float('nan')
+        print('{:<18}{:>10}{:>10.3f}{:>10.3f}{:>12.1f}{:>12}{:>12.3f}{:>8.2f}'.format(
+            entry['stage'], entry['rows'], entry['wall_s'], entry['cpu_s'], entry['rss_growth_mb'],
+            '-' if entry['traced_peak_mb'] is None else entry['traced_peak_mb'], base_wall,
+            entry['wall_s'] / base_wall))
+    print('peak RSS: {} MB'.format(results['peak_rss_mb']))
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(description='Time and memory of each stage of the workflow.')
+    parser.add_argument('--scale', type=float, default=1,
+                        help='size of the synthetic data set, as a multiple of the original 6,902 rows.')
+    parser.add_argument('--input', default=None, help='use this .csv instead of a synthetic data set.')
+    parser.add_argument('--until', default='benchmark', choices=stage_names,
+                        help='last stage to run (e.g. model_builder to skip the model search on large data sets).')
+    parser.add_argument('--compare', default=None, help='commit (hash prefix) whose results to compare with.')
+    parser.add_argument('--model', default='en_core_web_md', help='spaCy model used to parse titles.')
+    parser.add_argument('--n-process', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--search', default='grid', choices=('grid', 'random', 'halving'))
+    parser.add_argument('--n-iter', type=int, default=10)
+    parser.add_argument('--reduce', default=None, choices=('svd', 'random_projection', 'pca'))
+    parser.add_argument('--n-components', type=int, nargs='+', default=[25, 50, 100])
+    parser.add_argument('--knn-algorithm', default='auto', choices=('auto', 'brute', 'ball_tree', 'kd_tree'))
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also record the peak memory allocated in each stage (tracemalloc).')
+    args = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.input is None:
+            dataset = 'synthetic_x{:g}'.format(args.scale)
+            filepath = Path(tmp_dir) / 'dataset.csv'
+            make_dataset(int(round(args.scale * original_rows))).to_csv(filepath, index=False)
+        else:
+            filepath = Path(args.input)
+            dataset = filepath.stem
+        print('Running stages on', dataset, '...')
+        results = run_stages(filepath, args.until, args)
+
+    # Read before saving, so comparing with the same commit shows its previous run.
+    baseline = json.loads(find_results(dataset, args.compare).read_text()) if args.compare else None
+    commit = get_commit()
+    results.update({'commit': commit, 'dataset': dataset, 'until': args.until,
+                    'arguments': {k: v for k, v in vars(args).items() if k not in ('compare', 'until')}})
+    results_file = results_folder / dataset / (commit + '.json')
+    results_file.parent.mkdir(parents=True, exist_ok=True)
+    results_file.write_text(json.dumps(results, indent=2, default=str) + '\n')
+    print('Results saved to', results_file)
+    print('')
+
+    print_comparison(results, baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Startup time of the main.py commands.
+
+Each command is timed in fresh interpreters (best of --repeat runs), as the time to import main.py plus the modules the
+command imports before doing any work. show is run for real, on a model folder with only its metadata. Times are
+compared with benchmarks/startup_baseline.json, and the script exits with an error if any command is slower than its
+baseline by more than --tolerance (use --update to record a new baseline on this machine).
+
+    python benchmarks/startup.py [--repeat 5] [--tolerance 0.5] [--update]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+root_folder = Path(__file__).resolve().parent.parent
+baseline_file = Path(__file__).resolve().parent / 'startup_baseline.json'
+# Slowdown (in seconds) always allowed, as the fastest commands are within timer and scheduling noise.
+min_slack = 0.05
+
+# Statements run by each command before doing any work (the imports in the respective main.py functions).
+commands = {'python': 'pass',
+            'main': 'import main',
+            'show': 'import main; main.summarize_best_model("model")',
+            'serve': 'import main; import src.artifacts, src.server',
+            'predict': 'import main; import src.artifacts, src.scoring',
+            'run': 'import main; import src.results_store, src.snapshot, src.utils, src.cache, src.loader, '
+                   'src.processor'}
+
+
+def time_command(statement: str, cwd: str, repeat: int) -> float:
+    # Best wall time of running the statement in a fresh interpreter.
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import sys; sys.path.insert(0, {!r}); {}'.format(str(root_folder),
+                                                                                              statement)],
+                       cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(description='Startup time of the main.py commands.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='allowed slowdown relative to the baseline (0.5 is 50%% slower).')
+    parser.add_argument('--update', action='store_true', help='save the measured times as the new baseline.')
+    args = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # show only needs the metadata of a model.
+        mdl_folder = Path(tmp_dir) / 'data' / 'model'
+        mdl_folder.mkdir(parents=True)
+        (mdl_folder / 'metadata.json').write_text(json.dumps({'Best cv macro-F1': 0.5}))
+        results = {name: round(time_command(statement, tmp_dir, args.repeat), 3)
+                   for name, statement in commands.items()}
+
+    if args.update or not baseline_file.exists():
+        baseline_file.write_text(json.dumps(results, indent=2) + '\n')
+        print(json.dumps(results, indent=2))
+        return 0
+
+    baseline = json.loads(baseline_file.read_text())
+    failed = False
+    print('{:<10}{:>10}{:>10}'.format('command', 'seconds', 'baseline'))
+    for name, seconds in results.items():
+        limit = max(baseline.get(name, seconds) * (1 + args.tolerance), baseline.get(name, seconds) + min_slack)
+        regressed = seconds > limit
+        failed |= regressed
+        print('{:<10}{:>10.3f}{:>10.3f}{}'.format(name, seconds, baseline.get(name, float('nan')),
+                                                  '  REGRESSION' if regressed else ''))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Per-title cost of the title token filtering (Processor.preprocess_title after spaCy has parsed the titles).
+
+Compares get_processed_tokens_many, which reads token attributes with Doc.to_array and processes a batch of docs at
+once (as Processor.parse_docs does), with the previous per-token loop, and checks that both give the same output. Titles come from data/dataset.csv when present, otherwise from a small set of
+sample titles; --text-repeat concatenates each title with itself to approximate content-sized texts.
+
+    python benchmarks/title_tokens.py [--model en_core_web_md] [--n-titles 2000] [--text-repeat 1] [--batch-size 1000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas
+
+root_folder = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(root_folder))
+
+from src.processor import get_processed_tokens_many  # noqa: E402
+from src.registry import get_model  # noqa: E402
+
+sample_titles = ["Does 'Every Election Year' Have a Coinciding Disease?",
+                 "Police asked shops selling alcohol to restrict opening hours on St. Patrick's Day.",
+                 "Drinking 2 litres of hot water with garlic every 15 minutes kills the coronavirus!!!",
+                 "The mice ate the cheese, and 5G towers spread the virus in 3 cities."]
+
+
+def get_processed_tokens_loop(doc) -> str:
+    # Previous implementation, one Token object per token.
+    processed = [token.lemma_ for token in doc if not (token.is_punct | token.is_digit | token.is_stop)]
+    return ' '.join(processed)
+
+
+def load_titles(n_titles: int, text_repeat: int) -> list:
+    dataset = root_folder / 'data' / 'dataset.csv'
+    if dataset.exists():
+        titles = pandas.read_csv(dataset, usecols=['title'])['title'].dropna().tolist()
+    else:
+        titles = sample_titles
+    titles = (titles * (n_titles // len(titles) + 1))[:n_titles]
+    return [' '.join([title] * text_repeat) for title in titles]
+
+
+def time_per_title(func, batches: list, repeat: int = 3) -> (float, list):
+    # Best time per title (in microseconds) over repeat runs, and the outputs.
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = [output for batch in batches for output in func(batch)]
+        best = min(best, time.perf_counter() - start)
+    return best / len(outputs) * 1e6, outputs
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Per-title cost of the title token filtering.')
+    parser.add_argument('--model', default='en_core_web_md')
+    parser.add_argument('--n-titles', type=int, default=2000)
+    parser.add_argument('--text-repeat', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args(args)
+
+    titles = load_titles(args.n_titles, args.text_repeat)
+    docs = list(get_model(args.model).pipe([title.lower().strip() for title in titles]))
+    n_tokens = sum(len(doc) for doc in docs) / len(docs)
+    batches = [docs[start:start + args.batch_size] for start in range(0, len(docs), args.batch_size)]
+
+    loop_time, loop_output = time_per_title(lambda batch: [get_processed_tokens_loop(doc) for doc in batch], batches)
+    array_time, array_output = time_per_title(get_processed_tokens_many, batches)
+    assert loop_output == array_output, 'Token filtering outputs differ.'
+
+    print('{} titles, {:.1f} tokens per title'.format(len(docs), n_tokens))
+    print('{:<24}{:>14}'.format('token filtering', 'us per title'))
+    print('{:<24}{:>14.2f}'.format('per-token loop', loop_time))
+    print('{:<24}{:>14.2f}'.format('Doc.to_array', array_time))
+    print('speedup: {:.1f}x'.format(loop_time / array_time))
+
+
+if __name__ == '__main__':
+    main()
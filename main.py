@@ -1,28 +1,51 @@
 import argparse
-import sys
 from pathlib import Path
+from typing import Callable, Dict, List, TYPE_CHECKING
 
-from src.loader import Loader
-from src.processor import Processor
+# Each command imports the modules it uses when it runs, so e.g. show does not pay for importing spaCy and
+# scikit-learn (see benchmarks/startup.py).
+if TYPE_CHECKING:
+    from pandas import DataFrame
+    from src.cache import TitleCache
+    from src.processor import Processor
 
-from src.utils import grid_search_with_selected_preds, load_model
+data_folder = Path("data")
 
 
 def summarize_best_model(filename: str):
-    contents = load_model(filename)
+    from src.artifacts import load_model_details
+
+    contents = load_model_details(filename)
     for k, v in contents.items():
         print(k, ' ---> ', v)
 
 
-def run_complete_workflow(use_tfidf_on_title: bool):
-    print('Loading and cleaning data...')
-    data_folder = Path("data")
-    file_loc = data_folder / "dataset.csv"
+def transform_data(file_loc: Path, title_cache: 'TitleCache', n_process: int = 1, batch_size: int = 1000,
+                   chunksize: int = None, vector_dtype: str = 'float32', content_max_chars: int = None,
+                   content_folder: Path = None, keep_title_vectors: bool = True) -> 'Processor':
+    # Load and clean the data, and run the preprocessing steps shared by both title representations (the title vectors
+    # are only kept for emb, see Processor.create_title_vector).
+    from src.content import ContentStore
+    from src.loader import Loader
+    from src.processor import Processor
 
     loader = Loader(file_loc)
-    loader.load_data()
-    loader.reduce_class_to_binary()
-    loader.clean_data()
+    if chunksize is None and content_max_chars is not None:
+        # Content texts are only truncated when streamed in, so they are never all held in memory at full length.
+        chunksize = 10000
+    if chunksize is None:
+        loader.load_data()
+        loader.reduce_class_to_binary()
+        loader.clean_data()
+    else:
+        # Stream the data in, keeping only the columns used in the workflow (content_text is truncated as it is
+        # read).
+        columns = ['verifiedby', 'class', 'title', 'published_date', 'country1', 'country2', 'country3', 'country4',
+                   'ref_source', 'source_title', 'lang']
+        if content_max_chars is not None:
+            columns.append('content_text')
+        loader.load_data_in_chunks(columns=columns, chunksize=chunksize,
+                                   max_chars=None if content_max_chars is None else {'content_text': content_max_chars})
 
     print('Class summary:')
     print(loader.df['class'].value_counts())
@@ -30,11 +53,18 @@ def run_complete_workflow(use_tfidf_on_title: bool):
     # Preprocess existing predictors and create some new ones.
     print("")
     print('Preprocessing predictors...\n')
-    processor = Processor(loader.df)
-    processor.preprocess_title()
-    processor.preprocess_categorical_column(['lang', 'verifiedby', 'ref_source', 'country1'])
-    processor.create_day_diff_variable(['published_date'])
-    processor.create_number_regions(['country1', 'country2', 'country3', 'country4'])
+    processor = Processor(loader.df, cache=title_cache, n_process=n_process, batch_size=batch_size,
+                          vector_dtype=vector_dtype, keep_title_vectors=keep_title_vectors)
+    processor.transform(['lang', 'verifiedby', 'ref_source', 'country1'], ['published_date'],
+                        ['country1', 'country2', 'country3', 'country4'])
+    if content_max_chars is not None:
+        # Token ids of the content texts are written to disk as they are produced, and memory-mapped back in.
+        processor.create_content_ids(content_max_chars, ContentStore(content_folder))
+    return processor
+
+
+def finish_processing(processor: 'Processor', use_tfidf_on_title: bool) -> ('DataFrame', Dict):
+    # Title representation (processed tokens for tf-idf, or averaged embeddings), without the unused columns.
     if not use_tfidf_on_title:
         # Compute averaged embedding title vector.
         processor.create_title_vector()
@@ -42,7 +72,63 @@ def run_complete_workflow(use_tfidf_on_title: bool):
     # Drop unused columns from dataframe.
     processed_df = processor.df
     processed_df = processed_df.drop(['country', 'published_date', 'country2', 'country3', 'country4',
-                                      'article_source', 'source_title', 'content_text', 'category'], axis=1)
+                                      'article_source', 'source_title', 'content_text', 'category'], axis=1,
+                                     errors='ignore')
+    return processed_df, processor.get_state()
+
+
+def load_and_process_data(file_loc: Path, use_tfidf_on_title: bool, n_process: int = 1, batch_size: int = 1000,
+                          chunksize: int = None, vector_dtype: str = 'float32', content_max_chars: int = None,
+                          content_folder: Path = None) -> ('DataFrame', Dict):
+    from src.cache import TitleCache
+
+    # Parsed titles are cached on disk, so only titles not seen in previous runs go through spaCy.
+    title_cache = TitleCache(file_loc.parent / "cache" / "titles.sqlite")
+    processor = transform_data(file_loc, title_cache, n_process, batch_size, chunksize, vector_dtype, content_max_chars,
+                               content_folder, keep_title_vectors=not use_tfidf_on_title)
+    processed = finish_processing(processor, use_tfidf_on_title)
+    title_cache.close()
+    return processed
+
+
+def get_fingerprints(file_loc: Path, use_tfidf_on_title: bool, vector_dtype: str,
+                     content_max_chars: int) -> (str, str):
+    # Fingerprints of the processed data (see snapshot.get_fingerprint) and of the content token ids, which do not
+    # depend on the title representation.
+    from src.snapshot import get_fingerprint
+
+    return (get_fingerprint(file_loc, {'use_tfidf_on_title': use_tfidf_on_title, 'vector_dtype': vector_dtype,
+                                       'content_max_chars': content_max_chars}, model_name='en_core_web_md'),
+            get_fingerprint(file_loc, {'content_max_chars': content_max_chars}, model_name='en_core_web_md'))
+
+
+def get_processed_data(snapshot_folder: Path, use_snapshot: bool, process: Callable) -> ('DataFrame', Dict):
+    # The processed data is saved as a snapshot, keyed by a fingerprint of the input file, the processing code and the
+    # title representation, so later runs with the same inputs go straight to the model search. Otherwise, process()
+    # returns the processed data and the processor state.
+    from src.profiling import stage
+    from src.snapshot import has_snapshot, load_snapshot, save_snapshot
+
+    if use_snapshot and has_snapshot(snapshot_folder):
+        print('Reusing processed data from snapshot', snapshot_folder.name[:12], '...')
+        with stage('load_snapshot') as metrics:
+            processed_df, processor_state = load_snapshot(snapshot_folder)
+            metrics['rows'] = len(processed_df)
+    else:
+        with stage('load_and_process_data') as metrics:
+            processed_df, processor_state = process()
+            metrics['rows'] = len(processed_df)
+        if use_snapshot:
+            with stage('save_snapshot', rows=len(processed_df)):
+                save_snapshot(processed_df, snapshot_folder, processor_state)
+    return processed_df, processor_state
+
+
+def search_models(processed_df: 'DataFrame', processor_state: Dict, use_tfidf_on_title: bool, fingerprint: str,
+                  use_results_store: bool = True, mdl_prefix: str = 'best_model', **search_args) -> Dict:
+    # Search and save the best model (see utils.grid_search_with_selected_preds, which takes search_args).
+    from src.results_store import ResultsStore
+    from src.utils import grid_search_with_selected_preds
 
     # Perform grid search and evaluate models with stratified k-fold cross validation.
     # Specify the df columns to be used as predictors.
@@ -57,29 +143,272 @@ def run_complete_workflow(use_tfidf_on_title: bool):
     else:
         print("Title represented as a vector (averaged across individual word embeddings)...")
 
-    grid_search_with_selected_preds(processed_df, cat_columns, num_columns, use_tfidf_on_title)
+    # Fold results are stored as they are computed, so an interrupted or extended search only runs the missing fits.
+    results_store = ResultsStore(data_folder / "cache" / "results.sqlite") if use_results_store else None
+    summary = grid_search_with_selected_preds(processed_df, cat_columns, num_columns, use_tfidf_on_title,
+                                              results_store=results_store, processor_state=processor_state,
+                                              data_fingerprint=fingerprint, mdl_prefix=mdl_prefix, **search_args)
+    if results_store is not None:
+        results_store.close()
+    return summary
+
+
+def run_complete_workflow(use_tfidf_on_title: bool, n_process: int = 1, batch_size: int = 1000,
+                          chunksize: int = None, use_snapshot: bool = True, n_jobs: int = 1, backend: str = 'loky',
+                          cache_folds: bool = True, search: str = 'grid', n_iter: int = 10,
+                          use_results_store: bool = True, vector_dtype: str = 'float32', reduce: str = None,
+                          n_components: List[int] = (25, 50, 100), knn_algorithm: str = 'auto',
+                          content_max_chars: int = None):
+    print('Loading and cleaning data...')
+    file_loc = data_folder / "dataset.csv"
+
+    fingerprint, content_fingerprint = get_fingerprints(file_loc, use_tfidf_on_title, vector_dtype, content_max_chars)
+    processed_df, processor_state = get_processed_data(
+        data_folder / "cache" / "snapshots" / fingerprint, use_snapshot,
+        lambda: load_and_process_data(file_loc, use_tfidf_on_title, n_process, batch_size, chunksize, vector_dtype,
+                                      content_max_chars, data_folder / "cache" / "content" / content_fingerprint))
+
+    search_models(processed_df, processor_state, use_tfidf_on_title, fingerprint, use_results_store, n_jobs=n_jobs,
+                  backend=backend, cache_folds=cache_folds, search=search, n_iter=n_iter, reduce=reduce,
+                  n_components=n_components, knn_algorithm=knn_algorithm, content_max_chars=content_max_chars)
+
+
+def run_all_workflows(n_process: int = 1, batch_size: int = 1000, chunksize: int = None, use_snapshot: bool = True,
+                      n_jobs: int = 1, backend: str = 'loky', cache_folds: bool = True, search: str = 'grid',
+                      n_iter: int = 10, use_results_store: bool = True, vector_dtype: str = 'float32',
+                      reduce: str = None, n_components: List[int] = (25, 50, 100), knn_algorithm: str = 'auto',
+                      content_max_chars: int = None, n_workers: int = 2):
+    # Both title representations in one run: the data is loaded and preprocessed (incl. spaCy parsing of the titles)
+    # once, and the tf-idf search runs while the title vectors are computed and searched, on n_workers threads (see
+    # scheduler.Scheduler). Each representation keeps its own snapshot, and the stages of a representation whose
+    # snapshot exists are skipped.
+    import time
+    from src.cache import TitleCache
+    from src.processor import Processor
+    from src.scheduler import Scheduler
+    from src.snapshot import has_snapshot
+    from src.utils import save_comparison
+
+    print('Loading and cleaning data...')
+    file_loc = data_folder / "dataset.csv"
+    search_args = {'n_jobs': n_jobs, 'backend': backend, 'cache_folds': cache_folds, 'search': search, 'n_iter': n_iter,
+                   'reduce': reduce, 'n_components': n_components, 'knn_algorithm': knn_algorithm,
+                   'content_max_chars': content_max_chars}
+    title_reps = {'tfidf': True, 'emb': False}
+    fingerprints = {}
+    for title_rep, use_tfidf_on_title in title_reps.items():
+        fingerprints[title_rep], content_fingerprint = get_fingerprints(file_loc, use_tfidf_on_title, vector_dtype,
+                                                                        content_max_chars)
+    snapshot_folders = {title_rep: data_folder / "cache" / "snapshots" / fingerprint
+                        for title_rep, fingerprint in fingerprints.items()}
+
+    def transform() -> 'Processor':
+        # None when both snapshots can be reused. sqlite connections are per thread, so each stage opens the cache.
+        if use_snapshot and all(has_snapshot(folder) for folder in snapshot_folders.values()):
+            return None
+        title_cache = TitleCache(file_loc.parent / "cache" / "titles.sqlite")
+        processor = transform_data(file_loc, title_cache, n_process, batch_size, chunksize, vector_dtype,
+                                   content_max_chars, data_folder / "cache" / "content" / content_fingerprint)
+        title_cache.close()
+        processor.cache = None
+        return processor
+
+    def process_emb(processor: 'Processor') -> ('DataFrame', Dict):
+        # Title vectors (from the shared parse of the titles) are added to a copy of the shared data, which the tf-idf
+        # branch keeps using.
+        emb_processor = Processor(processor.df.copy(), n_process=n_process, batch_size=batch_size,
+                                  state=processor.get_state(), vector_dtype=vector_dtype)
+        emb_processor.title_vectors = processor.title_vectors
+        return finish_processing(emb_processor, False)
+
+    def make_data_stage(title_rep: str) -> Callable:
+        def get_data(processor: 'Processor') -> ('DataFrame', Dict):
+            process = (lambda: finish_processing(processor, True)) if title_reps[title_rep] \
+                else (lambda: process_emb(processor))
+            return get_processed_data(snapshot_folders[title_rep], use_snapshot, process)
+        return get_data
+
+    def make_search_stage(title_rep: str) -> Callable:
+        def search_stage(data: ('DataFrame', Dict)) -> Dict:
+            return search_models(data[0], data[1], title_reps[title_rep], fingerprints[title_rep], use_results_store,
+                                 mdl_prefix='best_model_' + title_rep, **search_args)
+        return search_stage
+
+    scheduler = Scheduler(n_workers)
+    scheduler.add('transform', transform)
+    for title_rep in title_reps:
+        scheduler.add(title_rep + '.data', make_data_stage(title_rep), ['transform'])
+        scheduler.add(title_rep + '.search', make_search_stage(title_rep), [title_rep + '.data'])
+
+    start = time.perf_counter()
+    results = scheduler.run()
+    print("")
+    comparison_file = save_comparison({title_rep: results[title_rep + '.search'] for title_rep in title_reps},
+                                      scheduler.timings, time.perf_counter() - start)
+    print('Comparison written to', comparison_file)
+
+
+def run_streaming_workflow(n_process: int = 1, batch_size: int = 1000, chunksize: int = 10000):
+    from src.cache import TitleCache
+    from src.snapshot import get_fingerprint
+    from src.streaming import StreamingTrainer
+    from src.utils import train_streaming_models
+
+    file_loc = data_folder / "dataset.csv"
+    fingerprint = get_fingerprint(file_loc, {'streaming': True, 'chunksize': chunksize}, model_name='en_core_web_md')
+
+    # The data set is read in chunks in every pass (statistics, training, holdout evaluation), and never held in
+    # memory. Parsed titles are cached on disk, so titles are only run through spaCy once.
+    print("Training on chunks of the data set, title represented as a hashed bag of words...")
+    title_cache = TitleCache(data_folder / "cache" / "titles.sqlite")
+    trainer = StreamingTrainer(file_loc, ['lang', 'verifiedby', 'ref_source', 'country1'],
+                               ['number_regions_published', 'published_date_day_diff'], chunksize=chunksize,
+                               cache=title_cache, n_process=n_process, batch_size=batch_size)
+    train_streaming_models(trainer, data_fingerprint=fingerprint)
+    title_cache.close()
+
+
+def serve_model(filename: str, host: str, port: int, max_batch_size: int, max_wait_ms: float):
+    from src.artifacts import load_model
+    from src.server import serve
+
+    contents = load_model(filename)
+    serve(contents, host=host, port=port, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+
+def predict_file(filename: str, input_file: str, output_file: str, chunksize: int, n_workers: int):
+    from src.artifacts import load_model
+    from src.scoring import predict_csv
+
+    contents = load_model(filename)
+    print('Scoring', input_file, 'in chunks of', chunksize, 'rows...')
+    n_rows = predict_csv(contents, input_file, output_file, chunksize=chunksize, n_workers=n_workers,
+                         mdl_file=filename)
+    print('Wrote', n_rows, 'predictions to', output_file)
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Fake news classifier workflow.')
+    subparsers = parser.add_subparsers(dest='opt', required=True)
+
+    show_parser = subparsers.add_parser('show', help='print details of a saved model.')
+    show_parser.add_argument('mdl_file', nargs='?', default='best_model_Dec-31-2020_1529.pkl')
+
+    serve_parser = subparsers.add_parser('serve', help='serve predictions of a saved model over http.')
+    serve_parser.add_argument('mdl_file')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    serve_parser.add_argument('--max-batch-size', type=int, default=64,
+                              help='maximum number of records scored together.')
+    serve_parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                              help='how long to wait for more requests to fill a batch.')
+
+    predict_parser = subparsers.add_parser('predict', help='score a .csv with a saved model, in chunks.')
+    predict_parser.add_argument('mdl_file')
+    predict_parser.add_argument('input_file')
+    predict_parser.add_argument('output_file')
+    predict_parser.add_argument('--chunksize', type=int, default=10000,
+                                help='number of rows scored at a time.')
+    predict_parser.add_argument('--n-workers', type=int, default=1,
+                                help='number of processes scoring chunks.')
+
+    run_parser = subparsers.add_parser('run', help='run the complete modelling workflow.')
+    run_parser.add_argument('title_rep', nargs='?', default='tfidf', type=str.lower, choices=('tfidf', 'emb', 'all'),
+                            help='title representation (all: both, sharing the data preprocessing).')
+    run_parser.add_argument('--n-process', type=int, default=1,
+                            help='number of processes used by spaCy to preprocess titles.')
+    run_parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of titles per spaCy batch.')
+    run_parser.add_argument('--chunksize', type=int, default=None,
+                            help='stream the .csv in chunks of this many rows, loading only the columns used.')
+    run_parser.add_argument('--streaming', action='store_true',
+                            help='train partial_fit classifiers over chunks of the data (tfidf only), for data sets '
+                                 'larger than memory.')
+    run_parser.add_argument('--vector-dtype', default='float32', choices=('float32', 'float16'),
+                            help='storage of the title vectors in emb mode (float16 halves their memory).')
+    run_parser.add_argument('--n-jobs', type=int, default=1,
+                            help='number of workers for the model search (-1 for all cores).')
+    run_parser.add_argument('--backend', default='loky', choices=('loky', 'multiprocessing', 'threading'),
+                            help='joblib backend used with --n-jobs.')
+    run_parser.add_argument('--no-fold-cache', action='store_true',
+                            help='refit the preprocessor for every parameter combination (as GridSearchCV does).')
+    run_parser.add_argument('--search', default='grid', choices=('grid', 'random', 'halving'),
+                            help='parameter search strategy (random and halving need the fold cache).')
+    run_parser.add_argument('--n-iter', type=int, default=10,
+                            help='number of parameter combinations per classifier for the random search.')
+    run_parser.add_argument('--reduce', default=None, choices=('svd', 'random_projection', 'pca'),
+                            help='fit SVC and KNN on features reduced with truncated SVD (sparse tf-idf), sparse '
+                                 'random projection or PCA (dense embeddings), to keep them tractable on large data '
+                                 'sets.')
+    run_parser.add_argument('--n-components', type=int, nargs='+', default=[25, 50, 100],
+                            help='target dimensions searched with --reduce.')
+    run_parser.add_argument('--knn-algorithm', default='auto', choices=('auto', 'brute', 'ball_tree', 'kd_tree'),
+                            help='neighbor index of KNN (trees need dense features, i.e. --reduce or emb).')
+    run_parser.add_argument('--content', action='store_true',
+                            help='also use content_text as a predictor (tf-idf on a hashed bag of words).')
+    run_parser.add_argument('--content-max-chars', type=int, default=5000,
+                            help='characters of content_text kept per article with --content (the data is then '
+                                 'streamed in chunks, of 10000 rows if --chunksize is not set).')
+    run_parser.add_argument('--workers', type=int, default=2,
+                            help='number of threads running independent stages (e.g. the two searches) with all.')
+    run_parser.add_argument('--no-results-store', action='store_true',
+                            help='do not reuse (or store) fold results of previous searches.')
+    run_parser.add_argument('--no-snapshot', action='store_true',
+                            help='always load and process the data, instead of reusing a saved snapshot.')
+    run_parser.add_argument('--report', default=None,
+                            help='write a json run report (time, CPU time, peak memory and rows of each stage, fit '
+                                 'and score times of each classifier) to this file.')
+    run_parser.add_argument('--cprofile', action='store_true',
+                            help='also profile the run with cProfile, dumping the stats next to the report (.prof).')
+
+    parsed_args = parser.parse_args(args)
+    if parsed_args.opt == 'run' and parsed_args.search != 'grid' and parsed_args.no_fold_cache:
+        parser.error('--search random/halving cannot be used with --no-fold-cache.')
+    if parsed_args.opt == 'run' and parsed_args.streaming and parsed_args.title_rep != 'tfidf':
+        parser.error('--streaming uses a hashed bag of words for titles, and cannot be used with emb or all.')
+    if parsed_args.opt == 'run' and parsed_args.cprofile and parsed_args.report is None:
+        parser.error('--cprofile needs --report.')
+    if parsed_args.opt == 'run' and parsed_args.streaming and parsed_args.content:
+        parser.error('--content cannot be used with --streaming.')
+    return parsed_args
 
 
 if __name__ == "__main__":
 
-    opt = ""
-    use_tfidf_on_title = True
-    mdl_file = 'best_model_Dec-31-2020_1529.pkl'
-    if len(sys.argv) <= 1 or sys.argv[1] not in ('run', 'show'):
-        raise argparse.ArgumentTypeError("Argument value must be 'show' or 'run'.")
-    opt = sys.argv[1]
-
-    if len(sys.argv) > 2:
-        if opt == "run":
-            title_rep = sys.argv[2].lower()
-            if title_rep not in ('tfidf', 'emb'):
-                raise argparse.ArgumentTypeError("Argument value must be 'tfidf' or 'emb'.")
-            if title_rep == "emb":
-                use_tfidf_on_title = False
-        else:
-            mdl_file = sys.argv[2]
-
-    if opt == "show":
-        summarize_best_model(mdl_file)
-    elif opt == "run":
-        run_complete_workflow(use_tfidf_on_title)
+    args = parse_args()
+
+    # Stage timings are only recorded when a run report is requested (see src/profiling.py).
+    report_file = getattr(args, 'report', None)
+    if report_file is not None:
+        from src.profiling import start_report
+        start_report('run ' + args.title_rep + (' --streaming' if args.streaming else ''), cprofile=args.cprofile)
+
+    if args.opt == "show":
+        summarize_best_model(args.mdl_file)
+    elif args.opt == "predict":
+        predict_file(args.mdl_file, args.input_file, args.output_file, args.chunksize, args.n_workers)
+    elif args.opt == "serve":
+        serve_model(args.mdl_file, args.host, args.port, args.max_batch_size, args.max_wait_ms)
+    elif args.opt == "run" and args.streaming:
+        run_streaming_workflow(n_process=args.n_process, batch_size=args.batch_size,
+                               chunksize=args.chunksize or 10000)
+    elif args.opt == "run" and args.title_rep == 'all':
+        run_all_workflows(n_process=args.n_process, batch_size=args.batch_size, chunksize=args.chunksize,
+                          use_snapshot=not args.no_snapshot, n_jobs=args.n_jobs, backend=args.backend,
+                          cache_folds=not args.no_fold_cache, search=args.search, n_iter=args.n_iter,
+                          use_results_store=not args.no_results_store, vector_dtype=args.vector_dtype,
+                          reduce=args.reduce, n_components=args.n_components, knn_algorithm=args.knn_algorithm,
+                          content_max_chars=args.content_max_chars if args.content else None, n_workers=args.workers)
+    elif args.opt == "run":
+        run_complete_workflow(args.title_rep == 'tfidf', n_process=args.n_process, batch_size=args.batch_size,
+                              chunksize=args.chunksize, use_snapshot=not args.no_snapshot,
+                              n_jobs=args.n_jobs, backend=args.backend, cache_folds=not args.no_fold_cache,
+                              search=args.search, n_iter=args.n_iter, use_results_store=not args.no_results_store,
+                              vector_dtype=args.vector_dtype, reduce=args.reduce, n_components=args.n_components,
+                              knn_algorithm=args.knn_algorithm,
+                              content_max_chars=args.content_max_chars if args.content else None)
+
+    if report_file is not None:
+        from src.profiling import finish_report
+        finish_report(report_file)
+        print('Run report written to', report_file)
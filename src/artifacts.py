@@ -0,0 +1,100 @@
+import json
+import shutil
+from importlib import metadata
+from pathlib import Path
+from typing import Dict
+
+# joblib and numpy are imported where they are used, so reading the metadata of a model (main.py show) does not pay for
+# importing them.
+
+data_folder = Path("data")
+
+metadata_file = 'metadata.json'
+pipeline_file = 'pipeline.joblib'
+
+# Packages whose versions are recorded with each model (a pipeline should be loaded with the versions it was saved with).
+versioned_packages = ['scikit-learn', 'numpy', 'pandas', 'joblib', 'spacy']
+
+
+def get_library_versions() -> Dict[str, str]:
+    versions = {}
+    for package in versioned_packages:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def to_json(value):
+    # Json-serializable version of parameter values (numpy scalars from parameter grids, estimators).
+    import numpy as np
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+
+def is_artifact(path: str) -> bool:
+    return (Path(path) / metadata_file).exists()
+
+
+def save_artifact(folder: str, mdl_obj: object, mdl_predictors: Dict, best_score: float, test_score: float,
+                  best_params: Dict = None, processor_state: Dict = None, data_fingerprint: str = None):
+    # Save a model as a folder with a small json metadata file (predictors, scores, parameters, processor state, data
+    # fingerprint and library versions) and the fitted pipeline. The pipeline is dumped uncompressed, so its numpy
+    # arrays (idf weights, coefficients, support vectors, ...) are stored as raw buffers that load_artifact can
+    # memory-map. Written to a temporary folder first, so an artifact is never partial.
+    import joblib
+    folder = Path(folder)
+    tmp_folder = folder.with_name(folder.name + '.tmp')
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    tmp_folder.mkdir(parents=True)
+
+    meta = {'Predictor names': mdl_predictors,
+            'Best cv macro-F1': best_score,
+            'Macro-F1 on test set': test_score,
+            'Best parameters': best_params,
+            'Processor state': processor_state,
+            'Data fingerprint': data_fingerprint,
+            'Library versions': get_library_versions()}
+    with open(tmp_folder / metadata_file, 'w') as f:
+        json.dump(meta, f, indent=2, default=to_json)
+    joblib.dump(mdl_obj, tmp_folder / pipeline_file)
+
+    shutil.rmtree(folder, ignore_errors=True)
+    tmp_folder.rename(folder)
+
+
+def load_metadata(folder: str) -> Dict:
+    # Metadata of a saved model, without loading the pipeline.
+    with open(Path(folder) / metadata_file) as f:
+        return json.load(f)
+
+
+def load_artifact(folder: str, mmap: bool = True) -> Dict:
+    # Load a model saved by save_artifact, with the same keys as the .pkl files saved by earlier versions. With mmap,
+    # the pipeline arrays are memory-mapped read-only: loading is quick, and processes serving the same model share the
+    # pages instead of each holding a copy.
+    import joblib
+    contents = load_metadata(folder)
+    contents['Model details'] = joblib.load(Path(folder) / pipeline_file, mmap_mode='r' if mmap else None)
+    return contents
+
+
+def load_model(mdl_file: str) -> Dict:
+    # Load previously saved model and predictors, from a model folder (memory-mapped) or a .pkl from earlier versions.
+    mdl_path = data_folder / mdl_file
+    if is_artifact(mdl_path):
+        return load_artifact(mdl_path)
+    import joblib
+    contents = joblib.load(mdl_path)
+    return contents
+
+
+def load_model_details(mdl_file: str) -> Dict:
+    # Details of a saved model: only the metadata is read for model folders (.pkl files have to be loaded entirely).
+    mdl_path = data_folder / mdl_file
+    if is_artifact(mdl_path):
+        return load_metadata(mdl_path)
+    import joblib
+    return joblib.load(mdl_path)
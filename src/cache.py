@@ -0,0 +1,66 @@
+import hashlib
+import sqlite3
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+
+def get_model_id(model_name: str) -> str:
+    # Identify a spaCy model by package name and version, so cache entries are invalidated when the model changes.
+    # The version is read from the installed package metadata, which avoids loading the model itself.
+    try:
+        version = metadata.version(model_name)
+    except metadata.PackageNotFoundError:
+        import spacy
+        version = spacy.load(model_name).meta.get('version', '')
+    return model_name + '-' + version
+
+
+def make_key(text: str, model_id: str, parse_id: str = '') -> str:
+    # Content address of a (normalized) text as parsed by a given model, and by a given version of the parsing code
+    # (see processor.get_parse_id).
+    digest = hashlib.sha256()
+    digest.update(model_id.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(parse_id.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class TitleCache:
+    """Disk-backed cache of processed tokens and document vectors, keyed by text and model."""
+
+    def __init__(self, filepath: str):
+        self.filepath = Path(filepath)
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.filepath))
+        self.conn.execute('CREATE TABLE IF NOT EXISTS docs '
+                          '(key TEXT PRIMARY KEY, tokens TEXT NOT NULL, vector BLOB NOT NULL)')
+        self.conn.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Tuple[str, np.ndarray]]:
+        # Look up entries in batches (sqlite limits the number of bound parameters per statement).
+        keys = list(set(keys))
+        found = {}
+        batch_size = 500
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            query = 'SELECT key, tokens, vector FROM docs WHERE key IN ({})'.format(','.join('?' * len(batch)))
+            for key, tokens, vector in self.conn.execute(query, batch):
+                found[key] = (tokens, np.frombuffer(vector, dtype=np.float32))
+        return found
+
+    def put_many(self, entries: List[Tuple[str, str, np.ndarray]]):
+        # Store (key, processed tokens, document vector) entries.
+        rows = [(key, tokens, np.asarray(vector, dtype=np.float32).tobytes()) for key, tokens, vector in entries]
+        self.conn.executemany('INSERT OR REPLACE INTO docs (key, tokens, vector) VALUES (?, ?, ?)', rows)
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,116 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, Iterator, List
+
+import numpy as np
+from pandas import Series
+from scipy.sparse import csr_matrix, vstack
+from sklearn.base import BaseEstimator, TransformerMixin
+from spacy.attrs import LOWER, IS_PUNCT, IS_DIGIT, IS_STOP
+from spacy.tokens.doc import Doc
+
+from src.profiling import timed_iter
+from src.registry import get_model
+
+# Characters of content_text kept per article: longer texts are truncated before tokenization (and when the data is
+# streamed in), which bounds the time and memory spent on each article.
+max_content_chars = 5000
+
+ids_file = 'ids.bin'
+offsets_file = 'offsets.npy'
+
+
+def cap_texts(values: Series, max_chars: int = max_content_chars) -> Iterator[str]:
+    # Texts truncated to max_chars characters, with missing texts as empty strings.
+    for text in values:
+        yield text[:max_chars] if isinstance(text, str) else ''
+
+
+def get_token_ids(doc: Doc) -> np.ndarray:
+    # Token ids of a doc (lower 32 bits of spaCy's hash of the lowercase form), without punctuation, digits and stop
+    # words. Only lexical attributes are used, so the doc only needs to be tokenized.
+    attributes = doc.to_array([LOWER, IS_PUNCT, IS_DIGIT, IS_STOP])
+    keep = (attributes[:, 1] | attributes[:, 2] | attributes[:, 3]) == 0
+    return (attributes[keep, 0] & 0xFFFFFFFF).astype(np.uint32)
+
+
+def iter_token_ids(texts: Iterable[str], model_name: str = 'en_core_web_md', n_process: int = 1,
+                   batch_size: int = 1000) -> Iterator[np.ndarray]:
+    # Token ids of each text (in order), running only the tokenizer of the spaCy model: tagging and lemmatizing long
+    # texts would cost far more than the titles, for little gain in a bag of words.
+    nlp = get_model(model_name)
+    docs = nlp.pipe(texts, n_process=n_process, batch_size=batch_size, disable=nlp.pipe_names)
+    for doc in timed_iter('spacy.pipe_content', docs):
+        yield get_token_ids(doc)
+
+
+class ContentStore:
+    """Token id arrays of many texts on disk, as one flat file of ids and the offsets of each text."""
+
+    def __init__(self, folder: str):
+        self.folder = Path(folder)
+
+    def exists(self) -> bool:
+        return (self.folder / offsets_file).exists()
+
+    def write(self, arrays: Iterable[np.ndarray]) -> int:
+        # Write token id arrays as they are produced, so only the current batch is held in memory. Written to a
+        # temporary folder of this process first, so a store is never partial and processes writing the same store do
+        # not delete each other's files. Returns the number of texts.
+        tmp_folder = self.folder.with_name('{}.tmp{}'.format(self.folder.name, os.getpid()))
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        tmp_folder.mkdir(parents=True)
+        offsets = [0]
+        with open(tmp_folder / ids_file, 'wb') as f:
+            for ids in arrays:
+                f.write(np.asarray(ids, dtype=np.uint32).tobytes())
+                offsets.append(offsets[-1] + len(ids))
+        np.save(tmp_folder / offsets_file, np.array(offsets, dtype=np.int64))
+
+        shutil.rmtree(self.folder, ignore_errors=True)
+        try:
+            tmp_folder.rename(self.folder)
+        except OSError:
+            # Another process wrote the store in the meantime.
+            if not self.exists():
+                raise
+            shutil.rmtree(tmp_folder)
+        return len(offsets) - 1
+
+    def read(self) -> List[np.ndarray]:
+        # Token id arrays of all texts, as views of the memory-mapped id file (nothing is loaded until used).
+        offsets = np.load(self.folder / offsets_file)
+        if offsets[-1] == 0:
+            ids = np.zeros(0, dtype=np.uint32)
+        else:
+            ids = np.memmap(self.folder / ids_file, dtype=np.uint32, mode='r').view(np.ndarray)
+        return [ids[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
+class ContentVectorizer(BaseEstimator, TransformerMixin):
+    """Hashed bag of words of token id arrays (see Processor.create_content_ids), as a sparse count matrix."""
+
+    def __init__(self, n_features: int = 2 ** 18, block_size: int = 10000):
+        self.n_features = n_features
+        self.block_size = block_size
+
+    def fit(self, x, y=None):
+        # Stateless: the columns are fixed by the hashing.
+        return self
+
+    def transform(self, x) -> csr_matrix:
+        # Counts are built block_size texts at a time, so the intermediate (one entry per token) arrays stay small,
+        # and only the deduplicated counts of all texts are kept.
+        arrays = list(x)
+        blocks = []
+        for start in range(0, max(len(arrays), 1), self.block_size):
+            block = arrays[start:start + self.block_size]
+            indptr = np.zeros(len(block) + 1, dtype=np.int64)
+            np.cumsum([len(ids) for ids in block], out=indptr[1:])
+            indices = (np.concatenate(block).astype(np.int64) % self.n_features if indptr[-1] > 0
+                       else np.zeros(0, dtype=np.int64))
+            counts = csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(block), self.n_features))
+            counts.sum_duplicates()
+            blocks.append(counts)
+        return vstack(blocks, format='csr')
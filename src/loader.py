@@ -1,5 +1,35 @@
-from pandas import read_csv
-from pandas import DataFrame
+from typing import Dict, Iterator, List
+
+from pandas import read_csv, concat
+from pandas import DataFrame, CategoricalDtype
+from pandas.util import hash_pandas_object
+
+from src.profiling import profiled
+
+col_names = ['verifiedby', 'country', 'class', 'title', 'published_date', 'country1',
+             'country2', 'country3', 'country4', 'article_source', 'ref_source',
+             'source_title', 'content_text', 'category', 'lang']
+
+# Low-cardinality columns, stored as categoricals when streaming the data in.
+compact_col_types = {'verifiedby': 'category', 'country': 'category', 'country1': 'category',
+                     'country2': 'category', 'country3': 'category', 'country4': 'category',
+                     'ref_source': 'category', 'category': 'category', 'lang': 'category'}
+
+
+def concat_chunks(chunks: List[DataFrame]) -> DataFrame:
+    # Concatenate chunks, keeping categorical columns as categoricals (chunks usually see different categories, so
+    # categories are unified and sorted as astype('category') would).
+    if not chunks:
+        return DataFrame(columns=col_names)
+    for col_name, dtype in chunks[0].dtypes.items():
+        if isinstance(dtype, CategoricalDtype):
+            categories = set()
+            for chunk in chunks:
+                categories.update(chunk[col_name].cat.categories)
+            categories = sorted(categories)
+            for chunk in chunks:
+                chunk[col_name] = chunk[col_name].cat.set_categories(categories)
+    return concat(chunks)
 
 
 class Loader:
@@ -9,16 +39,54 @@ class Loader:
         self.df = DataFrame
         self.filepath = filepath
 
+    @profiled('loader.load_data', rows=lambda self: len(self.df))
     def load_data(self):
         # Import data from .csv as DataFrame
-        col_names = ['verifiedby', 'country', 'class', 'title', 'published_date', 'country1',
-                     'country2', 'country3', 'country4', 'article_source', 'ref_source',
-                     'source_title', 'content_text', 'category', 'lang']
         col_types = {'title': str}
         df = read_csv(self.filepath, names=col_names, header=0, dtype=col_types)
 
         self.df = df
 
+    def iter_chunks(self, chunksize: int = 10000) -> Iterator[DataFrame]:
+        # Stream the raw .csv in chunks, with low-cardinality columns parsed as categoricals.
+        # The class is read as a string, otherwise chunks holding only e.g. 'True'/'False' would be parsed as booleans.
+        col_types = dict(compact_col_types, title=str, source_title=str)
+        col_types['class'] = str
+        return read_csv(self.filepath, names=col_names, header=0, dtype=col_types, chunksize=chunksize)
+
+    def iter_clean_chunks(self, columns: List[str] = None, chunksize: int = 10000,
+                          max_chars: Dict[str, int] = None) -> Iterator[DataFrame]:
+        # Stream the .csv in chunks, reducing the class to binary and cleaning each chunk as it is read, and keeping
+        # only the requested columns (all columns if None), so peak memory is bounded by the chunk size. Text columns
+        # in max_chars (e.g. content_text) are truncated to that many characters.
+        # Duplicates are found on the complete rows (as in clean_data), by keeping the hashes of rows already seen.
+        seen_hashes = set()
+        for chunk in self.iter_chunks(chunksize):
+            self.df = chunk
+            self.reduce_class_to_binary()
+
+            row_hashes = hash_pandas_object(self.df, index=False).to_numpy()
+            is_new = []
+            for row_hash in row_hashes:
+                is_new.append(row_hash not in seen_hashes)
+                seen_hashes.add(row_hash)
+            self.df = self.df[is_new]
+            self.df = self.df[self.df['class'].notna()]
+
+            if columns is not None:
+                self.df = self.df[columns]
+            for col_name, col_max_chars in (max_chars or {}).items():
+                self.df = self.df.assign(**{col_name: self.df[col_name].str.slice(0, col_max_chars)})
+            yield self.df
+
+    @profiled('loader.load_data_in_chunks', rows=lambda self, *_: len(self.df))
+    def load_data_in_chunks(self, columns: List[str] = None, chunksize: int = 10000, max_chars: Dict[str, int] = None):
+        # Load the cleaned chunks of iter_clean_chunks into a single DataFrame.
+        chunks = list(self.iter_clean_chunks(columns, chunksize, max_chars))
+        self.df = concat_chunks(chunks)
+        self.df['class'] = self.df['class'].astype('category')
+
+    @profiled('loader.reduce_class_to_binary', rows=lambda self: len(self.df))
     def reduce_class_to_binary(self):
         # Rename values in class variable to either true or false.
         self.df['class'] = self.df['class'].str.lower()
@@ -69,6 +137,7 @@ class Loader:
 
         self.df = df_copy
 
+    @profiled('loader.clean_data', rows=lambda self: len(self.df))
     def clean_data(self):
         # Remove duplicates and rows with no class value.
         self.df = self.df.drop_duplicates(keep='first')
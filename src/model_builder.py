@@ -1,15 +1,137 @@
-from typing import List, Dict
+import json
+import time
+import warnings
+from typing import List, Dict, Tuple
 
+import joblib
+import numpy as np
+from joblib import Parallel, delayed, parallel_backend
+from sklearn.base import clone
 from sklearn.compose import ColumnTransformer
-from sklearn.model_selection import StratifiedKFold, GridSearchCV, train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.decomposition import PCA, TruncatedSVD
+from sklearn.model_selection import StratifiedKFold, GridSearchCV, ParameterGrid, ParameterSampler, \
+    train_test_split
+from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
 from sklearn.metrics import f1_score
 
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import OneHotEncoder, MinMaxScaler
+from sklearn.random_projection import SparseRandomProjection
 
 from pandas import DataFrame
 
+from src.content import ContentVectorizer
+from src.profiling import profiled, record_fit, stage
+from src.results_store import ResultsStore
+from src.vectors import VectorFeatures
+
+
+def strip_prefix(params: Dict, prefix: str = 'classifier__') -> Dict:
+    # Pipeline parameter names (e.g. classifier__alpha) to estimator parameter names (alpha).
+    return {k[len(prefix):] if k.startswith(prefix) else k: v for k, v in params.items()}
+
+
+def stratified_subsample(y: np.ndarray, n_rows: int, rng: np.random.RandomState) -> np.ndarray:
+    # Sorted indices of a random subsample of n_rows rows, keeping the class proportions of y (at least one row per
+    # class).
+    rows = []
+    for label in np.unique(y):
+        label_rows = np.flatnonzero(y == label)
+        n_label = min(len(label_rows), max(1, int(round(n_rows * len(label_rows) / len(y)))))
+        rows.append(rng.choice(label_rows, n_label, replace=False))
+    return np.sort(np.concatenate(rows))
+
+
+def get_reducer(method: str):
+    # Dimensionality reduction step, with its target dimension set by the n_components parameter.
+    # - 'svd': truncated SVD, which works on the sparse tf-idf + one-hot matrix.
+    # - 'random_projection': sparse random projection, the cheapest option (sparse or dense features).
+    # - 'pca': PCA, for the dense title embeddings.
+    if method == 'svd':
+        return TruncatedSVD(random_state=0)
+    if method == 'random_projection':
+        return SparseRandomProjection(random_state=0)
+    if method == 'pca':
+        return PCA(random_state=0)
+    raise ValueError("Reduction must be 'svd', 'random_projection' or 'pca'.")
+
+
+def with_reduction(clf, param_grid: Dict, method: str, n_components: List[int]) -> (Pipeline, Dict):
+    # Classifier fit on reduced features: a (reduce, clf) pipeline in the classifier slot, so the reduction is fit on
+    # each training fold and the cached fold features are still shared by all classifiers. The parameter grid is
+    # renamed accordingly, and the target dimension is searched as classifier__reduce__n_components.
+    pipe = Pipeline(steps=[('reduce', get_reducer(method)), ('clf', clf)])
+    grid = {k.replace('classifier__', 'classifier__clf__', 1): v for k, v in param_grid.items()}
+    grid['classifier__reduce__n_components'] = list(n_components)
+    return pipe, grid
+
+
+def get_clf_name(clf) -> str:
+    # Class name of a classifier, with its reduction step for reduced classifiers (e.g. TruncatedSVD+SVC).
+    if isinstance(clf, Pipeline):
+        return '+'.join(step.__class__.__name__ for _, step in clf.steps)
+    return clf.__class__.__name__
+
+
+def record_cv_results(clf, cv_results: Dict, n_rows: int):
+    # Fit and score times of a GridSearchCV in the run report (GridSearchCV keeps the mean times over folds, so each
+    # parameter combination is one entry, without a fold index). The classifier can be a parameter (do_parallel_cv).
+    for i, params in enumerate(cv_results['params']):
+        params = dict(params)
+        record_fit(get_clf_name(params.pop('classifier', clf)), params, None, n_rows,
+                   cv_results['mean_fit_time'][i], cv_results['mean_score_time'][i], cv_results['mean_test_score'][i])
+
+
+def fit_and_score(clf, params: Dict, x_train, y_train, x_val, y_val) -> (float, float, float):
+    # Fit a classifier on the (already transformed) train fold and compute its macro-F1 on the validation fold.
+    # Failing fits get a nan score, as in GridSearchCV.
+    clf = clone(clf).set_params(**strip_prefix(params))
+    start = time.perf_counter()
+    try:
+        clf.fit(x_train, y_train)
+    except Exception as e:
+        warnings.warn('Fit failed for {} with parameters {}: {!r}'.format(clf.__class__.__name__, params, e))
+        return np.nan, time.perf_counter() - start, 0.0
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    score = f1_score(y_val, clf.predict(x_val), average='macro')
+    return score, fit_time, time.perf_counter() - start
+
+
+class CachedGridSearch:
+    """Grid search results for one classifier evaluated on cached fold features (mirrors GridSearchCV's attributes)."""
+
+    def __init__(self, clf, candidates: List[Dict], fold_scores: np.ndarray, fit_times: np.ndarray,
+                 score_times: np.ndarray):
+        self.estimator = clf
+        mean_scores = fold_scores.mean(axis=1)
+        # Rank as GridSearchCV does: nan scores come last, ties share the best rank, first best candidate wins.
+        ranking_scores = np.where(np.isnan(mean_scores), -np.inf, mean_scores)
+        self.cv_results_ = {'params': candidates,
+                            'mean_test_score': mean_scores,
+                            'rank_test_score': np.array([1 + np.sum(ranking_scores > s) for s in ranking_scores]),
+                            'mean_fit_time': fit_times.mean(axis=1),
+                            'mean_score_time': score_times.mean(axis=1)}
+        for i in range(fold_scores.shape[1]):
+            self.cv_results_['split{}_test_score'.format(i)] = fold_scores[:, i]
+        self.best_index_ = int(np.argmin(self.cv_results_['rank_test_score']))
+        self.best_score_ = mean_scores[self.best_index_]
+        self.best_params_ = candidates[self.best_index_]
+        self.best_estimator_ = None
+
+    @profiled('model_builder.refit', rows=lambda self, col_trans, x, y: len(y))
+    def refit(self, col_trans: ColumnTransformer, x, y):
+        # Fit the preprocessor and the best classifier on the complete training set.
+        clf = clone(self.estimator).set_params(**strip_prefix(self.best_params_))
+        self.best_estimator_ = Pipeline(steps=[('preprocessor', clone(col_trans)),
+                                               ('classifier', clf)])
+        self.best_estimator_.fit(x, y)
+        return self
+
+    def predict(self, x):
+        return self.best_estimator_.predict(x)
+
 
 class ModelBuilder:
     """Model Builder class"""
@@ -17,7 +139,9 @@ class ModelBuilder:
     def __init__(self, df: DataFrame,
                  cat_columns: List[str],
                  num_columns: List[str],
-                 use_tfifd_on_title=True):
+                 use_tfifd_on_title=True,
+                 results_store: ResultsStore = None,
+                 use_content: bool = False):
 
         x = df.loc[:, df.columns != 'class']
         y = df['class'].to_numpy()
@@ -29,22 +153,191 @@ class ModelBuilder:
         if use_tfifd_on_title:  # build tfidf on title's bag of words.
             self.col_trans = ColumnTransformer(
                 [("bow", TfidfVectorizer(min_df=9, ngram_range=(1, 1)), 'title'),
-                 ("cat", OneHotEncoder(), cat_columns),
+                 ("cat", OneHotEncoder(handle_unknown='ignore'), cat_columns),
                  ("num", MinMaxScaler(), num_columns)
                  ],
                 remainder='drop')
         else:  # use the title vector representation instead
             x = x.drop(['title'], axis=1)
+            # Vectors are scaled because some estimators cannot handle negative values.
+            vector_pipe = Pipeline(steps=[('vectors', VectorFeatures()),
+                                          ('scale', MinMaxScaler())])
             self.col_trans = ColumnTransformer(
-                [("cat", OneHotEncoder(), cat_columns),
-                 ("num", MinMaxScaler(), num_columns)
+                [("cat", OneHotEncoder(handle_unknown='ignore'), cat_columns),
+                 ("num", MinMaxScaler(), num_columns),
+                 ("vec", vector_pipe, 'title_vector')
                  ],
-                remainder=MinMaxScaler())  # need this preprocessor because some estimators cannot handle negative
-            # values
+                remainder='drop')
+
+        if use_content:  # tf-idf on the hashed bag of words of content_text (see Processor.create_content_ids)
+            content_pipe = Pipeline(steps=[('counts', ContentVectorizer()),
+                                           ('tfidf', TfidfTransformer(sublinear_tf=True))])
+            self.col_trans.transformers.append(("content", content_pipe, 'content_ids'))
 
         self.X_train, self.X_holdout, self.y_train, self.y_holdout = train_test_split(
             x, y, test_size=0.20, random_state=0, stratify=y)
 
+        self.fold_cache = None
+        self.results_store = results_store
+        self.data_fingerprint = None
+        self.preprocessor_fingerprint = None
+
+    def get_fold_cache(self) -> List[Tuple]:
+        # Fit the preprocessor once per stratified k-fold split and keep the transformed train/validation matrices,
+        # so they are shared by all classifiers and parameter combinations instead of being refit for each of them.
+        if self.fold_cache is None:
+            with stage('model_builder.fold_cache', rows=len(self.y_train)):
+                self.fold_cache = []
+                for train_idx, val_idx in self.skf.split(self.X_train, self.y_train):
+                    col_trans = clone(self.col_trans)
+                    x_train = col_trans.fit_transform(self.X_train.iloc[train_idx], self.y_train[train_idx])
+                    x_val = col_trans.transform(self.X_train.iloc[val_idx])
+                    self.fold_cache.append((x_train, self.y_train[train_idx], x_val, self.y_train[val_idx]))
+        return self.fold_cache
+
+    def get_result_entry(self, clf, params: Dict, k: int, rows: np.ndarray) -> Tuple:
+        # Key and description of a fold result in the results store: data, preprocessor and fold definition,
+        # classifier class and parameters, fold index and training rows.
+        if self.data_fingerprint is None:
+            self.data_fingerprint = joblib.hash((self.X_train, self.y_train))
+            self.preprocessor_fingerprint = joblib.hash((self.col_trans, self.skf))
+        clf_fingerprint = joblib.hash(clone(clf).set_params(**strip_prefix(params)))
+        rows_fingerprint = None if rows is None else joblib.hash(rows)
+        key = joblib.hash((self.data_fingerprint, self.preprocessor_fingerprint, clf_fingerprint, k, rows_fingerprint))
+        n_rows = len(self.get_fold_cache()[k][1]) if rows is None else len(rows)
+        return (key, self.data_fingerprint, self.preprocessor_fingerprint, get_clf_name(clf),
+                json.dumps(params, sort_keys=True, default=str), k, n_rows)
+
+    @profiled('model_builder.evaluate_on_folds', rows=lambda self, tasks, *_: len(tasks))
+    def evaluate_on_folds(self, tasks: List[Tuple], n_jobs: int = 1, backend: str = 'loky',
+                          checkpoint_size: int = 100) -> List[Tuple]:
+        # Run (classifier, parameters, fold index, training rows) fits on the cached fold features over a pool of
+        # n_jobs workers. Training rows are None to use the complete training fold.
+        # With a results store, only fits missing from it are run, and their results are stored every
+        # checkpoint_size fits, so an interrupted or extended search only computes what is missing.
+        folds = self.get_fold_cache()
+
+        def fold_data(k: int, rows: np.ndarray):
+            x_train, y_train, x_val, y_val = folds[k]
+            if rows is None:
+                return x_train, y_train, x_val, y_val
+            return x_train[rows], y_train[rows], x_val, y_val
+
+        def record_fits(task_indices: List[int], results: List[Tuple]):
+            # Fit and score times of the fits that were run (not those reused from the results store).
+            for i, (score, fit_time, score_time) in zip(task_indices, results):
+                clf, params, k, rows = tasks[i]
+                record_fit(get_clf_name(clf), params, k, len(folds[k][1]) if rows is None else len(rows), fit_time,
+                           score_time, score)
+
+        if self.results_store is None:
+            with parallel_backend(backend):
+                results = Parallel(n_jobs=n_jobs)(delayed(fit_and_score)(clf, params, *fold_data(k, rows))
+                                                  for clf, params, k, rows in tasks)
+            record_fits(range(len(tasks)), results)
+            return results
+
+        entries = [self.get_result_entry(*task) for task in tasks]
+        found = self.results_store.get_many(entry[0] for entry in entries)
+        missing = [i for i, entry in enumerate(entries) if entry[0] not in found]
+        with parallel_backend(backend), Parallel(n_jobs=n_jobs) as parallel:
+            for start in range(0, len(missing), checkpoint_size):
+                batch = missing[start:start + checkpoint_size]
+                batch_results = parallel(delayed(fit_and_score)(tasks[i][0], tasks[i][1], *fold_data(*tasks[i][2:]))
+                                         for i in batch)
+                self.results_store.put_many([entries[i] + result for i, result in zip(batch, batch_results)])
+                record_fits(batch, batch_results)
+                found.update((entries[i][0], result) for i, result in zip(batch, batch_results))
+
+        return [found[entry[0]] for entry in entries]
+
+    @profiled('model_builder.do_cached_search', rows=lambda self, *_: len(self.y_train))
+    def do_cached_search(self, clfs: List, param_grids: List[Dict], n_jobs: int = 1, backend: str = 'loky',
+                         search: str = 'grid', n_iter: int = 10, factor: int = 3) -> List[CachedGridSearch]:
+        # Search parameters for several classifiers on the cached fold features. All (classifier, parameters, fold)
+        # fits of a round are spread over a pool of n_jobs workers. The best models are not refit.
+        # - 'grid': all parameter combinations (same scores as do_cv).
+        # - 'random': at most n_iter combinations per classifier, sampled from the grid.
+        # - 'halving': successive halving over training rows. All combinations are first fit on a small stratified
+        #   subsample of each training fold, and only the best 1/factor of them are kept for the next round, with
+        #   factor times more rows. The last round uses the complete training folds, so the reported scores of the
+        #   remaining combinations are the same as in the grid search.
+        folds = self.get_fold_cache()
+        n_folds = len(folds)
+        if search == 'grid' or search == 'halving':
+            candidates = [list(ParameterGrid(param_grid)) for param_grid in param_grids]
+        elif search == 'random':
+            candidates = [list(ParameterSampler(param_grid, n_iter=min(n_iter, len(ParameterGrid(param_grid))),
+                                                random_state=0))
+                          for param_grid in param_grids]
+        else:
+            raise ValueError("Search must be 'grid', 'random' or 'halving'.")
+
+        # Number of rows used in each round, for each classifier (a single round with all rows, unless halving).
+        n_rows = min(len(y_train) for _, y_train, _, _ in folds)
+        schedules = []
+        for clf_candidates in candidates:
+            n_rounds = 1
+            if search == 'halving':
+                n_rounds = 1 + int(np.floor(np.log(len(clf_candidates)) / np.log(factor) + 1e-9))
+            min_rows = max(n_rows // factor ** (n_rounds - 1), 2 * n_folds * len(np.unique(self.y_train)))
+            schedules.append([min(n_rows, min_rows * factor ** r) for r in range(n_rounds - 1)] + [None])
+
+        rng = np.random.RandomState(0)
+        subsamples = {}
+        remaining = [list(range(len(clf_candidates))) for clf_candidates in candidates]
+        results = [None] * len(clfs)
+        n_fits = [0] * len(clfs)
+        n_full_fits = [0.0] * len(clfs)
+        for r in range(max(len(schedule) for schedule in schedules)):
+            tasks, owners = [], []
+            for i, clf in enumerate(clfs):
+                if r >= len(schedules[i]):
+                    continue
+                for k in range(n_folds):
+                    rows_count = schedules[i][r]
+                    if rows_count is not None and (k, rows_count) not in subsamples:
+                        subsamples[(k, rows_count)] = stratified_subsample(folds[k][1], rows_count, rng)
+                    rows = None if rows_count is None else subsamples[(k, rows_count)]
+                    for j in remaining[i]:
+                        tasks.append((clf, candidates[i][j], k, rows))
+                        owners.append((i, j, k))
+                n_fits[i] += len(remaining[i]) * n_folds
+                n_full_fits[i] += len(remaining[i]) * n_folds * (schedules[i][r] or n_rows) / n_rows
+
+            round_results = self.evaluate_on_folds(tasks, n_jobs=n_jobs, backend=backend)
+            for i in range(len(clfs)):
+                if r >= len(schedules[i]):
+                    continue
+                scores = {(j, k): res for (o_i, j, k), res in zip(owners, round_results) if o_i == i}
+                results[i] = np.array([[scores[(j, k)] for k in range(n_folds)] for j in remaining[i]])
+                if r < len(schedules[i]) - 1:
+                    # Keep the best 1/factor of the combinations (nan scores last, ties in grid order).
+                    mean_scores = np.nan_to_num(results[i][..., 0].mean(axis=1), nan=-np.inf)
+                    n_keep = int(np.ceil(len(remaining[i]) / factor))
+                    keep = sorted(np.argsort(-mean_scores, kind='stable')[:n_keep])
+                    remaining[i] = [remaining[i][j] for j in keep]
+
+        searches = []
+        for i, clf in enumerate(clfs):
+            search_result = CachedGridSearch(clf, [candidates[i][j] for j in remaining[i]], results[i][..., 0],
+                                             results[i][..., 1], results[i][..., 2])
+            search_result.n_fits_ = n_fits[i]
+            # Fits weighted by the fraction of training rows they used (subsample fits are cheaper).
+            search_result.n_full_fits_ = n_full_fits[i]
+            search_result.n_grid_fits_ = len(ParameterGrid(param_grids[i])) * n_folds
+            searches.append(search_result)
+        return searches
+
+    def do_cached_cv(self, clf, param_grid: Dict, n_jobs: int = 1,
+                     backend: str = 'loky') -> (CachedGridSearch, float, Dict):
+        # Same as do_cv, using the cached fold features.
+        search = self.do_cached_search([clf], [param_grid], n_jobs=n_jobs, backend=backend)[0]
+        search.refit(self.col_trans, self.X_train, self.y_train)
+
+        return search, round(search.best_score_, 3), search.best_params_
+
+    @profiled('model_builder.do_cv', rows=lambda self, *_: len(self.y_train))
     def do_cv(self, clf, param_grid: Dict) -> (GridSearchCV, float, Dict):
         # Perform grid search on stratified k fold.
         pipe = Pipeline(steps=[('preprocessor', self.col_trans),
@@ -55,12 +348,55 @@ class ModelBuilder:
                                    cv=self.skf.split(self.X_train, self.y_train),
                                    scoring='f1_macro')
         best_clf = grid_search.fit(self.X_train, self.y_train)
+        record_cv_results(clf, grid_search.cv_results_, len(self.y_train))
 
         best_score = grid_search.best_score_
         best_params = grid_search.best_params_
 
         return best_clf, round(best_score, 3), best_params
 
+    @profiled('model_builder.do_parallel_cv', rows=lambda self, *_: len(self.y_train))
+    def do_parallel_cv(self, clfs: List, param_grids: List[Dict], n_jobs: int = -1,
+                       backend: str = 'loky') -> (GridSearchCV, List[Tuple[float, Dict]], int):
+        # Perform grid search for several classifiers at once, so that all (classifier, parameters, fold) fits are
+        # spread over one pool of workers. The best parameters per classifier, and the overall best classifier, are
+        # picked exactly as in consecutive calls to do_cv: first best mean score per classifier, and the earliest
+        # classifier among those with the highest rounded score.
+        grids = [dict(param_grid, classifier=[clf]) for clf, param_grid in zip(clfs, param_grids)]
+        grid_sizes = [len(ParameterGrid(param_grid)) for param_grid in grids]
+        grid_starts = np.cumsum([0] + grid_sizes)
+
+        clf_results = []
+
+        def select_best(cv_results: Dict) -> int:
+            clf_results.clear()
+            best_index, best_score = 0, 0
+            for start, stop in zip(grid_starts[:-1], grid_starts[1:]):
+                clf_best = start + int(np.argmin(cv_results['rank_test_score'][start:stop]))
+                clf_score = round(cv_results['mean_test_score'][clf_best], 3)
+                clf_params = {k: v for k, v in cv_results['params'][clf_best].items() if k != 'classifier'}
+                clf_results.append((clf_score, clf_params))
+                if clf_score > best_score:
+                    best_index, best_score = clf_best, clf_score
+            return best_index
+
+        pipe = Pipeline(steps=[('preprocessor', self.col_trans),
+                               ('classifier', clfs[0])])
+        grid_search = GridSearchCV(pipe,
+                                   param_grid=grids,
+                                   cv=list(self.skf.split(self.X_train, self.y_train)),
+                                   scoring='f1_macro',
+                                   n_jobs=n_jobs,
+                                   refit=select_best)
+        with parallel_backend(backend):
+            grid_search.fit(self.X_train, self.y_train)
+        record_cv_results(clfs[0], grid_search.cv_results_, len(self.y_train))
+
+        clf_index = int(np.searchsorted(grid_starts, grid_search.best_index_, side='right')) - 1
+        return grid_search, list(clf_results), clf_index
+
+    @profiled('model_builder.evaluate_on_holdout',
+              rows=lambda self, clf, holdout_set=None: len(self.y_holdout if holdout_set is None else holdout_set[1]))
     def evaluate_on_holdout(self, clf, holdout_set=None) -> float:
         # Evaluate how the model performs on a holdout set.
         if holdout_set is None:
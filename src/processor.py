@@ -1,76 +1,286 @@
+import hashlib
+import inspect
+import json
 from operator import index
-from typing import List
+from typing import List, Dict, Iterable, Iterator, Tuple
 
+import numpy
 import pandas
-from pandas import DataFrame
-import spacy
+from pandas import DataFrame, CategoricalDtype, Series
+from spacy.attrs import LEMMA, IS_PUNCT, IS_DIGIT, IS_STOP
 from spacy.tokens.doc import Doc
+from spacy.util import minibatch
 
+from src.cache import TitleCache, get_model_id, make_key
+from src.content import ContentStore, cap_texts, iter_token_ids, max_content_chars
+from src.profiling import profiled, timed_iter
+from src.registry import UNUSED_COMPONENTS, get_model
+from src.vectors import VectorArray
 
-def get_processed_tokens(doc: Doc):
+
+# Categories with fewer examples are merged into "other".
+min_category_count = 10
+
+
+def normalize_categories(values: Series) -> Series:
+    # Lower case categories, with missing values as "unknown".
+    # Making bold assumption that category 'XYZ' is the same as category 'xyz' or 'xYz'.
+    if isinstance(values.dtype, CategoricalDtype):
+        # Categoricals (e.g. from Loader.load_data_in_chunks) do not accept new values such as "unknown".
+        values = values.astype(object)
+    return values.fillna("unknown").str.lower()
+
+
+def save_state(state: Dict, filepath: str):
+    # Save a processor state (see Processor.get_state) as json.
+    with open(filepath, 'w') as f:
+        json.dump(state, f)
+
+
+def load_state(filepath: str) -> Dict:
+    with open(filepath) as f:
+        return json.load(f)
+
+
+def get_processed_tokens_many(docs: List[Doc]) -> List[str]:
     # Replace with lemmatized tokens and remove punctuation, stop words, and digits.
-    processed = [token.lemma_ for token in doc if not (token.is_punct | token.is_digit | token.is_stop)]
-    return ' '.join(processed)
+    # Token attributes are read as arrays (instead of creating a Token object per token), the tokens to keep are
+    # selected over all docs at once, and each distinct lemma is looked up in the string store once.
+    if not docs:
+        return []
+    arrays = [doc.to_array([LEMMA, IS_PUNCT, IS_DIGIT, IS_STOP]) for doc in docs]
+    attrs = numpy.concatenate(arrays)
+    keep = (attrs[:, 1] | attrs[:, 2] | attrs[:, 3]) == 0
+
+    # Number of kept tokens up to the end of each doc.
+    kept_ends = numpy.concatenate([[0], numpy.cumsum(keep)])[numpy.cumsum([len(a) for a in arrays])].tolist()
+
+    lemma_ids, inverse = numpy.unique(attrs[keep, 0], return_inverse=True)
+    strings = docs[0].vocab.strings
+    lemmas = [strings[lemma_id] for lemma_id in lemma_ids.tolist()]
+    words = [lemmas[i] for i in inverse.tolist()]
+
+    processed = []
+    start = 0
+    for end in kept_ends:
+        processed.append(' '.join(words[start:end]))
+        start = end
+    return processed
+
+
+def get_processed_tokens(doc: Doc):
+    return get_processed_tokens_many([doc])[0]
+
+
+def get_parse_id() -> str:
+    # Version of the title parsing cached in TitleCache: a hash of the token filter, of how docs are turned into tokens
+    # and vectors, and of the spaCy components disabled, so cached titles are invalidated when any of them changes.
+    digest = hashlib.sha256()
+    digest.update(inspect.getsource(get_processed_tokens_many).encode('utf-8'))
+    digest.update(inspect.getsource(Processor.parse_docs).encode('utf-8'))
+    digest.update(repr(sorted(UNUSED_COMPONENTS)).encode('utf-8'))
+    return digest.hexdigest()
 
 
 class Processor:
     """Processor class."""
-    def __init__(self, df: DataFrame):
+    def __init__(self, df: DataFrame, cache: TitleCache = None, model_name: str = 'en_core_web_md',
+                 n_process: int = 1, batch_size: int = 1000, state: Dict = None, vector_dtype: str = 'float32',
+                 keep_title_vectors: bool = True):
         self.df = df
+        self.cache = cache
+        self.model_name = model_name
+        self.n_process = n_process
+        self.batch_size = batch_size
+        # Title vectors are stored as float32 (as computed by spaCy), or float16 to halve their memory.
+        self.vector_dtype = numpy.dtype(vector_dtype)
+        # Document vectors of the titles parsed by preprocess_title, used by create_title_vector (not kept when only the
+        # tokens are used, e.g. for tf-idf).
+        self.keep_title_vectors = keep_title_vectors
+        self.title_vectors = None
+        # Training-time state (frequency table and categories kept for each categorical, and earliest date of each date
+        # column). Without a state, it is computed from df by the preprocessing steps (or by fit) and can be saved with
+        # the model (see get_state); with a state, new data is processed exactly as the training data was.
+        self.fixed_state = state is not None
+        if state is None:
+            state = {'category_levels': {}, 'date_baselines': {}}
+        self.category_levels = {k: set(v) for k, v in state['category_levels'].items()}
+        self.category_counts = {k: dict(v) for k, v in state.get('category_counts', {}).items()}
+        for col_name, levels in self.category_levels.items():
+            # States saved without frequency tables: the categories kept count as seen min_category_count times.
+            self.category_counts.setdefault(col_name, {value: min_category_count for value in levels})
+        self.date_baselines = {k: pandas.Timestamp(v) for k, v in state['date_baselines'].items()}
+
+    def get_state(self) -> Dict:
+        # Json-serializable training-time state, to be saved with the model.
+        return {'category_levels': {k: sorted(v) for k, v in self.category_levels.items()},
+                'category_counts': {k: dict(sorted(v.items())) for k, v in self.category_counts.items()},
+                'date_baselines': {k: v.isoformat() for k, v in self.date_baselines.items()}}
+
+    def update_category_counts(self, col_name: str, values: Series, incremental: bool = False):
+        # Frequency table of a categorical (normalized values), and the categories kept.
+        table = dict(self.category_counts.get(col_name, {})) if incremental else {}
+        counts = values.value_counts()
+        for value, count in zip(counts.index, counts.values):
+            table[value] = table.get(value, 0) + int(count)
+        self.category_counts[col_name] = table
+        self.category_levels[col_name] = {value for value, count in table.items() if count >= min_category_count}
+
+    def update_date_baseline(self, col_name: str, dates: Series, incremental: bool = False):
+        # Earliest date of a date column.
+        baseline = dates.min()
+        previous = self.date_baselines.get(col_name) if incremental else None
+        if previous is not None and (pandas.isna(baseline) or previous < baseline):
+            baseline = previous
+        self.date_baselines[col_name] = baseline
+
+    @profiled('processor.fit', rows=lambda self, *_: len(self.df))
+    def fit(self, cat_columns: List[str], date_columns: List[str], incremental: bool = False):
+        # Compute the state from df, without processing it. With incremental, df is a new batch of data: its counts are
+        # added to the current frequency tables and baselines only move to earlier dates, so the state of the complete
+        # history is updated in O(batch). The state is then fixed: the preprocessing steps apply it as is.
+        for col_name in cat_columns:
+            self.update_category_counts(col_name, normalize_categories(self.df[col_name]), incremental)
+        for col_name in date_columns:
+            self.update_date_baseline(col_name, self.df[col_name].astype('datetime64[ns]'), incremental)
+        self.fixed_state = True
+        return self
+
+    @profiled('processor.transform', rows=lambda self, *_: len(self.df))
+    def transform(self, cat_columns: List[str], date_columns: List[str], region_columns: List[str]) -> DataFrame:
+        # Preprocess titles, categoricals, dates and regions of df. Without a fixed state (from the constructor or fit),
+        # the state is computed from df along the way, i.e., fit and transform in one go.
+        self.preprocess_title()
+        self.preprocess_categorical_column(cat_columns)
+        self.create_day_diff_variable(date_columns)
+        self.create_number_regions(region_columns)
+        return self.df
+
+    def pipe(self, texts):
+        # Stream texts through the shared spaCy model, optionally spread over multiple processes (order is kept).
+        nlp = get_model(self.model_name)
+        return timed_iter('spacy.pipe', nlp.pipe(texts, n_process=self.n_process, batch_size=self.batch_size))
+
+    def parse_docs(self, texts: Iterable[str]) -> Iterator[Tuple[str, numpy.ndarray]]:
+        # Processed tokens and document vector of each text, with tokens processed a batch of docs at a time.
+        for docs in minibatch(self.pipe(texts), self.batch_size):
+            yield from zip(get_processed_tokens_many(docs), [doc.vector for doc in docs])
+
+    def iter_parsed(self, texts: List[str]) -> Iterator[Tuple[str, numpy.ndarray]]:
+        # Run texts through spaCy, yielding the processed tokens and document vector of each text (in order).
+        # When a cache is set, only texts missing from it are parsed (the model is not even loaded on a full hit).
+        if self.cache is None:
+            yield from self.parse_docs(texts)
+            return
+
+        model_id, parse_id = get_model_id(self.model_name), get_parse_id()
+        keys = [make_key(text, model_id, parse_id) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            entries = []
+            for key, (tokens, vector) in zip(missing.keys(), self.parse_docs(missing.values())):
+                entries.append((key, tokens, vector))
+            self.cache.put_many(entries)
+            found.update({key: (tokens, vector) for key, tokens, vector in entries})
+
+        for key in keys:
+            yield found[key]
 
     def replace_snopes_titles(self):
         # Snopes titles contain class information, must be replaced with respective source titles.
-        self.df.title[self.df.verifiedby == 'snopes'] = self.df.source_title
+        self.df['title'] = self.df['title'].mask(self.df['verifiedby'] == 'snopes', self.df['source_title'])
 
+    @profiled('processor.preprocess_title', rows=lambda self, *_: len(self.df))
     def preprocess_title(self):
         # Preprocess title column.
         self.replace_snopes_titles()
 
-        titles = self.df['title'].tolist()
-        titles = [title.lower().strip() for title in titles]
-
-        nlp = spacy.load('en_core_web_md')
+        # Python string methods (object dtype), so titles are normalized the same whatever the string storage. Missing
+        # titles (also snopes titles without a source title) are empty.
+        titles = self.df['title'].astype(object).fillna('').str.lower().str.strip().tolist()
 
+        # Tokens and vectors come from the same parse (or cache entry), so emb mode does not parse the titles again.
         processed_titles = []
-        for text in nlp.pipe(titles):
-            processed_titles.append(get_processed_tokens(text))
+        if self.keep_title_vectors:
+            def iter_vectors():
+                for tokens, vector in self.iter_parsed(titles):
+                    processed_titles.append(tokens)
+                    yield vector
+            self.title_vectors = self.stack_vectors(iter_vectors(), len(titles))
+        else:
+            processed_titles = [tokens for tokens, _ in self.iter_parsed(titles)]
 
         self.df['title'] = processed_titles
 
+    @profiled('processor.preprocess_categorical_column', rows=lambda self, *_: len(self.df))
     def preprocess_categorical_column(self, col_names: index):
         # Columns to be treated as categoricals have all categories with less than 10 examples merged.
-        # Making bold assumption that category 'XYZ' is the same as category 'xyz' or 'xYz'.
         for col_name in col_names:
-            self.df[col_name] = self.df[col_name].fillna("unknown")
-            self.df[col_name] = self.df[col_name].str.lower()
-            self.df.loc[self.df[col_name].value_counts()[self.df[col_name]].values < 10, col_name] = "other"
+            self.df[col_name] = normalize_categories(self.df[col_name])
+            if not self.fixed_state:
+                self.update_category_counts(col_name, self.df[col_name])
+            self.df.loc[~self.df[col_name].isin(self.category_levels[col_name]), col_name] = "other"
 
             processed_col = self.df[col_name].astype('category')
             self.df[col_name] = processed_col
 
+    @profiled('processor.create_day_diff_variable', rows=lambda self, *_: len(self.df))
     def create_day_diff_variable(self, col_names: List[str]):
         # Create new time variable counting the number of days from earliest date.
         for col_name in col_names:
             self.df[col_name] = self.df[col_name].astype('datetime64[ns]')
-            self.df[col_name + '_day_diff'] = (self.df[col_name] - self.df[col_name].min()).dt.days
+            if not self.fixed_state:
+                self.update_date_baseline(col_name, self.df[col_name])
+            self.df[col_name + '_day_diff'] = (self.df[col_name] - self.date_baselines[col_name]).dt.days
 
+    @profiled('processor.create_number_regions', rows=lambda self, *_: len(self.df))
     def create_number_regions(self, col_names: List[str]):
         # New numeric variable to count the number of regions where article was published.
         self.df['number_regions_published'] = len(col_names) - self.df[col_names].isna().sum(axis=1)
 
+    def stack_vectors(self, vectors: Iterable[numpy.ndarray], n_titles: int) -> numpy.ndarray:
+        # Vectors written in place into one preallocated (n_titles, vector size) matrix as they are produced.
+        block = numpy.zeros((n_titles, 0), dtype=self.vector_dtype)
+        for i, vector in enumerate(vectors):
+            if i == 0:
+                block = numpy.empty((n_titles, len(vector)), dtype=self.vector_dtype)
+            block[i] = vector
+        return block
+
+    @profiled('processor.create_title_vector', rows=lambda self, *_: len(self.df))
     def create_title_vector(self):
         # Vector representation for the title: each title vector is the average of individual word embeddings.
-        titles = self.df['title'].tolist()
+        # The vectors of the titles parsed by preprocess_title are used; titles are only parsed here when they were not
+        # preprocessed (or their vectors not kept). The (n_titles, vector size) block is kept in self.title_vectors, and
+        # is the storage of the title_vector column (see vectors.VectorArray), not copied into one column per component.
+        if self.title_vectors is None or len(self.title_vectors) != len(self.df):
+            parsed = self.iter_parsed(self.df['title'].tolist())
+            self.title_vectors = self.stack_vectors((vector for _, vector in parsed), len(self.df))
 
-        nlp = spacy.load('en_core_web_md')
+        self.df.reset_index(drop=True, inplace=True)
+        self.df['title_vector'] = Series(VectorArray(self.title_vectors), index=self.df.index, copy=False)
 
-        processed_titles = []
-        for doc in nlp.pipe(titles):
-            title_vector = doc.vector
-            processed_titles.append(title_vector)
-        new_df = DataFrame(processed_titles)
-        new_df.columns = ['doc_vec_' + str(i) for i in range(new_df.shape[1])]
+    @profiled('processor.create_content_ids', rows=lambda self, *_: len(self.df))
+    def create_content_ids(self, max_chars: int = max_content_chars, store: ContentStore = None):
+        # Replace content_text with content_ids, the token ids of each text (truncated to max_chars characters), to be
+        # used as a hashed bag of words (see content.ContentVectorizer). With a store, ids are written to disk as texts
+        # are tokenized, and the column holds views of the memory-mapped store instead of arrays in memory. A store that
+        # already exists (e.g. written by an earlier run, in a folder keyed by the texts, see main.get_fingerprints) is
+        # reused if it has one entry per row.
+        ids = store.read() if store is not None and store.exists() else None
+        if ids is None or len(ids) != len(self.df):
+            token_ids = iter_token_ids(cap_texts(self.df['content_text'], max_chars), self.model_name, self.n_process,
+                                       self.batch_size)
+            if store is None:
+                ids = list(token_ids)
+            else:
+                store.write(token_ids)
+                ids = store.read()
 
-        self.df.reset_index(drop=True, inplace=True)
-        new_df.reset_index(drop=True, inplace=True)
-        self.df = pandas.concat([self.df, new_df], axis=1)
+        self.df = self.df.drop(columns=['content_text'])
+        self.df['content_ids'] = Series(ids, index=self.df.index, dtype=object)
@@ -0,0 +1,221 @@
+import cProfile
+import functools
+import json
+import platform
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List
+
+try:
+    import resource
+except ImportError:  # not available on Windows, memory is then not reported
+    resource = None
+
+
+def get_peak_rss_mb(who: str = 'self') -> float:
+    # Peak resident set size of this process (or of its terminated child processes, e.g. joblib workers), in MB.
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return round(usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class RunReport:
+    """Stage timings, memory and classifier fit times of a workflow run, written as a json report."""
+
+    def __init__(self, command: str = None, cprofile: bool = False):
+        self.command = command
+        self.started = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.stages = {}
+        # Stages are nested per thread (see scheduler.Scheduler), and recorded from any thread.
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.fits = []
+        self.profile = cProfile.Profile() if cprofile else None
+        self.thread_profiles = []
+        if self.profile is not None:
+            self.profile.enable()
+
+    @property
+    def path(self) -> List[str]:
+        # Names of the stages the current thread is in.
+        if not hasattr(self.local, 'path'):
+            self.local.path = []
+        return self.local.path
+
+    def add_stage(self, name: str, wall: float, cpu: float, rows: int = None, rss_growth: float = None):
+        # Stages are identified by their path (e.g. workflow/processor.preprocess_title/spacy.pipe), and repeated calls
+        # (e.g. one per chunk or per classifier) are aggregated.
+        path = '/'.join(self.path + [name])
+        with self.lock:
+            entry = self.stages.setdefault(path, {'stage': path, 'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                                  'rows': None, 'peak_rss_mb': None, 'rss_growth_mb': 0.0})
+            entry['calls'] += 1
+            entry['wall_s'] += wall
+            entry['cpu_s'] += cpu
+            if rows is not None:
+                entry['rows'] = (entry['rows'] or 0) + rows
+            entry['peak_rss_mb'] = get_peak_rss_mb()
+            if rss_growth is not None:
+                entry['rss_growth_mb'] = round(entry['rss_growth_mb'] + rss_growth, 1)
+
+    def add_fit(self, classifier: str, params: Dict, fold: int, n_rows: int, fit_time: float, score_time: float,
+                score: float = None):
+        self.fits.append({'classifier': classifier, 'params': params, 'fold': fold, 'rows': n_rows,
+                          'fit_time_s': fit_time, 'score_time_s': score_time, 'score': score})
+
+    def get_classifier_summary(self) -> List[Dict]:
+        # Number of fits and total/mean fit and score times of each classifier.
+        summary = {}
+        for fit in self.fits:
+            entry = summary.setdefault(fit['classifier'], {'classifier': fit['classifier'], 'fits': 0,
+                                                           'fit_time_s': 0.0, 'score_time_s': 0.0})
+            entry['fits'] += 1
+            entry['fit_time_s'] += fit['fit_time_s']
+            entry['score_time_s'] += fit['score_time_s']
+        for entry in summary.values():
+            entry['mean_fit_time_s'] = entry['fit_time_s'] / entry['fits']
+            entry['mean_score_time_s'] = entry['score_time_s'] / entry['fits']
+        return list(summary.values())
+
+    def to_dict(self) -> Dict:
+        return {'command': self.command,
+                'started': self.started,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'wall_s': time.perf_counter() - self.start_wall,
+                'cpu_s': time.process_time() - self.start_cpu,
+                'peak_rss_mb': get_peak_rss_mb(),
+                'peak_rss_children_mb': get_peak_rss_mb('children'),
+                'stages': list(self.stages.values()),
+                'classifiers': self.get_classifier_summary(),
+                'fits': self.fits}
+
+    def save(self, filepath: str, cprofile_filepath: str = None):
+        # Write the json report (and the cProfile stats of the run, if profiled).
+        filepath = Path(filepath)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        if self.profile is not None:
+            self.profile.disable()
+            stats = pstats.Stats(self.profile)
+            for profile in self.thread_profiles:
+                stats.add(profile)
+            stats.dump_stats(cprofile_filepath or filepath.with_suffix('.prof'))
+
+
+# Report of the current run (None when the run is not instrumented, and then the hooks below do nothing).
+current_report = None
+
+
+def start_report(command: str = None, cprofile: bool = False) -> RunReport:
+    global current_report
+    current_report = RunReport(command, cprofile)
+    return current_report
+
+
+def finish_report(filepath: str = None, cprofile_filepath: str = None) -> RunReport:
+    # Stop recording, and save the report if a file is given.
+    global current_report
+    report, current_report = current_report, None
+    if filepath is not None:
+        report.save(filepath, cprofile_filepath)
+    elif report.profile is not None:
+        report.profile.disable()
+    return report
+
+
+@contextmanager
+def stage(name: str, rows: int = None) -> Iterator[Dict]:
+    # Time a stage of the run (wall and CPU time, growth of the peak RSS). The yielded dict can be used to set the
+    # number of rows processed once it is known.
+    metrics = {'rows': rows}
+    if current_report is None:
+        yield metrics
+        return
+    report = current_report
+    start_peak = get_peak_rss_mb()
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    report.path.append(name)
+    try:
+        yield metrics
+    finally:
+        report.path.pop()
+        end_peak = get_peak_rss_mb()
+        report.add_stage(name, time.perf_counter() - start_wall, time.process_time() - start_cpu, metrics['rows'],
+                         None if start_peak is None else end_peak - start_peak)
+
+
+@contextmanager
+def thread_profile():
+    # cProfile only profiles the thread it was enabled in: work run on other threads (see scheduler.Scheduler) is
+    # profiled separately, and merged into the stats of the run when the report is saved.
+    report = current_report
+    if report is None or report.profile is None:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        with report.lock:
+            report.thread_profiles.append(profile)
+
+
+def profiled(name: str, rows: Callable = None):
+    # Decorator timing each call of a function or method as a stage; rows(*args) gives the rows processed, e.g.
+    # rows=lambda self, *_: len(self.df) for methods of classes holding a DataFrame.
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if current_report is None:
+                return func(*args, **kwargs)
+            with stage(name) as metrics:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    metrics['rows'] = rows(*args)
+            return result
+        return wrapper
+    return decorator
+
+
+def timed_iter(name: str, iterable: Iterable) -> Iterator:
+    # Iterate while timing the time spent producing the items (e.g. spaCy's nlp.pipe), recorded as one stage call,
+    # with the number of items as rows.
+    if current_report is None:
+        yield from iterable
+        return
+    report = current_report
+    wall, cpu, n_items = 0.0, 0.0, 0
+    iterator = iter(iterable)
+    try:
+        while True:
+            start_wall, start_cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                wall += time.perf_counter() - start_wall
+                cpu += time.process_time() - start_cpu
+            n_items += 1
+            yield item
+    finally:
+        report.add_stage(name, wall, cpu, n_items)
+
+
+def record_fit(classifier: str, params: Dict, fold: int, n_rows: int, fit_time: float, score_time: float,
+               score: float = None):
+    # Fit and score time of a classifier (by name) on a fold.
+    if current_report is not None:
+        current_report.add_fit(classifier, params, fold, n_rows, fit_time, score_time, score)
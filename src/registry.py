@@ -0,0 +1,23 @@
+from typing import Dict, Tuple
+
+import spacy
+from spacy.language import Language
+
+# Components of the spaCy English pipelines that title processing never uses: lemmas, stop words, punctuation and
+# digit flags, and Doc.vector only need the tokenizer, tagger, attribute ruler and lemmatizer.
+UNUSED_COMPONENTS = ('parser', 'ner')
+
+_models: Dict[Tuple[str, Tuple[str, ...]], Language] = {}
+
+
+def get_model(model_name: str, disable: Tuple[str, ...] = UNUSED_COMPONENTS) -> Language:
+    # Load each spaCy model (with the given components disabled) only once per process.
+    key = (model_name, tuple(sorted(disable)))
+    if key not in _models:
+        _models[key] = spacy.load(model_name, disable=list(disable))
+    return _models[key]
+
+
+def clear_models():
+    # Drop all loaded models (e.g. to free memory once preprocessing is done).
+    _models.clear()
@@ -0,0 +1,45 @@
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+
+class ResultsStore:
+    """Disk-backed store of cross-validation fold results, keyed by data, preprocessor, classifier and fold."""
+
+    def __init__(self, filepath: str):
+        self.filepath = Path(filepath)
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.filepath))
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results '
+                          '(key TEXT PRIMARY KEY, data_fingerprint TEXT, preprocessor TEXT, classifier TEXT, '
+                          'params TEXT, fold INTEGER, n_rows INTEGER, score REAL, fit_time REAL, score_time REAL)')
+        self.conn.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Tuple[float, float, float]]:
+        # Look up (score, fit time, score time) of fold results. Failed fits are stored with a nan score.
+        keys = list(set(keys))
+        found = {}
+        batch_size = 500
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            query = 'SELECT key, score, fit_time, score_time FROM results WHERE key IN ({})'.format(
+                ','.join('?' * len(batch)))
+            for key, score, fit_time, score_time in self.conn.execute(query, batch):
+                found[key] = (np.nan if score is None else score, fit_time, score_time)
+        return found
+
+    def put_many(self, entries: List[Tuple]):
+        # Store (key, data fingerprint, preprocessor, classifier, params, fold, number of rows, score, fit time,
+        # score time) entries, and commit them right away so an interrupted search can be resumed.
+        rows = [entry[:7] + (None if np.isnan(entry[7]) else float(entry[7]), float(entry[8]), float(entry[9]))
+                for entry in entries]
+        self.conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,132 @@
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, TextIO
+
+from src.profiling import stage, thread_profile
+
+
+class StageOutput:
+    """Output stream prefixing each line printed by a stage with its name, so lines of concurrent stages can be told
+    apart. Lines are written whole, and output of other threads is passed through. Everything else is delegated to the
+    wrapped stream."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def set_prefix(self, prefix: str = None):
+        self.flush_line()
+        self.local.prefix = prefix
+        self.local.line = ''
+
+    def write(self, text: str) -> int:
+        if getattr(self.local, 'prefix', None) is None:
+            return self.stream.write(text)
+        lines = (self.local.line + text).split('\n')
+        self.local.line = lines.pop()
+        if lines:
+            with self.lock:
+                self.stream.write(''.join(self.local.prefix + line + '\n' for line in lines))
+        return len(text)
+
+    def flush_line(self):
+        # Write the last (unterminated) line of the current thread's stage.
+        if getattr(self.local, 'line', ''):
+            self.write('\n')
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name: str):
+        # Other attributes of a text stream (encoding, isatty, fileno...) are those of the wrapped stream, for code that
+        # inspects sys.stdout.
+        if name == 'stream':
+            raise AttributeError(name)
+        return getattr(self.stream, name)
+
+
+class Scheduler:
+    """Runs a graph of stages on a pool of threads, each stage as soon as the stages it depends on are done."""
+
+    def __init__(self, n_workers: int = 2):
+        self.n_workers = n_workers
+        self.funcs = {}
+        self.deps = {}
+        # Start and end of each stage (seconds since the start of run), to see which stages overlapped.
+        self.timings = {}
+
+    def add(self, name: str, func: Callable, deps: List[str] = ()) -> str:
+        # Add a stage: func is called with the results of deps (in order). Stages must be added after their deps, so
+        # the graph has no cycles.
+        if name in self.funcs:
+            raise ValueError('Stage {} was already added.'.format(name))
+        missing = [dep for dep in deps if dep not in self.funcs]
+        if missing:
+            raise ValueError('Stage {} depends on unknown stages: {}.'.format(name, ', '.join(missing)))
+        self.funcs[name] = func
+        self.deps[name] = list(deps)
+        return name
+
+    def get_dependents(self) -> Dict[str, List[str]]:
+        dependents = {name: [] for name in self.funcs}
+        for name, deps in self.deps.items():
+            for dep in deps:
+                dependents[dep].append(name)
+        return dependents
+
+    def run_stage(self, name: str, args: List, start: float) -> Any:
+        # Stages are recorded in the run report as top-level stages (nesting is per thread, see profiling.RunReport).
+        # Lines printed by the stage are prefixed with its name.
+        begin = time.perf_counter() - start
+        if isinstance(sys.stdout, StageOutput):
+            sys.stdout.set_prefix('[{}] '.format(name))
+        try:
+            with thread_profile(), stage(name):
+                result = self.funcs[name](*args)
+        finally:
+            if isinstance(sys.stdout, StageOutput):
+                sys.stdout.set_prefix(None)
+        self.timings[name] = {'deps': self.deps[name], 'start_s': begin, 'end_s': time.perf_counter() - start}
+        return result
+
+    def run(self) -> Dict[str, Any]:
+        # Run all stages, and return the results of the stages no other stage depends on. Results of the other stages
+        # are released once all their dependents are done, so e.g. intermediate DataFrames are not kept until the end.
+        # If a stage fails, stages not started yet are cancelled and the exception is raised once running ones end.
+        dependents = self.get_dependents()
+        n_waiting = {name: len(dependents[name]) for name in self.funcs}
+        results = {}
+        pending = set(self.funcs)
+        running: Dict[Future, str] = {}
+        start = time.perf_counter()
+
+        stdout, sys.stdout = sys.stdout, StageOutput(sys.stdout)
+        try:
+            with ThreadPoolExecutor(max_workers=self.n_workers, thread_name_prefix='stage') as executor:
+                while pending or running:
+                    for name in [name for name in self.funcs if name in pending]:
+                        if all(dep in results for dep in self.deps[name]):
+                            pending.discard(name)
+                            args = [results[dep] for dep in self.deps[name]]
+                            running[executor.submit(self.run_stage, name, args, start)] = name
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        if future.exception() is not None:
+                            for other in running:
+                                other.cancel()
+                            wait(running)
+                            raise future.exception()
+                        results[name] = future.result()
+                        for dep in self.deps[name]:
+                            n_waiting[dep] -= 1
+                            if n_waiting[dep] == 0:
+                                results.pop(dep)
+        finally:
+            sys.stdout = stdout
+
+        return results
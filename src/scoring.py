@@ -0,0 +1,133 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from pandas import DataFrame
+
+from src.artifacts import load_model
+from src.content import max_content_chars
+from src.loader import Loader
+from src.processor import Processor
+from src.registry import get_model
+
+# Raw columns used to build the predictors of a saved model.
+record_columns = ['verifiedby', 'title', 'published_date', 'country1', 'country2', 'country3', 'country4',
+                  'ref_source', 'source_title', 'lang', 'content_text']
+
+
+class Scorer:
+    """Applies the training-time preprocessing and a saved model to raw article records."""
+
+    def __init__(self, contents: Dict, model_name: str = 'en_core_web_md', batch_size: int = 1000):
+        if contents.get('Processor state') is None:
+            raise ValueError('The model was saved without a processor state (e.g. a .pkl saved by an earlier version, '
+                             'which can only be used with show), so new data cannot be processed as the training data '
+                             'was. Rerun the workflow to save a new model.')
+        self.pipeline = contents['Model details']
+        self.predictors = contents['Predictor names']
+        self.state = contents['Processor state']
+        self.model_name = model_name
+        self.batch_size = batch_size
+
+        # Load the spaCy model up front, so the first request does not pay for it.
+        get_model(self.model_name)
+
+    def prepare(self, df: DataFrame) -> DataFrame:
+        # Process raw records with the same steps (and training-time state) as in the workflow.
+        df = df.reindex(columns=record_columns)
+        processor = Processor(df, model_name=self.model_name, batch_size=self.batch_size, state=self.state,
+                              keep_title_vectors=not self.predictors['use_tfidf_on_title'])
+        processor.transform(self.predictors['cat_columns'], ['published_date'],
+                            ['country1', 'country2', 'country3', 'country4'])
+        if not self.predictors['use_tfidf_on_title']:
+            processor.create_title_vector()
+            processor.df = processor.df.drop(['title'], axis=1)
+        if self.predictors.get('use_content'):
+            processor.create_content_ids(self.predictors.get('content_max_chars', max_content_chars))
+        else:
+            processor.df = processor.df.drop(['content_text'], axis=1)
+        df = processor.df.drop(['published_date', 'country2', 'country3', 'country4', 'source_title'], axis=1)
+        if hasattr(self.pipeline, 'feature_names_in_'):
+            features = list(self.pipeline.feature_names_in_)
+            if 'title_vector' in df.columns and 'title_vector' not in features:
+                # Models saved by earlier versions take one doc_vec_* column per vector component.
+                vector_columns = [c for c in features if c.startswith('doc_vec_')]
+                df = df.join(DataFrame(df['title_vector'].array.vectors, columns=vector_columns, index=df.index))
+            # Same column order as during training.
+            df = df[features]
+        return df
+
+    def predict(self, df: DataFrame) -> np.ndarray:
+        # Predicted class of each raw record.
+        if len(df) == 0:
+            return np.array([], dtype=object)
+        return self.pipeline.predict(self.prepare(df))
+
+    def predict_records(self, records: List[Dict]) -> List[str]:
+        # One prediction per record, also for records without any of the record columns.
+        return [str(p) for p in self.predict(DataFrame.from_records(records, columns=record_columns))]
+
+
+# Scorer of each worker process in predict_csv.
+worker_scorer = None
+
+
+def init_worker(contents: Dict, model_name: str, mdl_file: str = None):
+    global worker_scorer
+    if mdl_file is not None:
+        contents = load_model(mdl_file)
+    worker_scorer = Scorer(contents, model_name=model_name)
+
+
+def predict_chunk(df: DataFrame) -> np.ndarray:
+    return worker_scorer.predict(df)
+
+
+def write_predictions(df: DataFrame, predictions: np.ndarray, output_path: Path, first: bool):
+    # Append predictions of a chunk (indexed by input row number) to the output .csv.
+    DataFrame({'prediction': predictions}, index=df.index).to_csv(output_path, mode='w' if first else 'a',
+                                                                   header=first, index_label='row')
+
+
+def predict_csv(contents: Dict, input_path: str, output_path: str, chunksize: int = 10000,
+                n_workers: int = 1, model_name: str = 'en_core_web_md', mdl_file: str = None) -> int:
+    # Score a .csv with the original columns in chunks, writing predictions as each chunk is done, so memory is
+    # bounded by the chunk size. Categories and date baselines come from the training-time state saved with the model,
+    # never from the chunks. With n_workers > 1, chunks are scored on a pool of processes (each loading the model
+    # once), with at most two chunks per worker in flight, and predictions are still written in input order. When the
+    # saved model file is given, workers load it themselves (memory-mapping the arrays of model folders, so the pages
+    # are shared) instead of each receiving a pickled copy of the model.
+    output_path = Path(output_path)
+    chunks = Loader(input_path).iter_chunks(chunksize)
+    n_rows = 0
+
+    if n_workers <= 1:
+        scorer = Scorer(contents, model_name=model_name)
+        for i, chunk in enumerate(chunks):
+            write_predictions(chunk, scorer.predict(chunk), output_path, first=i == 0)
+            n_rows += len(chunk)
+        if n_rows == 0:
+            write_predictions(DataFrame(), np.array([]), output_path, first=True)
+        return n_rows
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker,
+                             initargs=(None if mdl_file else contents, model_name, mdl_file)) as executor:
+        in_flight = deque()
+        first = True
+        for chunk in chunks:
+            in_flight.append((chunk.index, executor.submit(predict_chunk, chunk)))
+            if len(in_flight) >= 2 * n_workers:
+                index, future = in_flight.popleft()
+                write_predictions(DataFrame(index=index), future.result(), output_path, first)
+                n_rows += len(index)
+                first = False
+        while in_flight:
+            index, future = in_flight.popleft()
+            write_predictions(DataFrame(index=index), future.result(), output_path, first)
+            n_rows += len(index)
+            first = False
+    if first:
+        write_predictions(DataFrame(), np.array([]), output_path, first=True)
+    return n_rows
@@ -0,0 +1,210 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Union
+
+import numpy as np
+from pandas import NaT, to_datetime
+
+from src.scoring import Scorer, record_columns
+
+
+class LatencyStats:
+    """Latency and throughput statistics of served requests (latencies kept for the most recent requests)."""
+
+    def __init__(self, max_samples: int = 10000):
+        self.latencies = deque(maxlen=max_samples)
+        self.batch_sizes = deque(maxlen=max_samples)
+        self.n_requests = 0
+        self.n_records = 0
+        self.start_time = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def add_batch(self, latencies: List[float], n_records: int):
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.batch_sizes.append(n_records)
+            self.n_requests += len(latencies)
+            self.n_records += n_records
+
+    def summary(self) -> Dict:
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            elapsed = time.perf_counter() - self.start_time
+            summary = {'requests': self.n_requests,
+                       'records': self.n_records,
+                       'requests_per_second': round(self.n_requests / elapsed, 2),
+                       'records_per_second': round(self.n_records / elapsed, 2),
+                       'mean_batch_size': round(float(np.mean(self.batch_sizes)), 2) if self.batch_sizes else 0}
+        if len(latencies):
+            for p in (50, 95, 99):
+                summary['p{}_latency_ms'.format(p)] = round(float(np.percentile(latencies, p)), 2)
+        return summary
+
+
+def check_records(records: Union[Dict, List]) -> List[Dict]:
+    # Records of a request body (a record or a list of records), with all record columns (missing ones as None) and
+    # values as strings, so a record cannot break the processing of the batch it is scored in. Raises ValueError for
+    # anything else than records of scalar values, and for records without a valid published_date (the day difference
+    # is a predictor of every model).
+    if isinstance(records, dict):
+        records = [records]
+    if not isinstance(records, list):
+        raise ValueError('Body must be a json record or list of records.')
+    checked = []
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise ValueError('Record {} is not a json object.'.format(i))
+        for col_name in record_columns:
+            if isinstance(record.get(col_name), (dict, list)):
+                raise ValueError('Record {} has a non-scalar {}.'.format(i, col_name))
+        checked.append({col_name: None if record.get(col_name) is None else str(record[col_name])
+                        for col_name in record_columns})
+        try:
+            published_date = to_datetime(checked[-1]['published_date'])
+        except (ValueError, OverflowError):
+            published_date = None
+        if published_date is None or published_date is NaT:
+            raise ValueError('Record {} has no valid published_date.'.format(i))
+    return checked
+
+
+class MicroBatcher:
+    """Groups concurrent scoring requests into single preprocessing and predict calls."""
+
+    def __init__(self, scorer: Scorer, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.scorer = scorer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = LatencyStats()
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, records: List[Dict]) -> Future:
+        # Queue records for scoring; the future resolves to their predictions.
+        future = Future()
+        self.requests.put((records, future, time.perf_counter()))
+        return future
+
+    def next_batch(self) -> List:
+        # Wait for a request, then collect more until the batch is full or max_wait has passed.
+        batch = [self.requests.get()]
+        n_records = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while n_records < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            n_records += len(request[0])
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            records = [record for request_records, _, _ in batch for record in request_records]
+            try:
+                predictions = self.scorer.predict_records(records)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # Score each request on its own, so only the requests that fail get an error.
+                predictions = None
+
+            start = 0
+            latencies = []
+            n_records = 0
+            for request_records, future, submitted in batch:
+                if predictions is not None:
+                    future.set_result(predictions[start:start + len(request_records)])
+                    start += len(request_records)
+                else:
+                    try:
+                        future.set_result(self.scorer.predict_records(request_records))
+                    except Exception as e:
+                        future.set_exception(e)
+                        continue
+                latencies.append(time.perf_counter() - submitted)
+                n_records += len(request_records)
+            self.stats.add_batch(latencies, n_records)
+
+
+def make_handler(batcher: MicroBatcher):
+
+    class Handler(BaseHTTPRequestHandler):
+        """POST /predict with a record (or list of records) as json; GET /stats for latency/throughput stats."""
+
+        def send_json(self, status: int, body: Dict):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self.send_json(200, batcher.stats.summary())
+            else:
+                self.send_json(404, {'error': 'Unknown path.'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self.send_json(404, {'error': 'Unknown path.'})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            except ValueError:
+                self.send_json(400, {'error': 'Body must be a json record or list of records.'})
+                return
+            try:
+                records = check_records(body)
+            except ValueError as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            if not records:
+                self.send_json(200, {'predictions': []})
+                return
+            try:
+                predictions = batcher.submit(records).result()
+            except Exception as e:
+                self.send_json(500, {'error': repr(e)})
+                return
+            self.send_json(200, {'predictions': predictions})
+
+        def log_message(self, format, *args):
+            # Keep the console quiet, stats are available at /stats.
+            pass
+
+    return Handler
+
+
+class Server(ThreadingHTTPServer):
+    """Threaded http server with a larger backlog, so bursts of concurrent clients are not refused."""
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(contents: Dict, host: str = '127.0.0.1', port: int = 8000, max_batch_size: int = 64,
+          max_wait_ms: float = 5.0):
+    # Serve predictions of a saved model over http until interrupted.
+    batcher = MicroBatcher(Scorer(contents), max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    server = Server((host, port), make_handler(batcher))
+    print('Serving predictions on http://{}:{}/predict (stats on /stats)...'.format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(batcher.stats.summary()))
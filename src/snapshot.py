@@ -0,0 +1,108 @@
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+from pandas import DataFrame, CategoricalDtype, Categorical, Index, Series
+from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype, is_bool_dtype
+
+from src.cache import get_model_id
+from src.content import ContentStore
+from src.vectors import VectorArray, VectorDtype
+
+# Source files of the processing steps: any change to them invalidates existing snapshots. main.py holds the steps run
+# and the columns kept (transform_data, finish_processing), registry.py the spaCy components used, and cache.py the
+# model id of cached titles.
+source_folder = Path(__file__).parent
+processing_sources = [source_folder / 'loader.py', source_folder / 'processor.py', source_folder / 'content.py',
+                      source_folder / 'vectors.py', source_folder / 'registry.py', source_folder / 'cache.py',
+                      source_folder.parent / 'main.py']
+
+
+def get_fingerprint(filepath: str, params: Dict, model_name: str = None) -> str:
+    # Fingerprint of the input file contents, the processing parameters and the processing code, and of the spaCy model
+    # (name and version, see cache.get_model_id) if given, so upgrading the model invalidates processed data.
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    if model_name is not None:
+        params = dict(params, spacy_model=get_model_id(model_name))
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    for source in processing_sources:
+        digest.update(source.read_bytes())
+    return digest.hexdigest()
+
+
+def save_snapshot(df: DataFrame, folder: str, state: Dict = None):
+    # Save a processed DataFrame as one .npy file per column (the title_vector column as one (n_rows, vector size)
+    # block, in its float32 or float16 dtype), plus a json file with column order, dtypes and the (json-serializable)
+    # processor state. Written to a temporary folder first, so a snapshot is never partial.
+    folder = Path(folder)
+    tmp_folder = folder.with_name(folder.name + '.tmp')
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    tmp_folder.mkdir(parents=True)
+
+    columns = []
+    for i, col_name in enumerate(df.columns):
+        col = df[col_name]
+        col_file = 'col_{}.npy'.format(i)
+        if isinstance(col.dtype, CategoricalDtype):
+            columns.append({'name': col_name, 'kind': 'category', 'file': col_file,
+                            'categories': col.cat.categories.tolist()})
+            np.save(tmp_folder / col_file, col.cat.codes.to_numpy())
+        elif is_numeric_dtype(col.dtype) or is_bool_dtype(col.dtype) or is_datetime64_any_dtype(col.dtype):
+            columns.append({'name': col_name, 'kind': 'numeric', 'file': col_file})
+            np.save(tmp_folder / col_file, col.to_numpy())
+        elif isinstance(col.dtype, VectorDtype):
+            # Vector columns (title_vector) are stored as their block, and memory-mapped back in as the block of the
+            # column.
+            columns.append({'name': col_name, 'kind': 'vectors', 'file': col_file})
+            np.save(tmp_folder / col_file, col.array.vectors)
+        elif len(col) > 0 and isinstance(col.iloc[0], np.ndarray):
+            # Token id arrays (content_ids) are stored flat with their offsets, and memory-mapped back in.
+            columns.append({'name': col_name, 'kind': 'token_ids', 'file': 'col_{}'.format(i)})
+            ContentStore(tmp_folder / columns[-1]['file']).write(col)
+        else:
+            columns.append({'name': col_name, 'kind': 'object', 'file': col_file})
+            np.save(tmp_folder / col_file, col.to_numpy(dtype=object), allow_pickle=True)
+
+    np.save(tmp_folder / 'index.npy', df.index.to_numpy())
+
+    meta = {'columns': columns, 'column_order': [str(c) for c in df.columns], 'state': state}
+    with open(tmp_folder / 'meta.json', 'w') as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(folder, ignore_errors=True)
+    tmp_folder.rename(folder)
+
+
+def load_snapshot(folder: str) -> (DataFrame, Dict):
+    # Load a snapshot saved by save_snapshot, memory-mapping the numeric arrays, token ids and title vectors.
+    # Returns the DataFrame and the processor state.
+    folder = Path(folder)
+    with open(folder / 'meta.json') as f:
+        meta = json.load(f)
+
+    index = Index(np.load(folder / 'index.npy', allow_pickle=True))
+    data = {}
+    for col in meta['columns']:
+        if col['kind'] == 'object':
+            data[col['name']] = np.load(folder / col['file'], allow_pickle=True)
+        elif col['kind'] == 'vectors':
+            data[col['name']] = VectorArray(np.load(folder / col['file'], mmap_mode='r').view(np.ndarray))
+        elif col['kind'] == 'token_ids':
+            data[col['name']] = Series(ContentStore(folder / col['file']).read(), dtype=object).to_numpy()
+        elif col['kind'] == 'category':
+            codes = np.load(folder / col['file'])
+            data[col['name']] = Categorical.from_codes(codes, categories=col['categories'])
+        else:
+            data[col['name']] = np.load(folder / col['file'], mmap_mode='r').view(np.ndarray)
+    df = DataFrame(data, index=index, copy=False)
+    return df[meta['column_order']], meta['state']
+
+
+def has_snapshot(folder: str) -> bool:
+    return (Path(folder) / 'meta.json').exists()
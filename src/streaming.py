@@ -0,0 +1,197 @@
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+from pandas import DataFrame, isna
+from pandas.util import hash_pandas_object
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import confusion_matrix
+from sklearn.model_selection import ParameterGrid
+from sklearn.naive_bayes import MultinomialNB, ComplementNB
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, MinMaxScaler
+
+from src.cache import TitleCache
+from src.loader import Loader
+from src.model_builder import strip_prefix
+from src.processor import Processor
+from src.profiling import profiled, record_fit
+
+# Raw columns used by the streaming workflow.
+stream_columns = ['verifiedby', 'class', 'title', 'published_date', 'country1', 'country2', 'country3', 'country4',
+                  'ref_source', 'source_title', 'lang']
+region_columns = ['country1', 'country2', 'country3', 'country4']
+classes = np.array(['false', 'true'], dtype=object)
+
+
+def get_streaming_search_space() -> (List, List[Dict]):
+    # Classifiers that can be trained incrementally (partial_fit), and respective parameter grids.
+    clfs = [SGDClassifier(random_state=0),
+            MultinomialNB(),
+            ComplementNB()
+            ]
+    params_list = [{'classifier__loss': ['hinge', 'log_loss', 'modified_huber'],
+                    'classifier__alpha': [0.0001, 0.001, 0.01]},
+                   {'classifier__alpha': [0.1, 0.5, 1.0]},
+                   {'classifier__alpha': [0.1, 0.5, 1.0]}
+                   ]
+    return clfs, params_list
+
+
+def macro_f1(counts: np.ndarray) -> float:
+    # Macro-F1 from an accumulated confusion matrix (rows are true classes, columns predicted classes).
+    tp = np.diag(counts).astype(float)
+    denominator = counts.sum(axis=0) + counts.sum(axis=1)
+    f1 = np.divide(2 * tp, denominator, out=np.zeros_like(tp), where=denominator > 0)
+    return round(float(f1.mean()), 3)
+
+
+class StreamingTrainer:
+    """Trains partial_fit classifiers over chunks of the data set, without loading it in memory."""
+
+    def __init__(self, filepath: str, cat_columns: List[str], num_columns: List[str], chunksize: int = 10000,
+                 holdout_fraction: float = 0.2, validation_fraction: float = 0.2, n_features: int = 2 ** 18,
+                 cache: TitleCache = None, model_name: str = 'en_core_web_md', n_process: int = 1,
+                 batch_size: int = 1000):
+        self.loader = Loader(filepath)
+        self.cat_columns = cat_columns
+        self.num_columns = num_columns
+        self.chunksize = chunksize
+        self.holdout_fraction = holdout_fraction
+        self.validation_fraction = validation_fraction
+        self.n_features = n_features
+        self.cache = cache
+        self.model_name = model_name
+        self.n_process = n_process
+        self.batch_size = batch_size
+        self.rng = np.random.RandomState(0)
+
+        self.state = None
+        self.col_trans = None
+        self.n_rows = 0
+        self.class_counts = Counter()
+
+    def iter_chunks(self) -> Iterator[Tuple[DataFrame, np.ndarray]]:
+        # Cleaned chunks (see Loader.iter_clean_chunks), with the split of each row: 'train', 'validation' (to compare
+        # parameters) or 'holdout' (to evaluate the best model). Rows are assigned by a hash of their contents, so the
+        # split is the same in every pass, and each class is split in the same proportion (in expectation) without
+        # knowing the class counts in advance.
+        for chunk in self.loader.iter_clean_chunks(stream_columns, self.chunksize):
+            if len(chunk) == 0:
+                continue
+            buckets = hash_pandas_object(chunk, index=False).to_numpy() % 1000
+            split = np.full(len(chunk), 'train', dtype=object)
+            split[buckets < (self.holdout_fraction + self.validation_fraction) * 1000] = 'validation'
+            split[buckets < self.holdout_fraction * 1000] = 'holdout'
+            yield chunk, split
+
+    @profiled('streaming.collect_state', rows=lambda self: self.n_rows)
+    def collect_state(self) -> Dict:
+        # First pass: category counts, date range and number of regions over all rows (no title processing), giving the
+        # processor state (updated chunk by chunk with Processor.fit, the same as on the complete data set) and the
+        # preprocessor.
+        fitter = Processor(DataFrame())
+        max_date = None
+        min_regions, max_regions = len(region_columns), 0
+        for chunk, _ in self.iter_chunks():
+            self.n_rows += len(chunk)
+            self.class_counts.update(chunk['class'].astype(str))
+            fitter.df = chunk
+            fitter.fit(self.cat_columns, ['published_date'], incremental=True)
+            dates = chunk['published_date'].astype('datetime64[ns]')
+            if dates.notna().any():
+                max_date = dates.max() if max_date is None else max(max_date, dates.max())
+            regions = len(region_columns) - chunk[region_columns].isna().sum(axis=1)
+            min_regions, max_regions = min(min_regions, regions.min()), max(max_regions, regions.max())
+        self.state = fitter.get_state()
+        # Without any date (e.g. an all-missing date column), the day difference has an empty range.
+        min_date = fitter.date_baselines['published_date']
+        max_day_diff = 0 if max_date is None or isna(min_date) else (max_date - min_date).days
+
+        # Fit the preprocessor on a frame with the extreme values: the title bag of words is hashed (stateless), the
+        # one-hot categories are the kept levels (plus "other"), and the scaler gets the complete range of each column.
+        categories = [sorted(set(self.state['category_levels'][col_name]) | {'other'})
+                      for col_name in self.cat_columns]
+        ranges = {'number_regions_published': [min_regions, max_regions],
+                  'published_date_day_diff': [0, max_day_diff]}
+        extremes = DataFrame({'title': ['', '']})
+        for col_name, col_categories in zip(self.cat_columns, categories):
+            extremes[col_name] = col_categories[0]
+        for col_name in self.num_columns:
+            extremes[col_name] = ranges[col_name]
+        self.col_trans = ColumnTransformer(
+            [("bow", HashingVectorizer(n_features=self.n_features, alternate_sign=False), 'title'),
+             ("cat", OneHotEncoder(categories=categories, handle_unknown='ignore'), self.cat_columns),
+             ("num", MinMaxScaler(clip=True), self.num_columns)
+             ],
+            remainder='drop')
+        self.col_trans.fit(extremes)
+        return self.state
+
+    def process(self, chunk: DataFrame) -> DataFrame:
+        # Same processing steps (and state) as the in-memory workflow.
+        processor = Processor(chunk.copy(), cache=self.cache, model_name=self.model_name, n_process=self.n_process,
+                              batch_size=self.batch_size, state=self.state, keep_title_vectors=False)
+        return processor.transform(self.cat_columns, ['published_date'], region_columns)
+
+    def iter_features(self, split: str) -> Iterator[Tuple]:
+        # Transformed features and class of the rows of each chunk in a split ('train', 'validation' or 'holdout').
+        for chunk, chunk_split in self.iter_chunks():
+            chunk = chunk[chunk_split == split]
+            if len(chunk) == 0:
+                continue
+            df = self.process(chunk)
+            yield self.col_trans.transform(df), df['class'].astype(str).to_numpy()
+
+    @profiled('streaming.train')
+    def train(self, clfs: List, param_grids: List[Dict]) -> List[Dict]:
+        # Second pass: each chunk of training rows is transformed once and used by all parameter combinations of all
+        # classifiers (partial_fit). Third pass: combinations are compared by their macro-F1 on the validation rows,
+        # which none of the models was trained on (whatever the number of chunks).
+        if self.col_trans is None:
+            self.collect_state()
+        candidates = []
+        for clf, param_grid in zip(clfs, param_grids):
+            for params in ParameterGrid(param_grid):
+                candidates.append({'clf': clone(clf).set_params(**strip_prefix(params)), 'params': params,
+                                   'counts': np.zeros((len(classes), len(classes)), dtype=np.int64),
+                                   'n_rows': 0, 'fit_time': 0.0, 'score_time': 0.0})
+
+        for x, y in self.iter_features('train'):
+            order = self.rng.permutation(len(y))  # rows of a chunk are shuffled, files are often sorted
+            x, y = x[order], y[order]
+            for candidate in candidates:
+                start = time.perf_counter()
+                candidate['clf'].partial_fit(x, y, classes=classes)
+                candidate['fit_time'] += time.perf_counter() - start
+                candidate['n_rows'] += len(y)
+
+        for x, y in self.iter_features('validation'):
+            for candidate in candidates:
+                start = time.perf_counter()
+                candidate['counts'] += confusion_matrix(y, candidate['clf'].predict(x), labels=classes)
+                candidate['score_time'] += time.perf_counter() - start
+
+        for candidate in candidates:
+            candidate['score'] = macro_f1(candidate['counts'])
+            # Fit and score times over all chunks in the run report (see profiling), without a fold index.
+            record_fit(candidate['clf'].__class__.__name__, candidate['params'], None, candidate['n_rows'],
+                       candidate['fit_time'], candidate['score_time'], candidate['score'])
+        return candidates
+
+    @profiled('streaming.evaluate_on_holdout')
+    def evaluate_on_holdout(self, clfs: List) -> List[float]:
+        # Last pass: macro-F1 of trained classifiers on the holdout rows.
+        counts = [np.zeros((len(classes), len(classes)), dtype=np.int64) for _ in clfs]
+        for x, y in self.iter_features('holdout'):
+            for clf, clf_counts in zip(clfs, counts):
+                clf_counts += confusion_matrix(y, clf.predict(x), labels=classes)
+        return [macro_f1(clf_counts) for clf_counts in counts]
+
+    def get_pipeline(self, clf) -> Pipeline:
+        # Preprocessor and trained classifier, as a pipeline that takes processed records (see scoring.Scorer).
+        return Pipeline(steps=[('preprocessor', self.col_trans), ('classifier', clf)])
@@ -1,8 +1,8 @@
+import json
 import time
 from pathlib import Path
 from typing import List, Dict
 
-import joblib
 from pandas import DataFrame
 from sklearn.dummy import DummyClassifier
 from sklearn.linear_model import SGDClassifier
@@ -11,43 +11,40 @@ from sklearn.naive_bayes import MultinomialNB, ComplementNB
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.svm import SVC
 
-from src.model_builder import ModelBuilder
+from src.artifacts import data_folder, load_model, save_artifact
+from src.model_builder import ModelBuilder, get_clf_name, with_reduction
+from src.profiling import profiled
+from src.results_store import ResultsStore
+from src.streaming import StreamingTrainer, get_streaming_search_space
 import numpy as np
 
-data_folder = Path("data")
 
-
-def save_model(mdl_obj: object, mdl_predictors: Dict, best_score: float, test_score: float):
-    # Save sklearn model and predictors used to train it on a .pkl
+@profiled('save_model')
+def save_model(mdl_obj: object, mdl_predictors: Dict, best_score: float, test_score: float,
+               processor_state: Dict = None, best_params: Dict = None, data_fingerprint: str = None,
+               mdl_prefix: str = 'best_model') -> Path:
+    # Save sklearn model and predictors used to train it as a model folder (see artifacts.save_artifact).
+    # The processor state (see Processor.get_state) is needed to process new data for predictions.
     t = time.localtime()
     timestamp = time.strftime('%b-%d-%Y_%H%M', t)
-    file_name = ('best_model_' + timestamp + '.pkl')
-    mdl_file = data_folder / file_name
-
-    mdl_dict = {'Model details': mdl_obj,
-                'Predictor names': mdl_predictors,
-                'Best cv macro-F1': best_score,
-                'Macro-F1 on test set': test_score}
-
-    joblib.dump(mdl_dict, mdl_file)
-
-
-def load_model(mdl_file: str):
-    # Load previously saved model and predictors.
-    contents = joblib.load(data_folder / mdl_file)
-    return contents
+    mdl_folder = data_folder / (mdl_prefix + '_' + timestamp)
 
+    save_artifact(mdl_folder, mdl_obj, mdl_predictors, best_score, test_score, best_params=best_params,
+                  processor_state=processor_state, data_fingerprint=data_fingerprint)
+    return mdl_folder
 
-def benchmark(mb: ModelBuilder) -> (GridSearchCV, str, float, Dict[str, List[str]]):
-    # Call grid search for multiple classifiers and parameters.
-    # Print best score and parameter combination for each classifier.
-    # Return best model.
 
+def get_search_space(reduce: str = None, n_components: List[int] = (25, 50, 100),
+                     knn_algorithm: str = 'auto') -> (List, List[Dict]):
+    # Classifiers and respective parameter grids used in the benchmark.
+    # With reduce ('svd', 'random_projection' or 'pca', see model_builder.get_reducer), SVC and KNN, whose cost grows
+    # fastest with rows and dimensions, are fit on features reduced to each of n_components dimensions.
+    # knn_algorithm is the neighbor index of KNN ('ball_tree' and 'kd_tree' need dense, i.e. reduced, features).
     clfs = [MultinomialNB(),
             ComplementNB(),
             SGDClassifier(random_state=0),
             SVC(random_state=0),
-            KNeighborsClassifier()
+            KNeighborsClassifier(algorithm=knn_algorithm)
             ]
     params_list = [{'classifier__alpha': np.arange(0.1, 1.0, 0.05)},
                    {'classifier__alpha': np.arange(0.1, 1.0, 0.05)},
@@ -58,6 +55,75 @@ def benchmark(mb: ModelBuilder) -> (GridSearchCV, str, float, Dict[str, List[str
                    {'classifier__n_neighbors': [3, 5, 7], 'classifier__weights': ['uniform', 'distance'],
                     'classifier__p': [1, 2]}
                    ]
+    if reduce is not None:
+        for i in (3, 4):
+            clfs[i], params_list[i] = with_reduction(clfs[i], params_list[i], reduce, n_components)
+    return clfs, params_list
+
+
+def print_tradeoffs(clf, cv_results: Dict, candidates: List[int] = None):
+    # Macro-F1 against the mean fit and predict (scoring) time per fold, for the best parameters of a classifier, and
+    # for the best parameters at each target dimension of a reduced classifier.
+    if candidates is None:
+        candidates = range(len(cv_results['params']))
+    scores = np.nan_to_num(np.asarray(cv_results['mean_test_score'], dtype=float), nan=-np.inf)
+    best = {}
+    for i in candidates:
+        n_components = cv_results['params'][i].get('classifier__reduce__n_components')
+        if n_components not in best or scores[i] > scores[best[n_components]]:
+            best[n_components] = i
+    for n_components, i in sorted(best.items(), key=lambda item: -1 if item[0] is None else item[0]):
+        print("\t\t{}{}: macro-F1 {:.3f}, fit {:.3f} s, predict {:.3f} s per fold".format(
+            get_clf_name(clf), '' if n_components is None else ' (n_components=' + str(n_components) + ')',
+            cv_results['mean_test_score'][i], cv_results['mean_fit_time'][i], cv_results['mean_score_time'][i]))
+
+
+@profiled('benchmark', rows=lambda mb, *_: len(mb.y_train))
+def benchmark(mb: ModelBuilder, n_jobs: int = 1, backend: str = 'loky', cache_folds: bool = True,
+              search: str = 'grid', n_iter: int = 10, reduce: str = None, n_components: List[int] = (25, 50, 100),
+              knn_algorithm: str = 'auto') -> (GridSearchCV, str, float, Dict[str, List[str]]):
+    # Call grid search for multiple classifiers and parameters.
+    # Print best score and parameter combination for each classifier.
+    # Return best model.
+    # With n_jobs other than 1, all fits of all classifiers are run on a pool of n_jobs workers (-1 for all cores)
+    # using the given joblib backend, with the same results as the serial search.
+    # With cache_folds, the preprocessor is fit once per fold and shared by all classifiers and parameters, and the
+    # search can be 'grid', 'random' (n_iter combinations per classifier) or 'halving' (see do_cached_search).
+    # The macro-F1 of each classifier is printed with its fit and predict times (see print_tradeoffs), and with reduce
+    # SVC and KNN are fit on reduced features (see get_search_space).
+    clfs, params_list = get_search_space(reduce, n_components, knn_algorithm)
+
+    if cache_folds:
+        searches = mb.do_cached_search(clfs, params_list, n_jobs=n_jobs, backend=backend, search=search,
+                                       n_iter=n_iter)
+        best_score = 0
+        best_search = None
+        for clf, clf_search in zip(clfs, searches):
+            clf_score = round(clf_search.best_score_, 3)
+            print("\tBest score for", clf, " with parameters", clf_search.best_params_, ":", clf_score)
+            print_tradeoffs(clf, clf_search.cv_results_)
+            if clf_score > best_score:
+                best_score = clf_score
+                best_search = clf_search
+        if search != 'grid':
+            n_fits = sum(clf_search.n_fits_ for clf_search in searches)
+            n_full_fits = round(sum(clf_search.n_full_fits_ for clf_search in searches))
+            n_grid_fits = sum(clf_search.n_grid_fits_ for clf_search in searches)
+            print("\t" + search.capitalize(), "search used", n_fits, "fits, equivalent to", n_full_fits,
+                  "fits on complete folds, instead of", n_grid_fits, "(" + str(n_grid_fits - n_full_fits),
+                  "fits saved)")
+        best_search.refit(mb.col_trans, mb.X_train, mb.y_train)
+        return best_search, get_clf_name(best_search.estimator), best_score, best_search.best_params_
+
+    if n_jobs != 1:
+        grid_search, clf_results, best_index = mb.do_parallel_cv(clfs, params_list, n_jobs=n_jobs, backend=backend)
+        for clf, (clf_score, clf_params) in zip(clfs, clf_results):
+            print("\tBest score for", clf, " with parameters", clf_params, ":", clf_score)
+            print_tradeoffs(clf, grid_search.cv_results_,
+                            [i for i, params in enumerate(grid_search.cv_results_['params'])
+                             if params['classifier'] is clf])
+        best_score, best_params = clf_results[best_index]
+        return grid_search, get_clf_name(clfs[best_index]), best_score, best_params
 
     best_score = 0
     best_params = {}
@@ -66,32 +132,48 @@ def benchmark(mb: ModelBuilder) -> (GridSearchCV, str, float, Dict[str, List[str
     for i in range(len(clfs)):
         trained_clf, clf_score, clf_params = mb.do_cv(clfs[i], params_list[i])
         print("\tBest score for", clfs[i], " with parameters", clf_params, ":", clf_score)
+        print_tradeoffs(clfs[i], trained_clf.cv_results_)
         if clf_score > best_score:
             best_clf = trained_clf
             best_score = clf_score
             best_params = clf_params
-            best_clf_name = clfs[i].__class__.__name__
+            best_clf_name = get_clf_name(clfs[i])
 
     return best_clf, best_clf_name, best_score, best_params
 
 
 def grid_search_with_selected_preds(df: DataFrame, cat_columns: List[str], num_columns: List[str],
-                                    use_tfidf_on_text: bool):
+                                    use_tfidf_on_text: bool, n_jobs: int = 1, backend: str = 'loky',
+                                    cache_folds: bool = True, search: str = 'grid', n_iter: int = 10,
+                                    results_store: ResultsStore = None, processor_state: Dict = None,
+                                    data_fingerprint: str = None, reduce: str = None,
+                                    n_components: List[int] = (25, 50, 100), knn_algorithm: str = 'auto',
+                                    content_max_chars: int = None, mdl_prefix: str = 'best_model') -> Dict:
     # Helper function to run grid search using predefined predictors.
+    # With a results store (and cache_folds), fold results of previous searches on the same data are reused.
+    # The data fingerprint (see snapshot.get_fingerprint) is saved with the model, to trace it back to its data.
+    # content_max_chars is set when df has content_ids (see Processor.create_content_ids), used as a predictor.
+    # Returns a summary of the search (best classifier, scores and model folder), e.g. for print_comparison.
 
-    m_builder = ModelBuilder(df, cat_columns, num_columns, use_tfidf_on_text)
+    use_content = content_max_chars is not None
+    m_builder = ModelBuilder(df, cat_columns, num_columns, use_tfidf_on_text, results_store=results_store,
+                             use_content=use_content)
 
     # First, compute a baseline for the selected predictors.
     # Hopefully all the models we train will perform better than it.
-    _, score, _ = m_builder.do_cv(DummyClassifier(random_state=0),
-                                  param_grid={'classifier__strategy': ['stratified']})
-    print("Baseline model (DummyClassifier) macro-F1: ", score)
+    do_cv = m_builder.do_cached_cv if cache_folds else m_builder.do_cv
+    _, baseline_score, _ = do_cv(DummyClassifier(random_state=0), param_grid={'classifier__strategy': ['stratified']})
+    print("Baseline model (DummyClassifier) macro-F1: ", baseline_score)
     print("")
 
     # Cross-validate multiple models with different parameter combinations and output the best score and parameters for 
     # each estimator.
     print("Running grid search for multiple classifiers....")
-    best_grid_cv_obj, best_clf_name, best_score, best_params = benchmark(m_builder)
+    best_grid_cv_obj, best_clf_name, best_score, best_params = benchmark(m_builder, n_jobs=n_jobs, backend=backend,
+                                                                         cache_folds=cache_folds, search=search,
+                                                                         n_iter=n_iter, reduce=reduce,
+                                                                         n_components=n_components,
+                                                                         knn_algorithm=knn_algorithm)
     print("")
     print("Best overall model: ")
     print("\t - Classifier: ", best_clf_name)
@@ -105,4 +187,64 @@ def grid_search_with_selected_preds(df: DataFrame, cat_columns: List[str], num_c
 
     # Save the best model and the predictors used in this grid search.
     vars_dict = {'cat_columns': cat_columns, 'num_columns': num_columns, 'use_tfidf_on_title': use_tfidf_on_text}
-    save_model(best_grid_cv_obj.best_estimator_, vars_dict, best_score, test_score)
+    if use_content:
+        vars_dict.update({'use_content': True, 'content_max_chars': content_max_chars})
+    mdl_folder = save_model(best_grid_cv_obj.best_estimator_, vars_dict, best_score, test_score, processor_state,
+                            best_params=best_params, data_fingerprint=data_fingerprint, mdl_prefix=mdl_prefix)
+    print("Model saved to", mdl_folder)
+    return {'classifier': best_clf_name, 'params': best_params, 'baseline_macro_f1': baseline_score,
+            'cv_macro_f1': best_score, 'holdout_macro_f1': test_score, 'model_folder': str(mdl_folder)}
+
+
+def save_comparison(summaries: Dict[str, Dict], timings: Dict[str, Dict], wall_time: float) -> Path:
+    # Print the best model of each title representation (see grid_search_with_selected_preds) side by side, and save
+    # them with the start and end of each stage of the run (see scheduler.Scheduler) as a json file under data.
+    print("{:<8}{:<28}{:>10}{:>14}  {}".format('title', 'classifier', 'CV F1', 'holdout F1', 'model'))
+    for title_rep, summary in summaries.items():
+        print("{:<8}{:<28}{:>10.3f}{:>14.3f}  {}".format(title_rep, summary['classifier'], summary['cv_macro_f1'],
+                                                         summary['holdout_macro_f1'], summary['model_folder']))
+    stage_time = sum(timing['end_s'] - timing['start_s'] for timing in timings.values())
+    print("Stages took {:.1f} s in {:.1f} s of wall time.".format(stage_time, wall_time))
+
+    timestamp = time.strftime('%b-%d-%Y_%H%M', time.localtime())
+    filepath = data_folder / ('comparison_' + timestamp + '.json')
+    with open(filepath, 'w') as f:
+        json.dump({'models': summaries, 'stages': timings, 'wall_s': wall_time, 'stage_s': stage_time}, f, indent=2,
+                  default=str)
+    return filepath
+
+
+def train_streaming_models(trainer: StreamingTrainer, data_fingerprint: str = None):
+    # Helper function to train partial_fit classifiers over chunks of the data set (see StreamingTrainer), print the
+    # best parameters of each classifier, evaluate the best model on the holdout rows and save it.
+    print("Collecting category counts and value ranges...")
+    state = trainer.collect_state()
+    print("Rows:", trainer.n_rows, "- class counts:", dict(trainer.class_counts))
+    print("")
+
+    print("Training classifiers over chunks of", trainer.chunksize, "rows....")
+    clfs, params_list = get_streaming_search_space()
+    candidates = trainer.train(clfs, params_list)
+    best = None
+    for clf in clfs:
+        clf_candidates = [c for c in candidates if c['clf'].__class__ is clf.__class__]
+        clf_best = max(clf_candidates, key=lambda c: c['score'])  # first of ties, in grid order
+        print("\tBest validation score for", clf, " with parameters", clf_best['params'], ":",
+              clf_best['score'])
+        if best is None or clf_best['score'] > best['score']:
+            best = clf_best
+    print("")
+    print("Best overall model: ")
+    print("\t - Classifier: ", best['clf'].__class__.__name__)
+    print("\t - Macro F1-score: ", best['score'])
+    print("\t - Classifier parameters: ", best['params'])
+    print("")
+
+    test_score = trainer.evaluate_on_holdout([best['clf']])[0]
+    print("Macro-F1 score of best model on holdout set:", test_score)
+
+    vars_dict = {'cat_columns': trainer.cat_columns, 'num_columns': trainer.num_columns, 'use_tfidf_on_title': True,
+                 'title_features': 'hashing'}
+    mdl_folder = save_model(trainer.get_pipeline(best['clf']), vars_dict, best['score'], test_score, state,
+                            best_params=best['params'], data_fingerprint=data_fingerprint)
+    print("Model saved to", mdl_folder)
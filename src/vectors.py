@@ -0,0 +1,104 @@
+from typing import Sequence
+
+import numpy as np
+from pandas.api.extensions import ExtensionArray, ExtensionDtype, register_extension_dtype
+from pandas.api.indexers import check_array_indexer
+from sklearn.base import BaseEstimator, TransformerMixin
+
+
+@register_extension_dtype
+class VectorDtype(ExtensionDtype):
+    """Dtype of a column of fixed-size vectors (see VectorArray)."""
+
+    name = 'vector'
+    type = np.ndarray
+    kind = 'O'
+
+    @classmethod
+    def construct_array_type(cls):
+        return VectorArray
+
+
+class VectorArray(ExtensionArray):
+    """Column of fixed-size vectors backed by one (n_rows, vector size) array, so a DataFrame holds e.g. the title
+    vectors as a single column without one Python object per row. Selecting rows (take, masks, slices) selects rows of
+    the block, and VectorFeatures passes the block to the model."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    @classmethod
+    def _from_sequence(cls, scalars: Sequence, dtype=None, copy: bool = False) -> 'VectorArray':
+        if isinstance(scalars, VectorArray):
+            return scalars.copy() if copy else scalars
+        arrays = list(scalars)
+        return cls(np.stack(arrays) if arrays else np.zeros((0, 0), dtype=np.float32))
+
+    @classmethod
+    def _from_factorized(cls, values, original: 'VectorArray') -> 'VectorArray':
+        return cls._from_sequence(values)
+
+    @classmethod
+    def _concat_same_type(cls, to_concat: Sequence['VectorArray']) -> 'VectorArray':
+        return cls(np.concatenate([array.vectors for array in to_concat]))
+
+    def __getitem__(self, item):
+        # A row (view of the block) for an integer, otherwise a VectorArray of the selected rows.
+        if isinstance(item, (int, np.integer)):
+            return self.vectors[item]
+        if not isinstance(item, slice):
+            item = check_array_indexer(self, item)
+        return VectorArray(self.vectors[item])
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        # Object array of the rows, for pandas operations that need one.
+        rows = np.empty(len(self), dtype=object)
+        rows[:] = list(self.vectors)
+        return rows
+
+    @property
+    def dtype(self) -> VectorDtype:
+        return VectorDtype()
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes
+
+    def isna(self) -> np.ndarray:
+        # Titles without vectors have zero vectors, so none is missing.
+        return np.zeros(len(self), dtype=bool)
+
+    def take(self, indices, allow_fill: bool = False, fill_value=None) -> 'VectorArray':
+        # Rows at indices (one copy). With allow_fill, -1 gives a zero vector.
+        indices = np.asarray(indices, dtype=np.intp)
+        if not allow_fill:
+            return VectorArray(self.vectors.take(indices, axis=0))
+        if (indices < -1).any():
+            raise ValueError('Invalid indices for take with allow_fill: {}.'.format(indices[indices < -1]))
+        missing = indices == -1
+        if len(self) == 0:
+            if not missing.all():
+                raise IndexError('Cannot take rows from an empty VectorArray.')
+            return VectorArray(np.zeros((len(indices),) + self.vectors.shape[1:], dtype=self.vectors.dtype))
+        vectors = self.vectors.take(np.where(missing, 0, indices), axis=0)
+        vectors[missing] = 0
+        return VectorArray(vectors)
+
+    def copy(self) -> 'VectorArray':
+        return VectorArray(self.vectors.copy())
+
+
+class VectorFeatures(BaseEstimator, TransformerMixin):
+    """Block of a column of vectors (see VectorArray) as model features, in float32."""
+
+    def fit(self, x, y=None):
+        # Stateless.
+        return self
+
+    def transform(self, x) -> np.ndarray:
+        # The block of the selected rows is used as is (float32), or upcast once (float16): the features are scaled and
+        # stacked with the (possibly sparse) other features, and scipy.sparse has no float16.
+        return x.array.vectors.astype(np.float32, copy=False)
@@ -0,0 +1,48 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+
+from src.artifacts import is_artifact, load_artifact, load_metadata, save_artifact
+from src.model_builder import ModelBuilder
+from tests.test_model_builder import make_df, cat_columns, num_columns
+
+
+class TestArtifacts(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.mb = ModelBuilder(make_df(), cat_columns, num_columns)
+        search, _, _ = cls.mb.do_cached_cv(SGDClassifier(random_state=0), {'classifier__alpha': [0.001]})
+        cls.pipeline = search.best_estimator_
+
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.folder = Path(cls.tmp_dir.name) / 'model'
+        cls.predictors = {'cat_columns': cat_columns, 'num_columns': num_columns, 'use_tfidf_on_title': True}
+        save_artifact(cls.folder, cls.pipeline, cls.predictors, 0.75, 0.7,
+                      best_params={'classifier__alpha': np.float64(0.001)}, data_fingerprint='abc')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_metadata(self):
+        meta = load_metadata(self.folder)
+
+        self.assertTrue(is_artifact(self.folder))
+        self.assertEqual(meta['Predictor names'], self.predictors)
+        self.assertEqual(meta['Best cv macro-F1'], 0.75)
+        self.assertEqual(meta['Best parameters'], {'classifier__alpha': 0.001})
+        self.assertEqual(meta['Data fingerprint'], 'abc')
+        self.assertIn('scikit-learn', meta['Library versions'])
+        self.assertNotIn('Model details', meta)
+
+    def test_load_memory_maps_arrays(self):
+        contents = load_artifact(self.folder)
+        classifier = contents['Model details'].named_steps['classifier']
+
+        self.assertIsInstance(classifier.coef_, np.memmap)
+        self.assertEqual(list(contents['Model details'].predict(self.mb.X_holdout)),
+                         list(self.pipeline.predict(self.mb.X_holdout)))
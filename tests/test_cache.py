@@ -0,0 +1,54 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from src.cache import TitleCache, make_key
+from src.processor import get_parse_id
+
+
+class TestTitleCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = TitleCache(Path(self.tmp_dir.name) / 'titles.sqlite')
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_make_key_depends_on_model(self):
+        self.assertEqual(make_key('some title', 'model-1.0'), make_key('some title', 'model-1.0'))
+        self.assertNotEqual(make_key('some title', 'model-1.0'), make_key('some title', 'model-1.1'))
+        self.assertNotEqual(make_key('some title', 'model-1.0'), make_key('other title', 'model-1.0'))
+
+    def test_make_key_depends_on_parsing(self):
+        parse_id = get_parse_id()
+        self.assertEqual(parse_id, get_parse_id())
+        self.assertNotEqual(make_key('some title', 'model-1.0', parse_id), make_key('some title', 'model-1.0'))
+        # Running more spaCy components changes the parsed tokens.
+        with mock.patch('src.processor.UNUSED_COMPONENTS', ('ner',)):
+            self.assertNotEqual(parse_id, get_parse_id())
+
+    def test_round_trip(self):
+        vector = np.arange(300, dtype=np.float32)
+        key = make_key('the mice ate the cheese', 'model-1.0')
+        self.cache.put_many([(key, 'mouse eat cheese', vector)])
+
+        found = self.cache.get_many([key, 'missing'])
+
+        self.assertEqual(list(found.keys()), [key])
+        self.assertEqual(found[key][0], 'mouse eat cheese')
+        np.testing.assert_array_equal(found[key][1], vector)
+        self.assertEqual(found[key][1].dtype, np.float32)
+
+    def test_persists_across_connections(self):
+        key = make_key('title', 'model-1.0')
+        self.cache.put_many([(key, 'title', np.zeros(3, dtype=np.float32))])
+        self.cache.close()
+
+        self.cache = TitleCache(Path(self.tmp_dir.name) / 'titles.sqlite')
+        self.assertEqual(len(self.cache), 1)
+        self.assertIn(key, self.cache.get_many([key]))
@@ -0,0 +1,105 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import spacy
+from pandas import DataFrame
+from sklearn.naive_bayes import MultinomialNB
+
+from src.content import ContentStore, ContentVectorizer
+from src.model_builder import ModelBuilder
+from src.processor import Processor
+from src.snapshot import load_snapshot, save_snapshot
+from tests.test_model_builder import make_df, cat_columns, num_columns
+
+
+class TestContent(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        # A blank spaCy pipeline: content texts only go through the tokenizer.
+        cls.model_name = str(Path(cls.tmp_dir.name) / 'model')
+        spacy.blank('en').to_disk(cls.model_name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def make_processor(self) -> Processor:
+        df = DataFrame({'title': ['a', 'b', 'c'],
+                        'content_text': ['The vaccine, the VACCINE and 5 masks.', None, 'Garlic water cures nothing']},
+                       index=[3, 5, 8])
+        return Processor(df, model_name=self.model_name)
+
+    def test_store_round_trip(self):
+        store = ContentStore(Path(self.tmp_dir.name) / 'store')
+        arrays = [np.array([1, 2, 3], dtype=np.uint32), np.zeros(0, dtype=np.uint32), np.array([7], dtype=np.uint32)]
+        self.assertFalse(store.exists())
+        self.assertEqual(store.write(iter(arrays)), 3)
+
+        read = store.read()
+        self.assertTrue(store.exists())
+        self.assertEqual([ids.tolist() for ids in read], [[1, 2, 3], [], [7]])
+        # Views of the read-only memory-mapped id file.
+        self.assertFalse(read[0].flags.writeable)
+
+    def test_vectorizer_counts(self):
+        arrays = [np.array([1, 2, 1], dtype=np.uint32), np.zeros(0, dtype=np.uint32), np.array([9], dtype=np.uint32)]
+        counts = ContentVectorizer(n_features=8, block_size=2).fit_transform(arrays)
+
+        self.assertEqual(counts.shape, (3, 8))
+        self.assertEqual(counts.toarray()[0].tolist(), [0, 2, 1, 0, 0, 0, 0, 0])
+        self.assertEqual(counts.toarray()[1].sum(), 0)
+        self.assertEqual(counts.toarray()[2].tolist(), [0, 1, 0, 0, 0, 0, 0, 0])
+
+    def test_create_content_ids(self):
+        processor = self.make_processor()
+        processor.create_content_ids(max_chars=18)
+        ids = processor.df['content_ids']
+
+        self.assertNotIn('content_text', processor.df.columns)
+        self.assertEqual(list(ids.index), [3, 5, 8])
+        # 'The vaccine, the V' without stop words and punctuation, lowercased.
+        self.assertEqual(len(ids[3]), 2)
+        self.assertEqual(len(ids[5]), 0)
+        self.assertEqual(ids[8].dtype, np.uint32)
+
+        stored = self.make_processor()
+        stored.create_content_ids(max_chars=18, store=ContentStore(Path(self.tmp_dir.name) / 'content'))
+        self.assertEqual([i.tolist() for i in stored.df['content_ids']], [i.tolist() for i in ids])
+
+    def test_existing_store_is_reused(self):
+        store = ContentStore(Path(self.tmp_dir.name) / 'reused')
+        self.make_processor().create_content_ids(max_chars=18, store=store)
+
+        # Texts are not tokenized again.
+        processor = self.make_processor()
+        with mock.patch('src.processor.iter_token_ids', side_effect=AssertionError('texts tokenized again')):
+            processor.create_content_ids(max_chars=18, store=store)
+        self.assertEqual([len(ids) for ids in processor.df['content_ids']], [2, 0, 3])
+        self.assertEqual(list(store.folder.parent.glob('reused.tmp*')), [])
+
+    def test_model_builder_uses_content(self):
+        df = make_df()
+        rng = np.random.default_rng(0)
+        df['content_ids'] = [rng.integers(0, 50, 20).astype(np.uint32) + (100 if c == 'true' else 0)
+                             for c in df['class']]
+        mb = ModelBuilder(df, cat_columns, num_columns, use_content=True)
+        _, score, _ = mb.do_cached_cv(MultinomialNB(), {'classifier__alpha': [0.5]})
+
+        self.assertIn('content', [name for name, _, _ in mb.col_trans.transformers])
+        self.assertGreater(score, 0.9)
+
+    def test_snapshot_round_trip(self):
+        processor = self.make_processor()
+        processor.create_content_ids()
+        folder = Path(self.tmp_dir.name) / 'snapshot'
+        save_snapshot(processor.df, folder)
+        loaded, _ = load_snapshot(folder)
+
+        self.assertEqual(list(loaded.index), [3, 5, 8])
+        self.assertEqual([i.tolist() for i in loaded['content_ids']],
+                         [i.tolist() for i in processor.df['content_ids']])
@@ -0,0 +1,42 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks.generate_data import make_dataset
+from src.loader import Loader, col_names
+
+
+class TestGenerateData(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.filepath = Path(cls.tmp_dir.name) / 'dataset.csv'
+        make_dataset(6902).to_csv(cls.filepath, index=False)
+        cls.loader = Loader(cls.filepath)
+        cls.loader.load_data()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_schema(self):
+        self.assertEqual(self.loader.df.shape, (6902, 15))
+        self.assertEqual(list(self.loader.df.columns), col_names)
+        self.assertEqual(self.loader.df['published_date'].isna().sum(), 0)
+
+    def test_class_distribution(self):
+        loader = Loader(self.filepath)
+        loader.df = self.loader.df.copy()
+        loader.reduce_class_to_binary()
+        n_reduced = len(loader.df)
+        loader.clean_data()
+
+        self.assertTrue(0.005 < 1 - n_reduced / 6902 < 0.02)  # ambiguous ratings
+        self.assertTrue(0.005 < 1 - len(loader.df) / n_reduced < 0.02)  # duplicates
+        self.assertEqual(set(loader.df['class']), {'false', 'true'})
+        self.assertTrue(0.005 < (loader.df['class'] == 'true').mean() < 0.02)
+
+    def test_same_seed_same_data(self):
+        self.assertTrue(make_dataset(500, seed=1).equals(make_dataset(500, seed=1)))
+        self.assertFalse(make_dataset(500, seed=1).equals(make_dataset(500, seed=2)))
@@ -1,6 +1,10 @@
+import tempfile
 import unittest
+from pathlib import Path
 
-from src.loader import Loader
+from pandas import DataFrame
+
+from src.loader import Loader, col_names
 
 local_path = '~/PycharmProjects/springerChallenge/data/dataset.csv'
 loader = Loader(local_path)
@@ -46,3 +50,49 @@ class TestLoader(unittest.TestCase):
 
         expected_dup_shape = (0, len(loader.df.columns))
         self.assertEqual(clean_dups_shape, expected_dup_shape)
+
+
+class TestLoaderInChunks(unittest.TestCase):
+
+    def setUp(self):
+        rows = [['snopes', 'US', 'False', 'title 1', '2020-03-01', 'US', None, None, None, 'url', 'ref', 'src', 'txt',
+                 None, 'en'],
+                ['snopes', 'US', 'false', 'title 1', '2020-03-01', 'US', None, None, None, 'url', 'ref', 'src', 'txt',
+                 None, 'en'],
+                ['politifact', 'IN', 'TRUE', 'title 2', '2020-03-02', 'India', 'US', None, None, 'url', 'ref', 'src',
+                 'txt', None, 'en'],
+                ['politifact', 'IN', 'unproven', 'title 3', '2020-03-03', 'India', None, None, None, 'url', 'ref',
+                 'src', 'txt', None, 'en'],
+                ['afp', 'FR', 'Misleading', 'title 4', '2020-03-04', 'France', None, None, None, 'url', 'ref', 'src',
+                 'txt', None, 'fr'],
+                ['snopes', 'US', 'false', 'title 1', '2020-03-01', 'US', None, None, None, 'url', 'ref', 'src', 'txt',
+                 None, 'en'],
+                ['afp', 'FR', None, 'title 5', '2020-03-05', 'France', None, None, None, 'url', 'ref', 'src', 'txt',
+                 None, 'fr']]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filepath = Path(self.tmp_dir.name) / 'dataset.csv'
+        DataFrame(rows, columns=col_names).to_csv(self.filepath, index=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_same_rows_as_full_load(self):
+        full_loader = Loader(self.filepath)
+        full_loader.load_data()
+        full_loader.reduce_class_to_binary()
+        full_loader.clean_data()
+
+        chunked_loader = Loader(self.filepath)
+        chunked_loader.load_data_in_chunks(chunksize=2)
+
+        self.assertEqual(list(chunked_loader.df.index), list(full_loader.df.index))
+        self.assertEqual(list(chunked_loader.df['class']), list(full_loader.df['class']))
+        self.assertEqual(list(chunked_loader.df['class'].cat.categories), ['false', 'true'])
+
+    def test_selected_columns_and_dtypes(self):
+        chunked_loader = Loader(self.filepath)
+        chunked_loader.load_data_in_chunks(columns=['class', 'title', 'lang'], chunksize=3)
+
+        self.assertEqual(list(chunked_loader.df.columns), ['class', 'title', 'lang'])
+        self.assertEqual(chunked_loader.df['lang'].dtype, 'category')
+        self.assertEqual(list(chunked_loader.df['lang'].cat.categories), ['en', 'fr'])
@@ -0,0 +1,145 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+from pandas import DataFrame, Categorical
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import MultinomialNB, ComplementNB
+from sklearn.neighbors import KNeighborsClassifier
+
+from src.model_builder import ModelBuilder, get_clf_name, with_reduction
+from src.results_store import ResultsStore
+from src.vectors import VectorArray
+
+cat_columns = ['lang', 'verifiedby']
+num_columns = ['number_regions_published', 'published_date_day_diff']
+
+
+def make_df(n_rows: int = 300) -> DataFrame:
+    # Small synthetic data set with the columns used by the workflow.
+    rng = np.random.default_rng(0)
+    words = ['vaccine', 'virus', 'mask', 'cure', 'lockdown', 'death', 'test', 'water', 'garlic', 'china']
+    y = rng.choice(['false', 'true'], n_rows, p=[0.8, 0.2])
+    titles = [' '.join(rng.choice(words, 5)) + (' cure' if c == 'true' else '') for c in y]
+    return DataFrame({'class': Categorical(y),
+                      'title': titles,
+                      'lang': Categorical(rng.choice(['en', 'es'], n_rows)),
+                      'verifiedby': Categorical(rng.choice(['snopes', 'afp', 'other'], n_rows)),
+                      'number_regions_published': rng.integers(1, 4, n_rows),
+                      'published_date_day_diff': rng.integers(0, 100, n_rows)})
+
+
+class TestModelBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.df = make_df()
+        self.clfs = [MultinomialNB(), ComplementNB(), SGDClassifier(random_state=0)]
+        self.param_grids = [{'classifier__alpha': [0.1, 0.5, 0.9]},
+                            {'classifier__alpha': [0.1, 0.5, 0.9]},
+                            {'classifier__alpha': [0.0001, 0.01]}]
+
+    def test_parallel_cv_matches_serial(self):
+        mb = ModelBuilder(self.df, cat_columns, num_columns)
+        serial_results = []
+        for clf, param_grid in zip(self.clfs, self.param_grids):
+            _, score, params = mb.do_cv(clf, param_grid)
+            serial_results.append((score, params))
+
+        _, parallel_results, best_index = ModelBuilder(self.df, cat_columns, num_columns).do_parallel_cv(
+            self.clfs, self.param_grids, n_jobs=2)
+
+        self.assertEqual(serial_results, parallel_results)
+        best_scores = [score for score, _ in serial_results]
+        self.assertEqual(best_index, best_scores.index(max(best_scores)))
+
+    def test_cached_search_matches_grid_search(self):
+        mb = ModelBuilder(self.df, cat_columns, num_columns)
+        searches = mb.do_cached_search(self.clfs, self.param_grids)
+
+        for clf, param_grid, search in zip(self.clfs, self.param_grids, searches):
+            grid_search, score, params = ModelBuilder(self.df, cat_columns, num_columns).do_cv(clf, param_grid)
+            self.assertEqual(round(search.best_score_, 3), score)
+            self.assertEqual(search.best_params_, params)
+            np.testing.assert_allclose(search.cv_results_['mean_test_score'],
+                                       grid_search.cv_results_['mean_test_score'])
+
+    def test_cached_cv_refits_best_model(self):
+        mb = ModelBuilder(self.df, cat_columns, num_columns)
+        grid_search, _, _ = mb.do_cv(self.clfs[0], self.param_grids[0])
+        cached_search, _, _ = mb.do_cached_cv(self.clfs[0], self.param_grids[0])
+
+        self.assertEqual(list(cached_search.predict(mb.X_holdout)), list(grid_search.predict(mb.X_holdout)))
+        self.assertEqual(len(mb.fold_cache), mb.skf.get_n_splits())
+
+    def test_halving_search(self):
+        mb = ModelBuilder(self.df, cat_columns, num_columns)
+        param_grid = {'classifier__alpha': list(np.arange(0.1, 1.0, 0.1))}
+        grid_search = mb.do_cached_search([ComplementNB()], [param_grid])[0]
+        halving_search = mb.do_cached_search([ComplementNB()], [param_grid], search='halving', factor=3)[0]
+
+        # 9 combinations: 9 on a subsample, 3 on a larger subsample, 1 on the complete folds.
+        self.assertEqual(len(halving_search.cv_results_['params']), 1)
+        self.assertEqual(halving_search.n_fits_, (9 + 3 + 1) * 5)
+        self.assertLess(halving_search.n_full_fits_, halving_search.n_grid_fits_)
+        # The scores of the final combination are computed on the complete folds.
+        grid_index = grid_search.cv_results_['params'].index(halving_search.best_params_)
+        self.assertEqual(halving_search.best_score_, grid_search.cv_results_['mean_test_score'][grid_index])
+
+    def test_random_search(self):
+        mb = ModelBuilder(self.df, cat_columns, num_columns)
+        random_search = mb.do_cached_search([self.clfs[0]], [{'classifier__alpha': list(np.arange(0.1, 1.0, 0.1))}],
+                                            search='random', n_iter=4)[0]
+
+        self.assertEqual(len(random_search.cv_results_['params']), 4)
+        self.assertEqual(random_search.n_fits_, 4 * 5)
+
+    def test_results_store_reuses_fold_results(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = ResultsStore(Path(tmp_dir) / 'results.sqlite')
+            first_search = ModelBuilder(self.df, cat_columns, num_columns, results_store=store).do_cached_search(
+                self.clfs[:1], self.param_grids[:1])[0]
+            self.assertEqual(len(store), 3 * 5)
+
+            # One more classifier: only its fits are added, the others are read back from the store.
+            searches = ModelBuilder(self.df, cat_columns, num_columns, results_store=store).do_cached_search(
+                self.clfs[:2], self.param_grids[:2])
+            self.assertEqual(len(store), 6 * 5)
+            np.testing.assert_array_equal(searches[0].cv_results_['mean_fit_time'],
+                                          first_search.cv_results_['mean_fit_time'])
+            self.assertEqual(searches[0].best_params_, first_search.best_params_)
+            store.close()
+
+    def test_reduced_classifier(self):
+        clf, param_grid = with_reduction(KNeighborsClassifier(algorithm='kd_tree'), {'classifier__n_neighbors': [3, 5]},
+                                         'svd', [5, 10])
+        self.assertEqual(get_clf_name(clf), 'TruncatedSVD+KNeighborsClassifier')
+        self.assertEqual(param_grid, {'classifier__clf__n_neighbors': [3, 5],
+                                      'classifier__reduce__n_components': [5, 10]})
+
+        # The reduction is fit on each training fold, with the same scores as in a grid search on the full pipeline.
+        mb = ModelBuilder(self.df, cat_columns, num_columns)
+        search, score, params = mb.do_cached_cv(clf, param_grid)
+        grid_search, grid_score, grid_params = mb.do_cv(clf, param_grid)
+        np.testing.assert_allclose(search.cv_results_['mean_test_score'], grid_search.cv_results_['mean_test_score'])
+        self.assertEqual((score, params), (grid_score, grid_params))
+        self.assertEqual(search.best_estimator_.named_steps['classifier'].named_steps['reduce'].n_components,
+                         params['classifier__reduce__n_components'])
+
+    def test_title_vectors(self):
+        # float16 title vectors, stacked with the sparse one-hot and content features (scipy.sparse has no float16).
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(len(self.df), 4)).astype(np.float16)
+        vectors[:, 0] += (self.df['class'] == 'true').to_numpy()
+        self.df['title_vector'] = VectorArray(vectors)
+        self.df['content_ids'] = [rng.integers(0, 50, 20).astype(np.uint32) for _ in range(len(self.df))]
+        mb = ModelBuilder(self.df, cat_columns, num_columns, use_tfifd_on_title=False, use_content=True)
+        search, score, _ = mb.do_cached_cv(SGDClassifier(random_state=0), {'classifier__alpha': [0.0001, 0.01]})
+
+        # The train split holds the block of its rows.
+        train_vectors = mb.X_train['title_vector'].array.vectors
+        np.testing.assert_array_equal(train_vectors, vectors[mb.X_train.index])
+        self.assertEqual(train_vectors.dtype, np.float16)
+        self.assertEqual(mb.get_fold_cache()[0][0].shape[1], 2 + 3 + 2 + 4 + 2 ** 18)
+        self.assertGreater(score, 0.5)
+        self.assertEqual(len(search.predict(mb.X_holdout)), len(mb.y_holdout))
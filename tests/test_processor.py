@@ -1,10 +1,13 @@
+import tempfile
 import unittest
+from unittest import mock
+import numpy
 import spacy
 from numpy import NaN
 
-from src.processor import get_processed_tokens
-from src.processor import Processor
-from pandas import DataFrame
+from src.processor import get_processed_tokens, get_processed_tokens_many
+from src.processor import Processor, save_state, load_state
+from pandas import DataFrame, concat
 
 nlp = spacy.load('en_core_web_sm')
 
@@ -21,6 +24,16 @@ class TestProcessor(unittest.TestCase):
         actual = get_processed_tokens(doc)
         self.assertEqual(expected, actual)
 
+    def test_get_processed_tokens_many(self):
+        # Same tokens as filtering each token of each doc, including for empty docs.
+        docs = [nlp(txt) for txt in ['This sentence has some words.', '', 'The mice ate 3 pieces of cheese!!!']]
+
+        expected = [' '.join([token.lemma_ for token in doc if not (token.is_punct | token.is_digit | token.is_stop)])
+                    for doc in docs]
+
+        self.assertEqual(expected, get_processed_tokens_many(docs))
+        self.assertEqual([], get_processed_tokens_many([]))
+
     def test_preprocess_title(self):
         title = ["This Title has some words.", "the mice ate the cheese!!!"]
         verifiedby = ["source 1", "source 2"]
@@ -78,3 +91,90 @@ class TestProcessor(unittest.TestCase):
         expected_cat1 = ["a"] * 11 + ["other"] * 5 + ["unknown"] * 10
 
         self.assertEqual(expected_cat1, actual_cat1)
+
+    def test_preprocess_categorical_column_with_state(self):
+        cat1 = ["A"] * 10 + ["b", "c"] + [NaN] * 10
+        proc = Processor(DataFrame(cat1, columns=['cat1']))
+        proc.preprocess_categorical_column(['cat1'])
+        state = proc.get_state()
+
+        self.assertEqual(state['category_levels'], {'cat1': ['a', 'unknown']})
+
+        # New data is lumped with the categories kept in training, not with its own counts.
+        new_proc = Processor(DataFrame(["b", "A", NaN], columns=['cat1']), state=state)
+        new_proc.preprocess_categorical_column(['cat1'])
+        self.assertEqual(list(new_proc.df['cat1']), ["other", "a", "unknown"])
+
+    def test_create_day_diff_variable_with_state(self):
+        proc = Processor(DataFrame(['2020-03-01', '2020-02-01'], columns=['published_date']))
+        proc.create_day_diff_variable(['published_date'])
+        state = proc.get_state()
+
+        new_proc = Processor(DataFrame(['2020-03-02'], columns=['published_date']), state=state)
+        new_proc.create_day_diff_variable(['published_date'])
+        self.assertEqual(list(new_proc.df['published_date_day_diff']), [30])
+
+    def test_incremental_fit(self):
+        first = DataFrame({'cat1': ["A"] * 6 + ["b"] * 10, 'published_date': ['2020-03-01'] * 16})
+        second = DataFrame({'cat1': ["a"] * 4 + [NaN] * 3, 'published_date': ['2020-02-01'] * 7})
+        state = Processor(first).fit(['cat1'], ['published_date']).get_state()
+        self.assertEqual(state['category_levels'], {'cat1': ['b']})
+
+        # Updating the state with a new batch gives the state of all the data.
+        proc = Processor(second, state=state).fit(['cat1'], ['published_date'], incremental=True)
+        expected = Processor(concat([first, second])).fit(['cat1'], ['published_date']).get_state()
+        self.assertEqual(proc.get_state(), expected)
+        self.assertEqual(proc.get_state()['category_levels'], {'cat1': ['a', 'b']})
+
+        proc.preprocess_categorical_column(['cat1'])
+        proc.create_day_diff_variable(['published_date'])
+        self.assertEqual(list(proc.df['cat1']), ["a"] * 4 + ["other"] * 3)
+        self.assertEqual(list(proc.df['published_date_day_diff']), [0] * 7)
+
+    def test_save_and_load_state(self):
+        proc = Processor(DataFrame({'cat1': ["A"] * 10, 'published_date': ['2020-03-01'] * 10}))
+        proc.fit(['cat1'], ['published_date'])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = tmp_dir + '/state.json'
+            save_state(proc.get_state(), filepath)
+            self.assertEqual(load_state(filepath), proc.get_state())
+
+    def test_create_title_vector(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model = spacy.blank('en')
+            model.vocab.set_vector('mouse', numpy.array([1, 2, 3], dtype='float32'))
+            model.vocab.set_vector('cheese', numpy.array([3, 2, 1], dtype='float32'))
+            model.to_disk(tmp_dir)
+
+            for dtype in ('float32', 'float16'):
+                proc = Processor(DataFrame({'title': ['mouse cheese', 'mouse', '']}, index=[3, 5, 8]),
+                                 model_name=tmp_dir, vector_dtype=dtype)
+                proc.create_title_vector()
+
+                # One (n_titles, vector size) block, also the storage of the title_vector column.
+                self.assertEqual(proc.title_vectors.dtype, numpy.dtype(dtype))
+                self.assertEqual(proc.title_vectors.tolist(), [[2, 2, 2], [1, 2, 3], [0, 0, 0]])
+                self.assertEqual(list(proc.df.columns), ['title', 'title_vector'])
+                self.assertEqual(list(proc.df.index), [0, 1, 2])
+                self.assertEqual(proc.df['title_vector'][1].tolist(), [1, 2, 3])
+                self.assertTrue(numpy.shares_memory(proc.df['title_vector'].array.vectors, proc.title_vectors))
+
+    def test_title_vectors_come_from_the_title_parse(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model = spacy.blank('en')
+            model.vocab.set_vector('mouse', numpy.array([1, 2, 3], dtype='float32'))
+            model.vocab.set_vector('cheese', numpy.array([3, 2, 1], dtype='float32'))
+            model.to_disk(tmp_dir)
+            df = DataFrame({'title': ['Mouse cheese', 'mouse', ''], 'verifiedby': ['afp'] * 3,
+                            'source_title': [None] * 3})
+
+            proc = Processor(df.copy(), model_name=tmp_dir)
+            proc.preprocess_title()
+            # Titles are parsed once, in preprocess_title.
+            with mock.patch.object(Processor, 'iter_parsed', side_effect=AssertionError('titles parsed again')):
+                proc.create_title_vector()
+            self.assertEqual(proc.title_vectors.tolist(), [[2, 2, 2], [1, 2, 3], [0, 0, 0]])
+
+            proc = Processor(df.copy(), model_name=tmp_dir, keep_title_vectors=False)
+            proc.preprocess_title()
+            self.assertIsNone(proc.title_vectors)
@@ -0,0 +1,75 @@
+import json
+import pstats
+import tempfile
+import unittest
+from pathlib import Path
+
+from sklearn.naive_bayes import MultinomialNB
+
+from src import profiling
+from src.model_builder import ModelBuilder
+from src.profiling import finish_report, profiled, record_fit, stage, start_report, timed_iter
+from tests.test_model_builder import make_df, cat_columns, num_columns
+
+
+class Counter:
+
+    def __init__(self, n_rows: int):
+        self.n_rows = n_rows
+
+    @profiled('counter.count', rows=lambda self: self.n_rows)
+    def count(self):
+        return list(timed_iter('counter.items', range(self.n_rows)))
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.report_file = Path(self.tmp_dir.name) / 'report.json'
+
+    def tearDown(self):
+        profiling.current_report = None
+        self.tmp_dir.cleanup()
+
+    def test_hooks_do_nothing_without_report(self):
+        with stage('outer') as metrics:
+            metrics['rows'] = 3
+        record_fit('MultinomialNB', {}, 0, 10, 0.1, 0.1)
+
+        self.assertEqual(Counter(5).count(), list(range(5)))
+        self.assertIsNone(profiling.current_report)
+
+    def test_stages_are_nested_and_aggregated(self):
+        start_report('test')
+        with stage('outer', rows=4):
+            Counter(4).count()
+            Counter(6).count()
+        report = finish_report(self.report_file).to_dict()
+        stages = {entry['stage']: entry for entry in report['stages']}
+
+        self.assertEqual(list(stages), ['outer/counter.count/counter.items', 'outer/counter.count', 'outer'])
+        self.assertEqual(stages['outer/counter.count']['calls'], 2)
+        self.assertEqual(stages['outer/counter.count']['rows'], 10)
+        self.assertEqual(stages['outer/counter.count/counter.items']['rows'], 10)
+        self.assertEqual(stages['outer']['rows'], 4)
+        self.assertGreaterEqual(stages['outer']['wall_s'], stages['outer/counter.count']['wall_s'])
+        self.assertGreater(report['peak_rss_mb'], 0)
+        self.assertIsNone(profiling.current_report)
+
+    def test_report_records_fold_fits(self):
+        start_report('test', cprofile=True)
+        mb = ModelBuilder(make_df(), cat_columns, num_columns)
+        mb.do_cached_cv(MultinomialNB(), {'classifier__alpha': [0.1, 0.5]})
+        finish_report(self.report_file)
+
+        with open(self.report_file) as f:
+            report = json.load(f)
+        stages = [entry['stage'] for entry in report['stages']]
+        self.assertIn('model_builder.do_cached_search/model_builder.evaluate_on_folds', stages)
+        self.assertIn('model_builder.refit', stages)
+        self.assertEqual(len(report['fits']), 2 * 5)
+        self.assertEqual(report['fits'][0]['rows'], len(mb.get_fold_cache()[0][1]))
+        self.assertEqual(report['classifiers'][0]['classifier'], 'MultinomialNB')
+        self.assertEqual(report['classifiers'][0]['fits'], 10)
+        self.assertGreater(pstats.Stats(str(self.report_file.with_suffix('.prof'))).total_calls, 0)
@@ -0,0 +1,32 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import spacy
+
+from src.registry import get_model, clear_models
+
+
+class TestRegistry(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.model_path = str(Path(cls.tmp_dir.name) / 'model')
+        nlp = spacy.blank('en')
+        nlp.add_pipe('sentencizer')
+        nlp.to_disk(cls.model_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        clear_models()
+        cls.tmp_dir.cleanup()
+
+    def test_model_loaded_once(self):
+        self.assertIs(get_model(self.model_path), get_model(self.model_path))
+
+    def test_components_disabled(self):
+        nlp = get_model(self.model_path, disable=('sentencizer',))
+
+        self.assertEqual(nlp.pipe_names, [])
+        self.assertIsNot(nlp, get_model(self.model_path))
@@ -0,0 +1,103 @@
+import io
+import sys
+import threading
+import time
+import unittest
+
+from src import profiling
+from src.profiling import finish_report, stage, start_report
+from src.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+
+    def tearDown(self):
+        profiling.current_report = None
+
+    def test_stages_run_after_their_deps(self):
+        scheduler = Scheduler(n_workers=2)
+        scheduler.add('load', lambda: 2)
+        scheduler.add('double', lambda x: 2 * x, ['load'])
+        scheduler.add('square', lambda x: x * x, ['load'])
+        scheduler.add('sum', lambda a, b: a + b, ['double', 'square'])
+        scheduler.add('other', lambda x: -x, ['load'])
+        results = scheduler.run()
+
+        # Only results of stages nothing depends on are returned.
+        self.assertEqual(results, {'sum': 8, 'other': -2})
+        self.assertEqual(set(scheduler.timings), {'load', 'double', 'square', 'sum', 'other'})
+        self.assertGreaterEqual(scheduler.timings['sum']['start_s'], scheduler.timings['square']['end_s'])
+
+    def test_independent_stages_run_concurrently(self):
+        # Both stages wait for each other, so this only finishes if they run at the same time.
+        barrier = threading.Barrier(2, timeout=5)
+        scheduler = Scheduler(n_workers=2)
+        scheduler.add('a', barrier.wait)
+        scheduler.add('b', barrier.wait)
+        self.assertEqual(sorted(scheduler.run().values()), [0, 1])
+
+    def test_failure_cancels_remaining_stages(self):
+        calls = []
+
+        def fail():
+            raise RuntimeError('failed')
+
+        scheduler = Scheduler(n_workers=1)
+        scheduler.add('fail', fail)
+        scheduler.add('next', lambda _: calls.append('next'), ['fail'])
+        scheduler.add('slow', lambda: time.sleep(0.1))
+        with self.assertRaises(RuntimeError):
+            scheduler.run()
+        self.assertEqual(calls, [])
+
+    def test_unknown_or_repeated_stage(self):
+        scheduler = Scheduler()
+        scheduler.add('a', lambda: 1)
+        with self.assertRaises(ValueError):
+            scheduler.add('a', lambda: 1)
+        with self.assertRaises(ValueError):
+            scheduler.add('b', lambda x: x, ['c'])
+
+    def test_stages_are_nested_per_thread(self):
+        def work(name: str):
+            with stage(name + '.inner'):
+                time.sleep(0.05)
+
+        start_report('test')
+        scheduler = Scheduler(n_workers=2)
+        scheduler.add('a', lambda: work('a'))
+        scheduler.add('b', lambda: work('b'))
+        scheduler.run()
+        stages = {entry['stage'] for entry in finish_report().to_dict()['stages']}
+
+        self.assertEqual(stages, {'a', 'a/a.inner', 'b', 'b/b.inner'})
+
+    def test_output_is_prefixed_with_the_stage(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def work(name: str):
+            print(name, 'starts', end='')
+            barrier.wait()
+            print(' and ends')
+            print(name, 'done')
+
+        output = io.StringIO()
+        stdout, sys.stdout = sys.stdout, output
+        try:
+            scheduler = Scheduler(n_workers=2)
+            scheduler.add('a', lambda: work('a'))
+            scheduler.add('b', lambda: work('b'))
+            scheduler.run()
+        finally:
+            sys.stdout = stdout
+
+        self.assertIs(sys.stdout, stdout)
+        self.assertEqual(sorted(output.getvalue().splitlines()),
+                         ['[a] a done', '[a] a starts and ends', '[b] b done', '[b] b starts and ends'])
+
+    def test_output_is_a_text_stream(self):
+        # Code inside a stage can inspect sys.stdout as a regular text stream.
+        scheduler = Scheduler(n_workers=1)
+        scheduler.add('a', lambda: (sys.stdout.encoding, sys.stdout.isatty(), sys.stdout.fileno()))
+        stdout = sys.stdout
+        self.assertEqual(scheduler.run(), {'a': (stdout.encoding, stdout.isatty(), stdout.fileno())})
@@ -0,0 +1,106 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import spacy
+from pandas import DataFrame, read_csv
+from sklearn.compose import ColumnTransformer
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MinMaxScaler, OneHotEncoder
+
+from src.loader import col_names
+from src.model_builder import ModelBuilder
+from src.scoring import Scorer, predict_csv
+from src.vectors import VectorArray
+from tests.test_model_builder import make_df, cat_columns, num_columns
+
+
+class TestScoring(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        # A blank spaCy pipeline stands in for en_core_web_md.
+        cls.model_name = str(Path(cls.tmp_dir.name) / 'model')
+        spacy.blank('en').to_disk(cls.model_name)
+
+        mb = ModelBuilder(make_df(), cat_columns, num_columns)
+        search, _, _ = mb.do_cached_cv(MultinomialNB(), {'classifier__alpha': [0.5]})
+        cls.contents = {'Model details': search.best_estimator_,
+                        'Predictor names': {'cat_columns': cat_columns, 'num_columns': num_columns,
+                                            'use_tfidf_on_title': True},
+                        'Processor state': {'category_levels': {'lang': ['en', 'es'], 'verifiedby': ['afp', 'snopes']},
+                                            'date_baselines': {'published_date': '2020-01-01T00:00:00'}}}
+
+        rng = np.random.default_rng(0)
+        n_rows = 50
+        raw_df = DataFrame({c: rng.choice(['en', 'fr', 'afp', 'snopes', 'US'], n_rows) for c in col_names})
+        raw_df['published_date'] = rng.choice(['2020-01-05', '2020-03-01'], n_rows)
+        raw_df['title'] = rng.choice(['vaccine cure', 'mask test', 'garlic water'], n_rows)
+        cls.input_path = Path(cls.tmp_dir.name) / 'input.csv'
+        raw_df.to_csv(cls.input_path, index=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_prepare_uses_training_state(self):
+        scorer = Scorer(self.contents, model_name=self.model_name)
+        df = scorer.prepare(DataFrame([{'title': 'Some Title', 'verifiedby': 'AFP', 'lang': 'fr',
+                                        'published_date': '2020-01-11', 'country1': 'US'}]))
+
+        self.assertEqual(list(df['lang']), ['other'])
+        self.assertEqual(list(df['verifiedby']), ['afp'])
+        self.assertEqual(list(df['published_date_day_diff']), [10])
+        self.assertEqual(list(df['number_regions_published']), [1])
+
+    def test_missing_state(self):
+        with self.assertRaises(ValueError):
+            Scorer(dict(self.contents, **{'Processor state': None}), model_name=self.model_name)
+
+    def test_chunked_predictions_match_whole_file(self):
+        output_path = Path(self.tmp_dir.name) / 'predictions.csv'
+        n_rows = predict_csv(self.contents, self.input_path, output_path, chunksize=7, model_name=self.model_name)
+
+        expected = Scorer(self.contents, model_name=self.model_name).predict(read_csv(self.input_path))
+        actual = read_csv(output_path, dtype={'prediction': str})
+
+        self.assertEqual(n_rows, 50)
+        self.assertEqual(list(actual['row']), list(range(50)))
+        self.assertEqual(list(actual['prediction']), list(expected))
+
+    def test_title_vectors(self):
+        model_name = str(Path(self.tmp_dir.name) / 'vectors')
+        nlp = spacy.blank('en')
+        nlp.vocab.set_vector('vaccine', np.array([1, 2, 3], dtype='float32'))
+        nlp.vocab.set_vector('mask', np.array([3, 2, 1], dtype='float32'))
+        nlp.to_disk(model_name)
+        df = make_df()
+        df['title_vector'] = VectorArray(np.random.default_rng(0).random((len(df), 3), dtype=np.float32))
+        predictors = {'cat_columns': cat_columns, 'num_columns': num_columns, 'use_tfidf_on_title': False}
+        raw_df = read_csv(self.input_path)
+
+        # Models with the title_vector column, and models saved by earlier versions with doc_vec_* columns.
+        legacy_df = df.drop(columns=['title', 'title_vector']).join(
+            DataFrame(df['title_vector'].array.vectors, columns=['doc_vec_0', 'doc_vec_1', 'doc_vec_2']))
+        legacy_pipeline = Pipeline(steps=[('preprocessor', ColumnTransformer(
+            [('cat', OneHotEncoder(handle_unknown='ignore'), cat_columns), ('num', MinMaxScaler(), num_columns)],
+            remainder=MinMaxScaler())), ('classifier', MultinomialNB())])
+        legacy_pipeline.fit(legacy_df.drop(columns=['class']), legacy_df['class'])
+        search, _, _ = ModelBuilder(df, cat_columns, num_columns, use_tfifd_on_title=False).do_cached_cv(
+            MultinomialNB(), {'classifier__alpha': [0.5]})
+
+        for pipeline in (search.best_estimator_, legacy_pipeline):
+            contents = dict(self.contents, **{'Model details': pipeline, 'Predictor names': predictors})
+            self.assertEqual(len(Scorer(contents, model_name=model_name).predict(raw_df)), 50)
+
+    def test_missing_titles(self):
+        # A snopes title is replaced by the source title, which can be missing too.
+        scorer = Scorer(self.contents, model_name=self.model_name)
+        predictions = scorer.predict_records([{'verifiedby': 'snopes', 'published_date': '2020-01-11'},
+                                              {'title': 'Snopes title', 'verifiedby': 'Snopes', 'source_title': None,
+                                               'published_date': '2020-01-11'}])
+
+        self.assertEqual(len(predictions), 2)
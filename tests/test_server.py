@@ -0,0 +1,89 @@
+import threading
+import unittest
+
+from src.scoring import record_columns
+from src.server import MicroBatcher, check_records
+
+
+class FakeScorer:
+    """Records the batches it is called with, and predicts the title of each record."""
+
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+
+    def predict_records(self, records):
+        self.release.wait()
+        self.batches.append(len(records))
+        return [record['title'] for record in records]
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def test_requests_are_batched(self):
+        scorer = FakeScorer()
+        batcher = MicroBatcher(scorer, max_batch_size=10, max_wait_ms=50)
+
+        # The first request blocks the scorer while the next ones are queued.
+        futures = [batcher.submit([{'title': 't0'}])]
+        futures += [batcher.submit([{'title': 't' + str(i)}, {'title': 'u' + str(i)}]) for i in range(1, 5)]
+        scorer.release.set()
+
+        self.assertEqual(futures[0].result(timeout=5), ['t0'])
+        for i, future in enumerate(futures[1:], start=1):
+            self.assertEqual(future.result(timeout=5), ['t' + str(i), 'u' + str(i)])
+        self.assertEqual(sum(scorer.batches), 9)
+        self.assertLess(len(scorer.batches), len(futures))
+
+        summary = batcher.stats.summary()
+        self.assertEqual(summary['requests'], 5)
+        self.assertEqual(summary['records'], 9)
+        self.assertIn('p99_latency_ms', summary)
+
+    def test_errors_are_returned_to_each_request(self):
+        class FailingScorer:
+            def predict_records(self, records):
+                raise ValueError('bad record')
+
+        batcher = MicroBatcher(FailingScorer(), max_wait_ms=1)
+        with self.assertRaises(ValueError):
+            batcher.submit([{'title': 't'}]).result(timeout=5)
+
+    def test_failing_request_does_not_fail_its_batch(self):
+        class PickyScorer(FakeScorer):
+            def predict_records(self, records):
+                if any(record['title'] == 'bad' for record in records):
+                    raise ValueError('bad record')
+                return super().predict_records(records)
+
+        scorer = PickyScorer()
+        batcher = MicroBatcher(scorer, max_batch_size=10, max_wait_ms=50)
+        futures = [batcher.submit([{'title': 't' + str(i)}]) for i in range(3)]
+        bad_future = batcher.submit([{'title': 'bad'}])
+        scorer.release.set()
+
+        for i, future in enumerate(futures):
+            self.assertEqual(future.result(timeout=5), ['t' + str(i)])
+        with self.assertRaises(ValueError):
+            bad_future.result(timeout=5)
+        self.assertEqual(batcher.stats.summary()['requests'], 3)
+
+
+class TestCheckRecords(unittest.TestCase):
+
+    def test_records_are_completed(self):
+        records = check_records([{'title': 5, 'lang': 'en', 'published_date': '2020-01-05'},
+                                 {'published_date': '2020-02-01'}])
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['title'], '5')
+        self.assertEqual(records[0]['lang'], 'en')
+        self.assertEqual(list(records[1]), record_columns)
+        self.assertIsNone(records[1]['title'])
+        self.assertEqual(check_records({'title': 't', 'published_date': '2020-01-05'})[0]['title'], 't')
+
+    def test_bad_records(self):
+        for body in ['title', [1], [{'title': ['a'], 'published_date': '2020-01-05'}], 5, {}, {'title': 5},
+                     {'published_date': 'yesterday'}]:
+            with self.assertRaises(ValueError):
+                check_records(body)
@@ -0,0 +1,90 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import spacy
+from pandas import DataFrame, Categorical
+
+from src.snapshot import get_fingerprint, processing_sources, save_snapshot, load_snapshot, has_snapshot
+from src.vectors import VectorArray
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmp_dir.name) / 'snapshot'
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_fingerprint(self):
+        filepath = Path(self.tmp_dir.name) / 'dataset.csv'
+        filepath.write_text('a,b\n1,2\n')
+        fingerprint = get_fingerprint(filepath, {'use_tfidf_on_title': True})
+
+        self.assertEqual(fingerprint, get_fingerprint(filepath, {'use_tfidf_on_title': True}))
+        self.assertNotEqual(fingerprint, get_fingerprint(filepath, {'use_tfidf_on_title': False}))
+
+        filepath.write_text('a,b\n1,3\n')
+        self.assertNotEqual(fingerprint, get_fingerprint(filepath, {'use_tfidf_on_title': True}))
+
+    def test_fingerprint_includes_processing_code(self):
+        # Changing the workflow code (e.g. the columns kept by main.finish_processing) invalidates snapshots.
+        filepath = Path(self.tmp_dir.name) / 'dataset.csv'
+        filepath.write_text('a,b\n1,2\n')
+        workflow = Path(self.tmp_dir.name) / 'main.py'
+        workflow.write_text('columns = []\n')
+        with mock.patch('src.snapshot.processing_sources', processing_sources + [workflow]):
+            fingerprint = get_fingerprint(filepath, {'use_tfidf_on_title': True})
+            workflow.write_text('columns = ["title"]\n')
+            self.assertNotEqual(fingerprint, get_fingerprint(filepath, {'use_tfidf_on_title': True}))
+
+        names = [source.name for source in processing_sources]
+        for name in ('main.py', 'processor.py', 'registry.py', 'cache.py'):
+            self.assertIn(name, names)
+
+    def test_fingerprint_includes_model_version(self):
+        filepath = Path(self.tmp_dir.name) / 'dataset.csv'
+        filepath.write_text('a,b\n1,2\n')
+        model_name = str(Path(self.tmp_dir.name) / 'model')
+        nlp = spacy.blank('en')
+        nlp.meta['version'] = '1.0.0'
+        nlp.to_disk(model_name)
+        fingerprint = get_fingerprint(filepath, {'use_tfidf_on_title': True}, model_name=model_name)
+        self.assertNotEqual(fingerprint, get_fingerprint(filepath, {'use_tfidf_on_title': True}))
+
+        nlp.meta['version'] = '1.1.0'
+        nlp.to_disk(model_name)
+        self.assertNotEqual(fingerprint, get_fingerprint(filepath, {'use_tfidf_on_title': True}, model_name=model_name))
+
+    def test_round_trip(self):
+        df = DataFrame({'class': Categorical(['false', 'true', 'false']),
+                        'title': ['this title have some word', 'mouse eat cheese', ''],
+                        'lang': Categorical(['en', 'other', 'en']),
+                        'number_regions_published': [1, 2, 1],
+                        'published_date_day_diff': [0, 10, 31]},
+                       index=[0, 4, 5])
+        vectors = np.random.rand(3, 4).astype(np.float16)
+        df['title_vector'] = VectorArray(vectors)
+
+        self.assertFalse(has_snapshot(self.folder))
+        state = {'category_levels': {'lang': ['en']}, 'date_baselines': {'published_date': '2020-01-01T00:00:00'}}
+        save_snapshot(df, self.folder, state)
+        self.assertTrue(has_snapshot(self.folder))
+        actual_df, actual_state = load_snapshot(self.folder)
+
+        self.assertEqual(actual_state, state)
+        self.assertEqual(list(actual_df.columns), list(df.columns))
+        self.assertEqual(list(actual_df.index), list(df.index))
+        self.assertEqual(list(actual_df['class']), list(df['class']))
+        self.assertEqual(actual_df['lang'].dtype, 'category')
+        self.assertEqual(list(actual_df['title']), list(df['title']))
+        self.assertEqual(list(actual_df['published_date_day_diff']), list(df['published_date_day_diff']))
+        # The read-only memory-mapped vector block, in the saved dtype.
+        actual_vectors = actual_df['title_vector'].array.vectors
+        np.testing.assert_array_equal(actual_vectors, vectors)
+        self.assertEqual(actual_vectors.dtype, np.float16)
+        self.assertFalse(actual_vectors.flags.writeable)
@@ -0,0 +1,30 @@
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+root_folder = Path(__file__).resolve().parent.parent
+
+
+class TestStartup(unittest.TestCase):
+
+    def get_loaded_packages(self, statement: str, cwd: str = None) -> set:
+        # Top-level packages imported by running statement in a fresh interpreter.
+        code = 'import sys; sys.path.insert(0, {!r}); {}; print(" ".join(sorted(sys.modules)))'.format(
+            str(root_folder), statement)
+        output = subprocess.run([sys.executable, '-c', code], cwd=cwd, check=True, capture_output=True, text=True)
+        return {m.split('.')[0] for m in output.stdout.split()}
+
+    def test_import_main_is_light(self):
+        loaded = self.get_loaded_packages('import main')
+        self.assertFalse(loaded & {'spacy', 'sklearn', 'pandas', 'numpy', 'joblib'})
+
+    def test_show_reads_only_metadata(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mdl_folder = Path(tmp_dir) / 'data' / 'model'
+            mdl_folder.mkdir(parents=True)
+            (mdl_folder / 'metadata.json').write_text(json.dumps({'Best cv macro-F1': 0.5}))
+            loaded = self.get_loaded_packages('import main; main.summarize_best_model("model")', cwd=tmp_dir)
+        self.assertFalse(loaded & {'spacy', 'sklearn', 'pandas', 'numpy', 'joblib'})
@@ -0,0 +1,116 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import spacy
+from pandas import DataFrame
+
+from src.loader import Loader, col_names
+from src.processor import Processor
+from src.scoring import Scorer
+from src.streaming import StreamingTrainer, get_streaming_search_space
+
+cat_columns = ['lang', 'verifiedby']
+num_columns = ['number_regions_published', 'published_date_day_diff']
+
+
+def make_raw_df(n_rows: int = 600) -> DataFrame:
+    # Small synthetic .csv contents, with the class given away by the fact-checker (titles have no lemmas with the blank
+    # spaCy pipeline used in tests).
+    rng = np.random.default_rng(0)
+    words = ['vaccine', 'virus', 'mask', 'lockdown', 'death', 'test', 'water', 'garlic', 'china']
+    y = rng.choice(['false', 'true'], n_rows, p=[0.7, 0.3])
+    df = DataFrame({c: None for c in col_names}, index=range(n_rows))
+    df['class'] = y
+    df['title'] = [' '.join(rng.choice(words, 5)) for _ in y]
+    df['lang'] = rng.choice(['en', 'es', 'fr'], n_rows, p=[0.6, 0.39, 0.01])
+    df['verifiedby'] = np.where(y == 'true', 'politifact', 'afp')
+    df['published_date'] = rng.choice(['2020-01-05', '2020-02-01', '2020-03-15'], n_rows)
+    df['country1'] = rng.choice(['us', None], n_rows)
+    df['country2'] = rng.choice(['uk', None], n_rows)
+    return df
+
+
+class TestStreaming(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        # A blank spaCy pipeline stands in for en_core_web_md.
+        cls.model_name = str(Path(cls.tmp_dir.name) / 'model')
+        spacy.blank('en').to_disk(cls.model_name)
+        cls.filepath = Path(cls.tmp_dir.name) / 'dataset.csv'
+        make_raw_df().to_csv(cls.filepath, index=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def get_trainer(self) -> StreamingTrainer:
+        return StreamingTrainer(self.filepath, cat_columns, num_columns, chunksize=100, n_features=2 ** 10,
+                                model_name=self.model_name)
+
+    def test_state_matches_in_memory_processing(self):
+        trainer = self.get_trainer()
+        state = trainer.collect_state()
+
+        loader = Loader(self.filepath)
+        loader.load_data_in_chunks()
+        processor = Processor(loader.df)
+        processor.preprocess_categorical_column(cat_columns)
+        processor.create_day_diff_variable(['published_date'])
+
+        self.assertEqual(state, processor.get_state())
+        self.assertEqual(trainer.n_rows, len(loader.df))
+
+    def test_state_without_dates(self):
+        raw_df = make_raw_df()
+        raw_df['published_date'] = None
+        filepath = Path(self.tmp_dir.name) / 'no_dates.csv'
+        raw_df.to_csv(filepath, index=False)
+        trainer = StreamingTrainer(filepath, cat_columns, num_columns, chunksize=100, n_features=2 ** 10,
+                                   model_name=self.model_name)
+        state = trainer.collect_state()
+
+        self.assertEqual(state['date_baselines'], {'published_date': 'NaT'})
+        scaler = trainer.col_trans.named_transformers_['num']
+        self.assertEqual(scaler.data_max_.tolist()[num_columns.index('published_date_day_diff')], 0)
+
+    def test_holdout_split_is_stable(self):
+        trainer = self.get_trainer()
+        first = np.concatenate([split for _, split in trainer.iter_chunks()])
+        second = np.concatenate([split for _, split in trainer.iter_chunks()])
+
+        self.assertEqual(first.tolist(), second.tolist())
+        self.assertTrue(0.1 < (first == 'holdout').mean() < 0.3)
+        self.assertTrue(0.1 < (first == 'validation').mean() < 0.3)
+
+    def test_train_and_score(self):
+        trainer = self.get_trainer()
+        clfs, params_list = get_streaming_search_space()
+        candidates = trainer.train(clfs, params_list)
+        best = max(candidates, key=lambda c: c['score'])
+
+        self.assertEqual(len(candidates), 15)
+        self.assertGreater(best['score'], 0.9)
+        self.assertGreater(trainer.evaluate_on_holdout([best['clf']])[0], 0.9)
+
+        # The saved pipeline takes records processed as in the in-memory workflow.
+        contents = {'Model details': trainer.get_pipeline(best['clf']),
+                    'Predictor names': {'cat_columns': cat_columns, 'num_columns': num_columns,
+                                        'use_tfidf_on_title': True},
+                    'Processor state': trainer.state}
+        scorer = Scorer(contents, model_name=self.model_name)
+        self.assertEqual(scorer.predict_records([{'title': 'garlic water', 'verifiedby': 'PolitiFact', 'lang': 'en',
+                                                  'published_date': '2020-02-01'}]), ['true'])
+
+    def test_train_on_a_single_chunk(self):
+        # All training rows in one chunk: candidates are still scored (on the validation rows).
+        trainer = StreamingTrainer(self.filepath, cat_columns, num_columns, chunksize=10000, n_features=2 ** 10,
+                                   model_name=self.model_name)
+        clfs, params_list = get_streaming_search_space()
+        candidates = trainer.train(clfs, params_list)
+
+        self.assertTrue(all(c['score'] > 0 for c in candidates))
+        self.assertGreater(max(c['score'] for c in candidates), 0.9)
@@ -0,0 +1,48 @@
+import pickle
+import unittest
+
+import numpy as np
+from pandas import DataFrame, Series, concat
+
+from src.vectors import VectorArray, VectorDtype, VectorFeatures
+
+
+class TestVectors(unittest.TestCase):
+
+    def setUp(self):
+        self.vectors = np.arange(12, dtype=np.float16).reshape(4, 3)
+        self.df = DataFrame({'a': [1, 2, 3, 4], 'title_vector': VectorArray(self.vectors)}, index=[5, 6, 7, 8],
+                            copy=False)
+
+    def test_column_is_backed_by_the_block(self):
+        col = self.df['title_vector']
+        self.assertIsInstance(col.dtype, VectorDtype)
+        self.assertTrue(np.shares_memory(col.array.vectors, self.vectors))
+        self.assertTrue(np.shares_memory(self.df.drop(columns=['a'])['title_vector'].array.vectors, self.vectors))
+        self.assertEqual(col[6].tolist(), [3, 4, 5])
+
+    def test_row_selection(self):
+        # Selected rows are blocks of rows, e.g. for the train/validation splits.
+        np.testing.assert_array_equal(self.df.iloc[[3, 1]]['title_vector'].array.vectors, self.vectors[[3, 1]])
+        np.testing.assert_array_equal(self.df[self.df['a'] > 2]['title_vector'].array.vectors, self.vectors[2:])
+        np.testing.assert_array_equal(self.df.iloc[1:3]['title_vector'].array.vectors, self.vectors[1:3])
+        np.testing.assert_array_equal(concat([self.df, self.df])['title_vector'].array.vectors,
+                                      np.concatenate([self.vectors, self.vectors]))
+
+        filled = self.df['title_vector'].array.take([2, -1], allow_fill=True)
+        self.assertEqual(filled.vectors.tolist(), [[6, 7, 8], [0, 0, 0]])
+        with self.assertRaises(ValueError):
+            self.df['title_vector'].array.take([-2], allow_fill=True)
+
+    def test_pickle(self):
+        df = pickle.loads(pickle.dumps(self.df))
+        np.testing.assert_array_equal(df['title_vector'].array.vectors, self.vectors)
+
+    def test_features(self):
+        # float16 vectors are upcast, float32 vectors are used as they are.
+        features = VectorFeatures().fit_transform(self.df['title_vector'])
+        self.assertEqual(features.dtype, np.float32)
+        np.testing.assert_array_equal(features, self.vectors)
+
+        vectors = self.vectors.astype(np.float32)
+        self.assertTrue(np.shares_memory(VectorFeatures().transform(Series(VectorArray(vectors), copy=False)), vectors))